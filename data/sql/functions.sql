@@ -64,6 +64,21 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql IMMUTABLE;
 
+-- Rounds like python's Decimal.quantize does (half to the nearest even
+-- number), while ROUND() rounds half away from zero.
+-- See stoqlib.lib.defaults.quantize
+CREATE OR REPLACE FUNCTION stoq_quantize(value numeric, places integer DEFAULT 2)
+    RETURNS numeric AS $$
+    SELECT CASE
+        WHEN abs(value * power(10::numeric, places) -
+                 trunc(value * power(10::numeric, places))) = 0.5 THEN
+            round(round(value * power(10::numeric, places) / 2) * 2 /
+                  power(10::numeric, places), places)
+        ELSE
+            round(value, places)
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
 CREATE OR REPLACE FUNCTION validate_stock_item() RETURNS trigger AS $$
 DECLARE
     count_ int;
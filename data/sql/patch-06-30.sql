@@ -0,0 +1,22 @@
+-- Notify the stations when a parameter changes, so they can invalidate
+-- their cached value. The payload is the parameter name.
+
+CREATE OR REPLACE FUNCTION notify_parameter_data() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('parameter_data', OLD.field_name);
+        RETURN OLD;
+    END IF;
+
+    PERFORM pg_notify('parameter_data', NEW.field_name);
+    IF TG_OP = 'UPDATE' AND NEW.field_name <> OLD.field_name THEN
+        PERFORM pg_notify('parameter_data', OLD.field_name);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER notify_parameter_data_trigger
+    AFTER INSERT OR UPDATE OR DELETE ON parameter_data
+    FOR EACH ROW
+    EXECUTE PROCEDURE notify_parameter_data();
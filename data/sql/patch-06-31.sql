@@ -0,0 +1,31 @@
+-- Trigram indexes to accelerate the searches done by the query executer.
+-- Text searches compare stoq_normalize_string(column) with LIKE '%word%',
+-- which can only use an index created on that exact expression.
+-- GIN is used instead of GiST since it is a lot faster to query, and
+-- those columns are searched a lot more than they are modified.
+
+CREATE EXTENSION IF NOT EXISTS "pg_trgm";
+
+-- Replaced by the GIN index below
+DROP INDEX IF EXISTS sellable_description_normalized_idx;
+
+CREATE INDEX sellable_description_normalized_trgm_idx ON sellable
+    USING gin (stoq_normalize_string(description) gin_trgm_ops);
+CREATE INDEX sellable_code_normalized_trgm_idx ON sellable
+    USING gin (stoq_normalize_string(code) gin_trgm_ops);
+CREATE INDEX sellable_barcode_normalized_trgm_idx ON sellable
+    USING gin (stoq_normalize_string(barcode) gin_trgm_ops);
+
+CREATE INDEX product_brand_normalized_trgm_idx ON product
+    USING gin (stoq_normalize_string(brand) gin_trgm_ops);
+CREATE INDEX product_model_normalized_trgm_idx ON product
+    USING gin (stoq_normalize_string(model) gin_trgm_ops);
+
+CREATE INDEX person_name_normalized_trgm_idx ON person
+    USING gin (stoq_normalize_string(name) gin_trgm_ops);
+CREATE INDEX company_fancy_name_normalized_trgm_idx ON company
+    USING gin (stoq_normalize_string(fancy_name) gin_trgm_ops);
+
+-- The identifiers are searched as text (see identifier_str on the views)
+CREATE INDEX sale_identifier_normalized_trgm_idx ON sale
+    USING gin (stoq_normalize_string(identifier::text) gin_trgm_ops);
@@ -0,0 +1,12 @@
+-- Indexes for the columns most used by date filters. The query executer
+-- compares the column itself with a timestamp interval (see DayInterval),
+-- so these can be used instead of scanning the whole table.
+
+CREATE INDEX sale_open_date_idx ON sale (open_date);
+CREATE INDEX sale_confirm_date_idx ON sale (confirm_date);
+
+CREATE INDEX payment_open_date_idx ON payment (open_date);
+CREATE INDEX payment_due_date_idx ON payment (due_date);
+CREATE INDEX payment_paid_date_idx ON payment (paid_date);
+
+CREATE INDEX account_transaction_date_idx ON account_transaction (date);
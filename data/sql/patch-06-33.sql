@@ -0,0 +1,9 @@
+-- Indexes used to find sellables by barcode, code or batch number
+-- (see SellableCodeIndex). Those are compared case insensitively.
+
+CREATE INDEX sellable_barcode_lower_idx ON sellable (lower(barcode));
+CREATE INDEX sellable_code_lower_idx ON sellable (lower(code));
+CREATE INDEX storable_batch_batch_number_lower_idx ON storable_batch (lower(batch_number));
+
+-- Used to find the objects modified since a given time
+CREATE INDEX transaction_entry_te_time_idx ON transaction_entry (te_time);
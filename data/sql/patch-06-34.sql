@@ -0,0 +1,70 @@
+-- Keep the totals of product_stock_item for each storable and branch on
+-- product_stock_summary, so the stock views don't need to aggregate them.
+-- product_stock_item can only be modified by the upsert_stock_item trigger
+-- (see validate_stock_item), so this is maintained by a trigger on it.
+
+CREATE TABLE product_stock_summary (
+    id uuid PRIMARY KEY DEFAULT uuid_generate_v1(),
+    -- No ON UPDATE CASCADE here, since the trigger below will move the
+    -- totals when the stock items are updated
+    storable_id uuid NOT NULL REFERENCES storable(id) ON DELETE CASCADE,
+    branch_id uuid NOT NULL REFERENCES branch(id) ON DELETE CASCADE,
+    quantity numeric NOT NULL DEFAULT 0,
+    total_cost numeric NOT NULL DEFAULT 0,
+    UNIQUE (storable_id, branch_id)
+);
+
+CREATE OR REPLACE FUNCTION update_product_stock_summary() RETURNS trigger AS $$
+DECLARE
+    moved boolean;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.storable_id IS NOT NULL THEN
+        UPDATE product_stock_summary SET
+                quantity = quantity - COALESCE(OLD.quantity, 0),
+                total_cost = total_cost - COALESCE(OLD.quantity * OLD.stock_cost, 0)
+            WHERE storable_id = OLD.storable_id AND branch_id = OLD.branch_id;
+
+        -- Do not leave a summary behind when its last stock item is removed,
+        -- or it would prevent the storable/branch from being removed
+        IF TG_OP = 'DELETE' THEN
+            moved := TRUE;
+        ELSE
+            moved := (NEW.storable_id IS DISTINCT FROM OLD.storable_id OR
+                      NEW.branch_id IS DISTINCT FROM OLD.branch_id);
+        END IF;
+        IF moved THEN
+            DELETE FROM product_stock_summary
+                WHERE storable_id = OLD.storable_id AND branch_id = OLD.branch_id AND
+                      NOT EXISTS (SELECT 1 FROM product_stock_item
+                                      WHERE storable_id = OLD.storable_id AND
+                                            branch_id = OLD.branch_id);
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.storable_id IS NOT NULL THEN
+        INSERT INTO product_stock_summary
+                (storable_id, branch_id, quantity, total_cost)
+            VALUES
+                (NEW.storable_id, NEW.branch_id, COALESCE(NEW.quantity, 0),
+                 COALESCE(NEW.quantity * NEW.stock_cost, 0))
+            ON CONFLICT (storable_id, branch_id) DO UPDATE SET
+                quantity = product_stock_summary.quantity + EXCLUDED.quantity,
+                total_cost = product_stock_summary.total_cost + EXCLUDED.total_cost;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_product_stock_summary_trigger
+    AFTER INSERT OR UPDATE OF quantity, stock_cost, storable_id, branch_id OR DELETE
+    ON product_stock_item
+    FOR EACH ROW
+    EXECUTE PROCEDURE update_product_stock_summary();
+
+INSERT INTO product_stock_summary (storable_id, branch_id, quantity, total_cost)
+    SELECT storable_id, branch_id,
+           COALESCE(SUM(quantity), 0), COALESCE(SUM(quantity * stock_cost), 0)
+        FROM product_stock_item
+        WHERE storable_id IS NOT NULL
+        GROUP BY storable_id, branch_id;
@@ -0,0 +1,26 @@
+-- Keep the hashes of the images' contents, so the stations can cache them
+-- and only fetch the contents from the database when they change.
+-- The hashes are maintained by a trigger, so they are always up to date,
+-- no matter who modified the image.
+
+ALTER TABLE image
+    ADD COLUMN image_md5sum text,
+    ADD COLUMN thumbnail_md5sum text;
+
+-- Filling the new columns should not mark all the images as modified
+ALTER TABLE image DISABLE RULE update_te;
+UPDATE image SET image_md5sum = md5(image), thumbnail_md5sum = md5(thumbnail);
+ALTER TABLE image ENABLE RULE update_te;
+
+CREATE OR REPLACE FUNCTION update_image_md5sum() RETURNS trigger AS $$
+BEGIN
+    NEW.image_md5sum := md5(NEW.image);
+    NEW.thumbnail_md5sum := md5(NEW.thumbnail);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_image_md5sum_trigger
+    BEFORE INSERT OR UPDATE OF image, thumbnail ON image
+    FOR EACH ROW
+    EXECUTE PROCEDURE update_image_md5sum();
@@ -0,0 +1,73 @@
+-- Support for the change feed (see stoqlib/database/changefeed.py), which
+-- lists the objects modified since a given position, ordered by their
+-- transaction entries' (te_time, id).
+
+-- Replaces transaction_entry_te_time_idx, for the keyset pagination
+CREATE INDEX transaction_entry_te_time_id_idx ON transaction_entry (te_time, id);
+DROP INDEX transaction_entry_te_time_idx;
+
+-- When the entry was created, to tell apart created and updated objects.
+-- The default is set separately so the existing rows are not rewritten
+-- (they will be considered updated).
+ALTER TABLE transaction_entry ADD COLUMN te_created timestamp;
+ALTER TABLE transaction_entry ALTER COLUMN te_created SET DEFAULT statement_timestamp();
+
+-- The transaction entries are removed together with their objects, so the
+-- removed objects are registered here
+CREATE TABLE deleted_object (
+    id bigserial PRIMARY KEY,
+    table_name text NOT NULL,
+    object_id text NOT NULL,
+    te_id bigint NOT NULL,
+    te_time timestamp NOT NULL DEFAULT statement_timestamp()
+);
+CREATE INDEX deleted_object_te_time_te_id_idx ON deleted_object (te_time, te_id);
+
+CREATE OR REPLACE FUNCTION register_deleted_object() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO deleted_object (table_name, object_id, te_id)
+        VALUES (TG_TABLE_NAME, OLD.id::text, OLD.te_id);
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Installs register_deleted_object on every synchronized table (the ones with
+-- an id and a te_id) that does not have it yet. This is also called after
+-- the schema and the plugins are updated, for the tables created by them.
+CREATE OR REPLACE FUNCTION ensure_deleted_object_triggers() RETURNS void AS $$
+DECLARE
+    t record;
+BEGIN
+    FOR t IN
+        SELECT c.table_name FROM information_schema.columns c
+            JOIN information_schema.tables USING (table_schema, table_name)
+            WHERE c.table_schema = current_schema() AND
+                  c.column_name = 'te_id' AND
+                  table_type = 'BASE TABLE' AND
+                  EXISTS (SELECT 1 FROM information_schema.columns i
+                          WHERE i.table_schema = c.table_schema AND
+                                i.table_name = c.table_name AND
+                                i.column_name = 'id') AND
+                  NOT EXISTS (SELECT 1 FROM pg_trigger t
+                              JOIN pg_class r ON r.oid = t.tgrelid
+                              JOIN pg_namespace n ON n.oid = r.relnamespace
+                              WHERE n.nspname = c.table_schema AND
+                                    r.relname = c.table_name AND
+                                    t.tgname = 'register_deleted_object_trigger')
+    LOOP
+        EXECUTE format('CREATE TRIGGER register_deleted_object_trigger '
+                       'AFTER DELETE ON %I FOR EACH ROW '
+                       'EXECUTE PROCEDURE register_deleted_object()', t.table_name);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_deleted_object_triggers();
+
+-- The positions of the consumers of the change feed
+CREATE TABLE change_feed_cursor (
+    name text PRIMARY KEY,
+    te_time timestamp NOT NULL,
+    te_id bigint NOT NULL,
+    last_update timestamp NOT NULL DEFAULT statement_timestamp()
+);
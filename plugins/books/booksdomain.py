@@ -142,6 +142,3 @@ class ProductBookFullStockView(ProductFullStockView):
     ])
 
     clause = ProductFullStockView.clause
-
-    group_by = ProductFullStockView.group_by[:]
-    group_by.extend([Person.id, Book.id])
@@ -398,6 +398,7 @@ class StoqCommandHandler:
         """Update the database schema"""
         from stoqlib.database.migration import StoqlibSchemaMigration
         from stoqlib.lib.environment import is_developer_mode
+        from stoqlib.lib.ibpt import build_taxes_indexes
         from stoqlib.net.server import ServerProxy
 
         self._read_config(options, check_schema=False, load_plugins=False,
@@ -425,6 +426,9 @@ class StoqCommandHandler:
             if running:
                 server.call('restart')
 
+        # The IBPT tables may have been updated together with the schema
+        build_taxes_indexes()
+
         return 0 if retval else 1
 
     def cmd_dump(self, options, output):
@@ -457,6 +461,142 @@ class StoqCommandHandler:
             sale.reset_taxes()
         print("Taxes reset for sale items from sale '%s'" % sale_id)
 
+    def cmd_check_stock_summary(self, options):
+        """Check the stock summaries against the stock items"""
+        from stoqlib.database.runtime import new_store
+        from stoqlib.domain.product import ProductStockSummary
+
+        self._read_config(options, register_station=False, load_plugins=False)
+        with new_store() as store:
+            rows = ProductStockSummary.check_consistency(store)
+            for (storable_id, branch_id, quantity, expected_quantity,
+                 total_cost, expected_total_cost) in rows:
+                print("storable %s on branch %s: quantity %s (expected %s), "
+                      "total cost %s (expected %s)" % (
+                          storable_id, branch_id, quantity, expected_quantity,
+                          total_cost, expected_total_cost))
+
+            if not rows:
+                print("The stock summaries are consistent")
+                return 0
+            if not options.fix:
+                return 1
+
+            ProductStockSummary.rebuild(store)
+            store.retval = not options.dry
+            print("The stock summaries were rebuilt")
+            return 0
+
+    def opt_check_stock_summary(self, parser, group):
+        group.add_option('', '--fix',
+                         action='store_true',
+                         default=False,
+                         help='rebuild the summaries if they are inconsistent',
+                         dest='fix')
+
+    def _get_viewable(self, name):
+        import importlib
+        import pkgutil
+        import stoqlib.domain
+        from stoqlib.database.viewable import Viewable
+
+        if '.' in name:
+            module_name, name = name.rsplit('.', 1)
+            modules = [module_name]
+        else:
+            modules = [module_name for finder, module_name, ispkg in
+                       pkgutil.walk_packages(stoqlib.domain.__path__,
+                                             'stoqlib.domain.')
+                       if '.test' not in module_name]
+
+        for module_name in modules:
+            viewable = getattr(importlib.import_module(module_name), name, None)
+            if isinstance(viewable, type) and issubclass(viewable, Viewable):
+                return viewable
+        raise SystemExit("%s: %s is not a viewable" % (self.prog_name, name))
+
+    def cmd_export(self, options, viewable_name, filename):
+        """Export the rows of a viewable to a csv or xlsx file"""
+        from storm.expr import Expr
+        from stoqlib.database.runtime import new_store
+        from stoqlib.exporters.streamexporter import get_stream_exporter
+
+        self._read_config(options, register_station=False, load_plugins=False)
+        viewable = self._get_viewable(viewable_name)
+        try:
+            exporter = get_stream_exporter(filename, name=viewable.__name__)
+        except ValueError as e:
+            raise SystemExit("%s: %s" % (self.prog_name, e))
+
+        # The related domain objects are not exported, only the values
+        attributes = [attr for attr, spec in zip(viewable.cls_attributes,
+                                                 viewable.cls_spec)
+                      if isinstance(spec, Expr)]
+        if options.columns:
+            attributes = options.columns.split(',')
+
+        with new_store() as store:
+            results = store.find(viewable)
+            if 'id' in viewable.cls_attributes:
+                results = results.order_by(viewable.id)
+            exporter.add_from_resultset(results, attributes)
+            exporter.save_as(filename)
+            store.retval = False
+
+        print("%d rows exported to %s" % (exporter.n_rows, filename))
+        return 0
+
+    def opt_export(self, parser, group):
+        group.add_option('', '--columns',
+                         action='store',
+                         help='comma separated list of the attributes to export',
+                         dest='columns')
+
+    def cmd_changes(self, options):
+        """List the objects changed on the database"""
+        from stoqlib.database.changefeed import ChangeFeed
+        from stoqlib.database.runtime import new_store
+
+        self._read_config(options, register_station=False, load_plugins=False)
+        tables = options.tables.split(',') if options.tables else None
+        with new_store() as store:
+            feed = ChangeFeed(store, tables=tables)
+            try:
+                feed.get_tables()
+            except ValueError as e:
+                raise SystemExit("%s: %s" % (self.prog_name, e))
+
+            if options.cursor:
+                batches = feed.pull(options.cursor, limit=options.batch_size)
+            else:
+                batches = (changes for changes, end in
+                           feed.iter_batches(limit=options.batch_size))
+            for changes in batches:
+                for change in changes:
+                    print('\t'.join([str(change.te_time), change.table,
+                                     change.operation, change.id]))
+                # Save the cursor after each batch is printed
+                if options.cursor and not options.dry:
+                    store.commit()
+            store.retval = bool(options.cursor) and not options.dry
+        return 0
+
+    def opt_changes(self, parser, group):
+        group.add_option('', '--cursor',
+                         action='store',
+                         help=('only list the changes after the ones listed the last '
+                               'time this cursor was used, and save its position'),
+                         dest='cursor')
+        group.add_option('', '--tables',
+                         action='store',
+                         help='comma separated list of the tables to list the changes from',
+                         dest='tables')
+        group.add_option('', '--batch-size',
+                         action='store',
+                         type='int',
+                         help='how many changes to read at once',
+                         dest='batch_size')
+
     def cmd_restore(self, options, schema):
         """Restore a database dump"""
         self._read_config(options, register_station=False,
@@ -523,6 +663,61 @@ class StoqCommandHandler:
         from stoq.lib.sintegragenerator import generate
         generate(filename, start, end)
 
+    def cmd_generate_bills(self, options, filename, month):
+        """Generate the bills of the pending payments due on a month"""
+        import datetime
+        from stoqlib.database.expr import DayInterval
+        from stoqlib.database.runtime import new_store
+        from stoqlib.domain.payment.method import PaymentMethod
+        from stoqlib.domain.payment.payment import Payment
+        from stoqlib.exceptions import ReportError
+        from stoqlib.reporting.boleto import BillReport
+
+        self._read_config(options, register_station=False, load_plugins=False)
+
+        year, month = map(int, month.split('-'))
+        start = datetime.date(year, month, 1)
+        end = (start + datetime.timedelta(days=31)).replace(day=1) - datetime.timedelta(days=1)
+
+        with new_store() as store:
+            method = PaymentMethod.get_by_name(store, u'bill')
+            payments = list(store.find(
+                Payment,
+                Payment.method_id == method.id,
+                Payment.payment_type == Payment.TYPE_IN,
+                Payment.status == Payment.STATUS_PENDING,
+                DayInterval(Payment.due_date, start, end)).order_by(
+                    Payment.due_date, Payment.identifier))
+            if not payments:
+                raise SystemExit("%s: There are no bills due on %s" % (
+                    self.prog_name, start.strftime('%Y-%m')))
+            msg = BillReport.validate_payment_for_printing(payments[0])
+            if msg:
+                raise SystemExit("%s: %s" % (self.prog_name, msg))
+
+            report = BillReport(filename, payments)
+            if options.workers:
+                report.workers = options.workers
+            try:
+                if report.use_chunks():
+                    for saved, total in report.save_chunks():
+                        print("%d of %d bills saved" % (saved, total))
+                else:
+                    report.save()
+            except ReportError as e:
+                raise SystemExit("%s: %s" % (self.prog_name, e))
+            store.retval = False
+
+        print("%d bills saved to %s" % (len(payments), filename))
+        return 0
+
+    def opt_generate_bills(self, parser, group):
+        group.add_option('', '--workers',
+                         action="store",
+                         type="int",
+                         help="Number of processes used to render the bills",
+                         dest="workers")
+
     def cmd_shell(self, options):
         """Drop to a shell for executing SQL queries"""
         self._read_config(options, register_station=False,
@@ -540,6 +735,11 @@ class StoqCommandHandler:
         self._read_config(options, register_station=False)
         from stoqlib.importers import importer
         importer = importer.get_by_type(options.type)
+        if options.items_per_commit:
+            importer.set_items_per_commit(options.items_per_commit)
+        importer.set_resume(options.resume)
+        if options.workers:
+            importer.set_workers(options.workers)
         importer.feed_file(options.import_filename)
         importer.process()
 
@@ -552,6 +752,23 @@ class StoqCommandHandler:
                          action="store",
                          help="Filename to import",
                          dest="import_filename")
+        group.add_option('', '--items-per-commit',
+                         action="store",
+                         type="int",
+                         help="Number of items to import between commits, "
+                              "-1 to commit only at the end",
+                         dest="items_per_commit")
+        group.add_option('', '--resume',
+                         action="store_true",
+                         default=False,
+                         help="Continue an import that was interrupted, "
+                              "skipping the items already committed",
+                         dest="resume")
+        group.add_option('', '--workers',
+                         action="store",
+                         type="int",
+                         help="Number of processes used to import the items",
+                         dest="workers")
 
     def cmd_console(self, options):
         """Drop to a Stoq python console"""
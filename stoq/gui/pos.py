@@ -34,7 +34,6 @@ from kiwi.datatypes import converter, ValidationError
 from stoqlib.lib.objutils import Settable
 from kiwi.ui.objectlist import Column
 from kiwi.ui.widgets.contextmenu import ContextMenu, ContextMenuItem
-from storm.expr import And, Lower
 
 from stoqdrivers.enum import UnitType
 from stoq.api import api as stoq_api
@@ -43,9 +42,8 @@ from stoq.lib.gui.base.dialogs import (get_current_toplevel, add_current_topleve
                                        _pop_current_toplevel)
 from stoqlib.domain.payment.group import PaymentGroup
 from stoqlib.domain.person import Transporter, Client
-from stoqlib.domain.product import StorableBatch
 from stoqlib.domain.sale import Delivery, Sale, SaleToken
-from stoqlib.domain.sellable import Sellable
+from stoqlib.domain.sellable import Sellable, SellableCodeIndex
 from stoqlib.exceptions import StoqlibError, TaxError
 from stoq.lib.gui.events import POSConfirmSaleEvent, CloseLoanWizardFinishEvent, POSAddSellableEvent
 from stoqlib.lib.barcode import parse_barcode, BarcodeInfo
@@ -333,6 +331,13 @@ class PosApp(ShellApp):
         self.price.set_visible(self._confirm_quantity)
         self.price.set_editable(sysparam.get_bool('POS_ALLOW_CHANGE_PRICE'))
 
+        # Preload the barcodes/codes, so scanning items is faster
+        code_index = SellableCodeIndex.get_instance()
+        if code_index.is_loaded():
+            code_index.refresh(self.store)
+        else:
+            code_index.load(self.store)
+
         self.check_open_inventory()
         self._update_parameter_widgets()
         self._update_widgets()
@@ -624,31 +629,9 @@ class PosApp(ShellApp):
             text = barinfo.code
             weight = barinfo.weight
 
-        batch = None
-        query = Sellable.status == Sellable.STATUS_AVAILABLE
-
-        # FIXME: Put this logic for getting the sellable based on
-        # barcode/code/batch_number on domain. Note that something very
-        # simular is done on abstractwizard.py
-
-        sellable = self.store.find(
-            Sellable, And(query, Lower(Sellable.barcode) == text.lower())).one()
-
-        # If the barcode didnt match, maybe the user typed the product code
-        if not sellable:
-            sellable = self.store.find(
-                Sellable, And(query, Lower(Sellable.code) == text.lower())).one()
-
-        # If none of the above found, try to get the batch number
-        if not sellable:
-            query = Lower(StorableBatch.batch_number) == text.lower()
-            batch = self.store.find(StorableBatch, query).one()
-            if batch:
-                sellable = batch.storable.product.sellable
-                if not sellable.is_available:
-                    # If the sellable is not available, reset both
-                    sellable = None
-                    batch = None
+        sellable, batch = SellableCodeIndex.get_instance().lookup(
+            self.store, text,
+            accept=lambda s: s.status == Sellable.STATUS_AVAILABLE)
 
         # The user can't add the parent product of a grid directly to the sale.
         # TODO: Display a dialog to let the user choose an specific grid product.
@@ -62,6 +62,7 @@ from stoqlib.lib.dateutils import localtoday
 from stoqlib.lib.message import warning
 from stoqlib.lib.parameters import sysparam
 from stoqlib.lib.translation import stoqlib_gettext as _
+from stoqlib.reporting.boleto import BillReport
 from stoqlib.reporting.payment import ReceivablePaymentReport
 from stoqlib.reporting.paymentsreceipt import InPaymentReceipt
 
@@ -132,6 +133,8 @@ class ReceivableApp(BaseAccountWindow):
             ('PrintReceipt', None, _('Print _receipt...'),
              group.get('payment_print_receipt'),
              _('Print a receipt for the selected payment')),
+            ('PrintBills', None, _('Print bills...'), None,
+             _('Print the bills of the selected payments')),
 
             # Search
             ('PaymentCategories', None, _("Payment categories..."),
@@ -147,7 +150,8 @@ class ReceivableApp(BaseAccountWindow):
         self.receivable_ui = self.add_ui_actions(actions)
         self.set_help_section(_("Accounts receivable help"), 'app-receivable')
 
-        self.window.add_print_items([self.PrintDocument, self.PrintReceipt])
+        self.window.add_print_items([self.PrintDocument, self.PrintReceipt,
+                                     self.PrintBills])
         self.window.add_export_items([self.ExportBills])
         self.window.add_new_items([self.AddReceiving])
         self.window.add_search_items([self.BillCheckSearch,
@@ -283,6 +287,7 @@ class ReceivableApp(BaseAccountWindow):
                            self._can_set_not_paid(selected))
         self.set_sensitive([self.Edit], self._can_edit(selected))
         self.set_sensitive([self.PrintDocument], self._can_print(selected))
+        self.set_sensitive([self.PrintBills], self._can_print_bills(selected))
 
     def _get_status_values(self):
         values = [(v, k) for k, v in Payment.statuses.items()]
@@ -448,6 +453,11 @@ class ReceivableApp(BaseAccountWindow):
             return view.operation.can_print(view.payment)
         return False
 
+    def _can_print_bills(self, receivable_views):
+        return any(view.method_name == u'bill' and
+                   view.status == Payment.STATUS_PENDING
+                   for view in receivable_views)
+
     def _run_card_payment_search(self):
         run_dialog(CardPaymentSearch, self, self.store)
 
@@ -559,6 +569,19 @@ class ReceivableApp(BaseAccountWindow):
         if report is not None:
             print_report(report, payments)
 
+    def on_PrintBills__activate(self, action):
+        # The bills of a lot of payments (e.g. the ones due on a month)
+        # are rendered in parallel, see BillReport.save_chunks
+        payments = [v.payment for v in self.results.get_selected_rows()
+                    if v.method_name == u'bill' and
+                    v.status == Payment.STATUS_PENDING]
+        if not payments:
+            warning(_('No pending bill payments were selected'))
+            return
+        if not BillReport.check_printable(payments):
+            return
+        print_report(BillReport, payments)
+
     def on_ExportBills__activate(self, action):
         payments = [v.payment for v in self.results.get_selected_rows()
                     if v.method.method_name == 'bill']
@@ -573,11 +596,12 @@ class ReceivableApp(BaseAccountWindow):
         bank_number = payments[0].method.destination_account.bank.bank_number
         info = get_bank_info_by_number(bank_number)
         try:
-            cnab = info.get_cnab(payments)
+            with open(filename, 'w') as fh:
+                info.write_cnab(payments, fh)
         except Exception as e:
             log.error(''.join(traceback.format_exception(*sys.exc_info())))
+            # Don't leave a partially written CNAB behind
+            if os.path.exists(filename):
+                os.unlink(filename)
             warning(_('An error ocurred while generating the CNAB'), str(e))
             return
-
-        with open(filename, 'w') as fh:
-            fh.write(cnab)
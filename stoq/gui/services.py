@@ -174,6 +174,9 @@ class WorkOrderResultKanbanView(KanbanView):
     def enable_lazy_search(self):
         pass
 
+    def load_pending_results(self):
+        pass
+
     def search_completed(self, results):
         # We are only interested in the workorders whose status are in one of our
         # columns
@@ -152,31 +152,66 @@ class ShellDatabaseConnection(object):
                       'error=%s uri=%s' % (str(e), store_uri))
 
     def _post_connect(self):
-        self._check_schema_migration()
-        self._check_branch()
-        self._activate_plugins()
+        from stoqlib.database.runtime import get_default_store
+        from stoqlib.lib.parameters import sysparam
+        from stoq.lib.startup import StartupInfo, get_startup_profiler
 
-    def _check_schema_migration(self):
+        # setup() was told not to check anything, so do the same as it
+        # would do here, prefetching what is needed at once
+        profiler = get_startup_profiler()
+        profiler.start()
+        try:
+            with profiler.phase('fetch startup info'):
+                startup_info = StartupInfo.fetch(get_default_store())
+                sysparam.fill_cache(startup_info.parameters)
+            with profiler.phase('check schema'):
+                startup_info = self._check_schema_migration(startup_info)
+            with profiler.phase('register station'):
+                self._check_branch(startup_info)
+            with profiler.phase('activate plugins'):
+                self._activate_plugins(startup_info)
+        finally:
+            profiler.stop()
+            profiler.log_phases()
+        self._listen_parameter_changes()
+
+    def _check_schema_migration(self, startup_info):
+        from stoqlib.database.runtime import get_default_store
         from stoqlib.lib.message import error
+        from stoqlib.lib.parameters import sysparam
         from stoqlib.database.migration import needs_schema_update
         from stoqlib.exceptions import DatabaseInconsistency
-        if needs_schema_update():
+        from stoq.lib.startup import StartupInfo
+        if needs_schema_update(current_version=startup_info.schema_version,
+                               plugin_versions=startup_info.plugin_versions):
             self._run_update_wizard()
+            # The update changed the versions, and maybe the parameters too
+            startup_info = StartupInfo.fetch(get_default_store())
+            sysparam.fill_cache(startup_info.parameters)
 
         from stoqlib.database.migration import StoqlibSchemaMigration
         migration = StoqlibSchemaMigration()
         try:
-            migration.check()
+            migration.check(current_version=startup_info.schema_version,
+                            plugin_versions=startup_info.plugin_versions)
         except DatabaseInconsistency as e:
             error(_('The database version differs from your installed '
                     'version.'), str(e))
+        return startup_info
 
-    def _activate_plugins(self):
+    def _activate_plugins(self, startup_info):
         from stoqlib.lib.pluginmanager import get_plugin_manager
         manager = get_plugin_manager()
-        manager.activate_installed_plugins()
+        manager.activate_installed_plugins(
+            installed_plugins=startup_info.installed_plugins_names)
+
+    def _listen_parameter_changes(self):
+        # Stations run for a long time, so keep their parameters up to
+        # date with the changes made on other stations
+        from stoqlib.lib.parameters import sysparam
+        sysparam.start_listening()
 
-    def _check_branch(self):
+    def _check_branch(self, startup_info):
         from stoqlib.database.runtime import (get_default_store, new_store,
                                               get_current_station,
                                               set_current_branch_station)
@@ -208,7 +243,8 @@ class ShellDatabaseConnection(object):
             store.commit()
             store.close()
 
-        set_current_branch_station(default_store, station_name=None)
+        set_current_branch_station(default_store, station_name=None,
+                                   station=startup_info.station)
 
     def _run_update_wizard(self):
         from stoq.lib.gui.base.dialogs import run_dialog
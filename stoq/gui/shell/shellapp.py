@@ -216,14 +216,18 @@ class ShellApp(GladeDelegate):
         if self.search_spec is None:  # pragma no cover
             raise NotImplementedError
 
+        # Instead of loading all the results on the objectlist, let the
+        # exporter fetch them from the database while writing the rows
+        kwargs = {}
         model = self.results.get_model()
         if isinstance(model, LazyObjectModel):
-            model.load_items_from_results(0, model._count)
+            kwargs['data'] = model.get_result()
 
         sse = SpreadSheetExporter()
         sse.export(object_list=self.results,
                    name=self.app_name,
-                   filename_prefix=self.app_name)
+                   filename_prefix=self.app_name,
+                   **kwargs)
 
     def create_filters(self):
         """Implement this to provide filters for the search container"""
@@ -243,6 +243,29 @@ class TestReceivable(BaseGUITest):
 
         print_report.assert_called_once_with(BillReport, [payment])
 
+    @mock.patch('stoq.gui.receivable.print_report')
+    def test_print_bills(self, print_report):
+        sale, payment = self.create_receivable_sale()
+        sale.client = self.create_client()
+
+        app = self.create_app(ReceivableApp, u'receivable')
+        olist = app.results
+        # The check payment is not printed
+        views = [olist[1], olist[3]]
+        self.assertTrue(app._can_print_bills(views))
+        self.assertFalse(app._can_print_bills(views[:1]))
+
+        method = PaymentMethod.get_by_name(self.store, u'bill')
+        account = self.store.find(Account, description=u'Banco do Brasil').one()
+        method.destination_account = account
+
+        olist.select(olist[3])
+        with mock.patch.object(olist, 'get_selected_rows') as get_selected_rows:
+            get_selected_rows.return_value = views
+            self.activate(app.PrintBills)
+
+        print_report.assert_called_once_with(BillReport, [payment])
+
     def test_can_receive(self):
         sale, payment1 = self.create_receivable_sale()
         payment2 = self.add_payments(sale, method_type=u'bill')[0]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+__tests__ = 'stoq/gui/shell/shell.py'
+
+from unittest import mock
+
+from stoqlib.domain.test.domaintest import DomainTest
+from stoqlib.lib.parameters import sysparam
+
+from stoq.gui.shell.shell import ShellDatabaseConnection
+from stoq.lib.startup import StartupInfo
+
+
+class TestShellDatabaseConnection(DomainTest):
+
+    @mock.patch('stoqlib.lib.pluginmanager.get_plugin_manager')
+    @mock.patch('stoqlib.database.runtime.set_current_branch_station')
+    @mock.patch('stoqlib.database.runtime.get_default_store')
+    def test_post_connect(self, get_default_store, set_current_branch_station,
+                          get_plugin_manager):
+        get_default_store.return_value = self.store
+        station = StartupInfo.fetch(self.store).station
+
+        connection = ShellDatabaseConnection(options=mock.Mock())
+        with mock.patch.object(StartupInfo, 'fetch',
+                               wraps=StartupInfo.fetch) as fetch, \
+                mock.patch.object(sysparam, 'start_listening') as start_listening:
+            connection._post_connect()
+
+        # The database is up to date, so it is fetched only once
+        fetch.assert_called_once_with(self.store)
+        set_current_branch_station.assert_called_once_with(
+            self.store, station_name=None, station=station)
+        manager = get_plugin_manager.return_value
+        manager.activate_installed_plugins.assert_called_once_with(
+            installed_plugins=StartupInfo.fetch(self.store).installed_plugins_names)
+        start_listening.assert_called_once_with()
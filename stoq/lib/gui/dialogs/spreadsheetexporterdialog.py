@@ -23,17 +23,23 @@
 ##
 """Spreedsheet Exporter Dialog"""
 
+import os
 
 from gi.repository import Gtk, Gio
 
 from stoqlib.api import api
 
-from stoqlib.exporters.xlsexporter import XLSExporter
+from stoqlib.exporters.xlsxexporter import XLSXExporter
 from stoqlib.lib.message import yesno
 from stoqlib.lib.translation import stoqlib_gettext
 
 _ = stoqlib_gettext
 
+_MIME_TYPES = {
+    '.xls': 'application/vnd.ms-excel',
+    '.xlsx': XLSXExporter.mime_type,
+}
+
 
 class SpreadSheetExporter:
     """A dialog to export data to a spreadsheet
@@ -42,14 +48,17 @@ class SpreadSheetExporter:
 
     def export(self, object_list, name, filename_prefix, data=None,
                filter_description=None):
-        xls = XLSExporter(name)
-        xls.add_from_object_list(object_list, data,
-                                 filter_description=filter_description)
-        temporary = xls.save(filename_prefix)
+        # The rows are written as they are fetched, so exporting a lot
+        # of results will not use a lot of memory
+        xlsx = XLSXExporter(name)
+        xlsx.add_from_object_list(object_list, data,
+                                  filter_description=filter_description)
+        temporary = xlsx.save(filename_prefix)
         self.export_temporary(temporary)
 
     def export_temporary(self, temporary):
-        mime_type = 'application/vnd.ms-excel'
+        extension = os.path.splitext(temporary.name)[1]
+        mime_type = _MIME_TYPES[extension]
         app_info = Gio.app_info_get_default_for_type(mime_type, False)
         if app_info:
             action = api.user_settings.get('spreadsheet-action')
@@ -65,7 +74,7 @@ class SpreadSheetExporter:
             temporary.close()
             self._open_application(mime_type, temporary.name)
         elif action == 'save':
-            self._save(temporary)
+            self._save(temporary, extension)
 
     def _ask(self, app_info):
         # FIXME: What if the user presses esc? Esc will return False
@@ -84,7 +93,7 @@ class SpreadSheetExporter:
         gfile = Gio.File.new_for_path(filename)
         app_info.launch([gfile])
 
-    def _save(self, temp):
+    def _save(self, temp, ext):
         chooser = Gtk.FileChooserDialog(
             _("Export Spreadsheet..."), None,
             Gtk.FileChooserAction.SAVE,
@@ -94,7 +103,7 @@ class SpreadSheetExporter:
 
         xls_filter = Gtk.FileFilter()
         xls_filter.set_name(_('Excel Files'))
-        xls_filter.add_pattern('*.xls')
+        xls_filter.add_pattern('*' + ext)
         chooser.add_filter(xls_filter)
 
         response = chooser.run()
@@ -105,7 +114,6 @@ class SpreadSheetExporter:
             return
 
         filename = chooser.get_filename()
-        ext = '.xls'
 
         chooser.destroy()
 
@@ -23,6 +23,7 @@
 ##
 """ Dialog to open the inventory """
 
+from gi.repository import Gtk
 from kiwi.ui.objectlist import Column
 from storm.expr import And
 
@@ -31,6 +32,7 @@ from stoqlib.api import api
 from stoqlib.domain.inventory import Inventory
 from stoqlib.domain.product import Product, ProductManufacturer
 from stoqlib.domain.sellable import Sellable, SellableCategory
+from stoq.lib.gui.dialogs.progressdialog import ProgressDialog
 from stoq.lib.gui.editors.baseeditor import BaseEditor
 from stoqlib.lib.dateutils import localnow
 from stoqlib.lib.message import info
@@ -197,8 +199,23 @@ class InventoryOpenEditor(BaseEditor):
         branch = self.store.fetch(self.model.branch)
         responsible = self.store.fetch(self.model.user)
         query = self._get_sellables_query()
-        return Inventory.create_inventory(self.store, branch, api.get_current_station(self.store),
-                                          responsible, query)
+        dialog = ProgressDialog(_('Opening the inventory'), pulse=False)
+        dialog.start(wait=0)
+        dialog.cancel.hide()
+
+        def update_progress(current, total):
+            dialog.progressbar.set_text('%s/%s' % (current, total))
+            dialog.progressbar.set_fraction(current / float(total))
+            while Gtk.events_pending():
+                Gtk.main_iteration_do(False)
+
+        try:
+            return Inventory.create_inventory(self.store, branch,
+                                              api.get_current_station(self.store),
+                                              responsible, query,
+                                              progress_callback=update_progress)
+        finally:
+            dialog.stop()
 
     #
     # Kiwi Callback
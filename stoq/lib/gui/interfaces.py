@@ -97,6 +97,13 @@ class ISearchResultView(Interface):
         :returns: now many items there are in the view
         """
 
+    def load_pending_results():
+        """
+        Adds the results of the last search that were not added yet,
+        e.g. because they are being streamed. This should be called before
+        using all the items in the view (e.g. printing them)
+        """
+
     def get_selected_item():
         """
         Fetches the currently selected item
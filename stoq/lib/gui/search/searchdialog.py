@@ -511,6 +511,7 @@ class SearchDialog(BasicDialog):
         else:
             # The results are already unlimited, let the exporter get the data
             # from the objectlist
+            self.results.load_pending_results()
             data = None
 
         sse = SpreadSheetExporter()
@@ -520,6 +521,9 @@ class SearchDialog(BasicDialog):
                    filename_prefix=self._csv_prefix)
 
     def _on_print_button__clicked(self, button):
+        # The report should have all the results, not only the ones
+        # that were already displayed
+        self.results.load_pending_results()
         self.print_report()
 
     #
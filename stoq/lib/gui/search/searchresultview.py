@@ -22,6 +22,8 @@
 ## Author(s): Stoq Team <stoq-devel@async.com.br>
 ##
 
+import itertools
+
 from gi.repository import GObject
 from kiwi.ui.objectlist import ObjectList, ObjectTree
 from kiwi.utils import gsignal
@@ -55,15 +57,42 @@ class SearchResultListView(ObjectList):
     """
     __gtype_name__ = 'SearchResultListView'
 
+    #: How many rows are added at a time when the results are streamed
+    #: (e.g. by fast_iter()). The first ones are added right away and the
+    #: next ones when the user scrolls close to the end of the list
+    STREAM_PAGE_SIZE = 100
+
     gsignal("item-activated", object)
     gsignal("item-popup-menu", object, object, object)
 
     def __init__(self):
         self._lazy_updater = None
+        self._pending_results = None
         ObjectList.__init__(self)
         self.connect('double-click', self._on__double_click)
         self.connect('row-activated', self._on__row_activated)
         self.connect('right-click', self._on__right_click)
+        vadj = self.get_scrolled_window().get_vadjustment()
+        vadj.connect('value-changed', self._on_vadjustment__value_changed)
+
+    #
+    # ObjectList
+    #
+
+    def clear(self):
+        self._pending_results = None
+        ObjectList.clear(self)
+
+    #
+    # Private
+    #
+
+    def _add_pending_results(self):
+        page = list(itertools.islice(self._pending_results,
+                                     self.STREAM_PAGE_SIZE))
+        if len(page) < self.STREAM_PAGE_SIZE:
+            self._pending_results = None
+        self.extend(page)
 
     #
     # ISearchResultView
@@ -81,13 +110,26 @@ class SearchResultListView(ObjectList):
     def get_n_items(self):
         return len(self.get_model())
 
+    def load_pending_results(self):
+        if self._pending_results is None:
+            return
+        results, self._pending_results = self._pending_results, None
+        self.extend(results)
+
     def search_completed(self, results):
+        summary_label = self._search.get_summary_label()
         if self._lazy_updater:
             self._lazy_updater.add_results(results)
         else:
-            self.extend(results)
+            # Keep the order if the last results were not cleared
+            self.load_pending_results()
+            # The summary needs all the results to calculate the total
+            if iter(results) is results and summary_label is None:
+                self._pending_results = results
+                self._add_pending_results()
+            else:
+                self.extend(results)
 
-        summary_label = self._search.get_summary_label()
         if summary_label is None:
             return
         if self._lazy_updater and len(self):
@@ -121,6 +163,15 @@ class SearchResultListView(ObjectList):
     def _on__right_click(self, object_list, results, event):
         self.emit('item-popup-menu', object_list, results, event)
 
+    def _on_vadjustment__value_changed(self, adjustment):
+        if self._pending_results is None:
+            return
+        # Add the next page before the user reaches the end of the list
+        remaining = (adjustment.get_upper() - adjustment.get_value() -
+                     adjustment.get_page_size())
+        if remaining <= adjustment.get_page_size():
+            self._add_pending_results()
+
 GObject.type_register(SearchResultListView)
 
 
@@ -167,6 +218,9 @@ class SearchResultTreeView(ObjectTree):
     def get_n_items(self):
         return len(self.get_model())
 
+    def load_pending_results(self):
+        pass
+
     def search_completed(self, results):
         for result in results:
             self.add_result(result)
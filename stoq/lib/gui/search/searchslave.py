@@ -76,6 +76,11 @@ class SearchSlave(SlaveDelegate):
     """
     result_view_class = SearchResultListView
 
+    #: When using fast_iter, the results are streamed from the database
+    #: in batches of this size, so the first ones can be displayed without
+    #: waiting for the others
+    fetch_size = 200
+
     gsignal("search-completed", object, object)
     gsignal("result-item-activated", object)
     gsignal("result-item-popup-menu", object, object, object)
@@ -230,7 +235,7 @@ class SearchSlave(SlaveDelegate):
         if clear:
             self.result_view.clear()
         if self._fast_iter:
-            results = results.fast_iter()
+            results = results.fast_iter(fetch_size=self.fetch_size)
         self.result_view.search_completed(results)
 
         if self.result_view.get_n_items() == 0:
@@ -31,6 +31,7 @@ import threading
 from gi.repository import Gtk, Gio, Pango
 
 from stoq.lib.gui.base.dialogs import get_current_toplevel
+from stoq.lib.gui.dialogs.progressdialog import ProgressDialog
 from stoq.lib.gui.events import PrintReportEvent
 from stoqlib.lib.message import warning
 from stoqlib.lib.osutils import get_application_dir
@@ -39,7 +40,8 @@ from stoqlib.lib.template import render_template_string
 from stoqlib.lib.threadutils import (schedule_in_main_thread,
                                      terminate_thread)
 from stoqlib.lib.translation import stoqlib_gettext
-from stoqlib.reporting.report import HTMLReport
+from stoqlib.reporting.boleto import BillReport
+from stoqlib.reporting.report import HTMLReport, TableReport
 from stoqlib.reporting.labelreport import LabelReport
 
 
@@ -205,7 +207,9 @@ class PrintOperationPoppler(PrintOperation):
     def __init__(self, report):
         PrintOperation.__init__(self, report)
 
-        self._report.save()
+        # The report may have been saved already, see print_report
+        if not os.path.exists(self._report.filename):
+            self._report.save()
         uri = Gio.File.new_for_path(self._report.filename).get_uri()
         from gi.repository import Poppler
         self._document = Poppler.Document.new_from_file(uri, password="")
@@ -368,6 +372,20 @@ def describe_search_filters_for_reports(filters, **kwargs):
     return kwargs
 
 
+def _save_report_in_chunks(report):
+    dialog = ProgressDialog(_('Generating the report'), pulse=False)
+    dialog.start(wait=0)
+    dialog.cancel.hide()
+    try:
+        for rows, total_rows in report.save_chunks():
+            dialog.progressbar.set_text('%s/%s' % (rows, total_rows))
+            dialog.progressbar.set_fraction(rows / float(total_rows))
+            while Gtk.events_pending():
+                Gtk.main_iteration_do(False)
+    finally:
+        dialog.stop()
+
+
 def print_report(report_class, *args, **kwargs):
     rv = PrintReportEvent.emit(report_class, *args, **kwargs)
     if rv:
@@ -387,7 +405,13 @@ def print_report(report_class, *args, **kwargs):
         os.startfile(report.filename)
         return
 
-    if isinstance(report, HTMLReport):
+    if isinstance(report, (TableReport, BillReport)) and report.use_chunks():
+        # Rendering a huge report at once would use a lot of memory (or
+        # time, for the bills, which are rendered in parallel), so it is
+        # saved in chunks and printed from the pdf
+        _save_report_in_chunks(report)
+        op = PrintOperationPoppler(report)
+    elif isinstance(report, HTMLReport):
         op = PrintOperationWEasyPrint(report)
         op.set_threaded()
     else:
@@ -290,6 +290,13 @@ class LazyObjectModel(GenericTreeModel, Gtk.TreeSortable):
     def get_post_data(self):
         return self._post_result
 
+    def get_result(self):
+        """Get the result set used to load the items
+
+        :returns: the result set, in the order the items are displayed
+        """
+        return self._result
+
 
 class LazyObjectListUpdater(object):
     """This is a helper that updates the list automatically when you
@@ -24,8 +24,11 @@
 Kiwi integration for Stoq/Storm
 """
 
+import collections
+import logging
 import re
 import threading
+import time
 import queue
 
 from gi.repository import GLib, GObject
@@ -39,11 +42,13 @@ from storm.tracer import trace
 import psycopg2
 import psycopg2.extensions
 
-from stoqlib.database.expr import Date, StoqNormalizeString
+from stoqlib.database.expr import DayInterval, StoqNormalizeString
 from stoqlib.database.interfaces import ISearchFilter
 from stoqlib.database.settings import db_settings
 from stoqlib.database.viewable import Viewable
 
+log = logging.getLogger(__name__)
+
 
 class QueryState(object):
     def __init__(self, search_filter):
@@ -163,34 +168,111 @@ class MultiQueryState(QueryState):
         return '<MultiQueryState values=%r>' % (self.values, )
 
 
-class _OperationExecuter(threading.Thread):
+AsyncQueryStats = collections.namedtuple(
+    'AsyncQueryStats',
+    'connections, queue_depth, executing, average_wait, average_duration')
+
+
+class _OperationWorker(threading.Thread):
+    """Executes the operations scheduled on a :class:`_OperationExecuter`,
+    one at a time, using its own connection
+    """
+
+    def __init__(self, executer):
+        super(_OperationWorker, self).__init__()
+        self.daemon = True
+        self._executer = executer
+        self._conn = None
+
+    def run(self):
+        while True:
+            operation = self._executer._queue.get()
+            # Superseded operations are dropped without being executed
+            if operation.status == AsyncQueryOperation.STATUS_CANCELLED:
+                self._executer._queue.task_done()
+                continue
+
+            self._executer._operation_started(operation)
+            try:
+                if self._conn is None or self._conn.closed:
+                    self._conn = psycopg2.connect(db_settings.get_store_dsn())
+                operation.execute(self._conn)
+            except psycopg2.Error:
+                log.exception('Failed to execute %r', operation)
+                if self._conn is not None and not self._conn.closed:
+                    self._conn.rollback()
+            finally:
+                self._executer._operation_done(operation)
+                self._executer._queue.task_done()
+
+
+class _OperationExecuter(object):
+    """A pool of connections executing :class:`AsyncQueryOperation`
+
+    Each connection is used by a thread that executes the operations in
+    the order they were scheduled, so a slow query will only block one of
+    them while the others keep executing the rest of the queue.
+    """
 
     _SINGLETON = None
 
-    def __init__(self):
-        super(_OperationExecuter, self).__init__()
+    #: The number of connections used to execute the operations
+    pool_size = 3
+
+    #: The number of finished operations used to calculate the latency
+    stats_size = 100
 
-        self._conn = psycopg2.connect(db_settings.get_store_dsn())
+    def __init__(self):
         self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._executing = 0
+        self._latencies = collections.deque(maxlen=self.stats_size)
+        self._workers = [_OperationWorker(self) for i in range(self.pool_size)]
+        for worker in self._workers:
+            worker.start()
 
     @classmethod
     def get_instance(cls):
         if cls._SINGLETON is None:
             cls._SINGLETON = cls()
-            cls._SINGLETON.daemon = True
-            cls._SINGLETON.start()
         return cls._SINGLETON
 
-    def run(self):
-        while True:
-            operation = self._queue.get()
-            operation.execute(self._conn)
-            self._queue.task_done()
-
     def schedule(self, operation):
         assert isinstance(operation, AsyncQueryOperation)
+        operation.scheduled_time = time.monotonic()
         self._queue.put(operation)
 
+    def get_stats(self):
+        """Get some statistics about the operations, for diagnostics
+
+        :returns: an :class:`AsyncQueryStats` with the number of
+          connections, the number of operations waiting on the queue and
+          being executed right now and the average time (in seconds) the last
+          operations waited on the queue and took to execute
+        """
+        with self._lock:
+            latencies = list(self._latencies)
+            executing = self._executing
+        n_latencies = len(latencies) or 1
+        return AsyncQueryStats(
+            connections=len(self._workers),
+            queue_depth=self._queue.qsize(),
+            executing=executing,
+            average_wait=sum(wait for wait, duration in latencies) / n_latencies,
+            average_duration=sum(duration for wait, duration in latencies) / n_latencies)
+
+    def _operation_started(self, operation):
+        with self._lock:
+            self._executing += 1
+
+    def _operation_done(self, operation):
+        with self._lock:
+            self._executing -= 1
+            if operation.status == AsyncQueryOperation.STATUS_FINISHED:
+                self._latencies.append(
+                    (operation.start_time - operation.scheduled_time,
+                     operation.finish_time - operation.start_time))
+
 
 class QueryExecuter(object):
     """
@@ -212,6 +294,7 @@ class QueryExecuter(object):
         self._query = self._default_query
         self.post_result = None
         self._operation_executer = _OperationExecuter.get_instance()
+        self._last_operation = None
 
     # Public API
 
@@ -245,8 +328,10 @@ class QueryExecuter(object):
     def search_async(self, states=None, resultset=None, limit=None):
         """
         Execute a search asynchronously.
-        This uses a separate psycopg2 connection which is lazily
-        created just before executing the first async query.
+        This uses a pool of separate psycopg2 connections which are lazily
+        created just before executing the first async queries.
+        If the last search of this executer is still waiting or executing,
+        it will be cancelled.
         This method returns an operation for which a signal **finish** is
         emitted when the query has finished executing. In that callback,
         :meth:`.AsyncQueryOperation.finish` should be called, eg:
@@ -273,6 +358,7 @@ class QueryExecuter(object):
 
         :param states:
         :param resultset: a resultset or ``None``
+        :param limit: use this limit instead of the one defined by set_limit()
         :returns: a query operation
         """
 
@@ -282,10 +368,23 @@ class QueryExecuter(object):
         limit = limit or self._limit
         if limit > 0:
             resultset.config(limit=limit)
+        # The user is not interested in the last search anymore, for
+        # instance, if it was typing ahead
+        if self._last_operation is not None:
+            self._last_operation.cancel()
         operation = AsyncQueryOperation(self.store, resultset, resultset._get_select())
         self._operation_executer.schedule(operation)
+        self._last_operation = operation
         return operation
 
+    @classmethod
+    def get_async_stats(cls):
+        """Get statistics about the asynchronous searches, for diagnostics
+
+        :returns: a :class:`AsyncQueryStats`
+        """
+        return _OperationExecuter.get_instance().get_stats()
+
     def set_limit(self, limit):
         """
         Set the maximum number of result items to return in a search query.
@@ -506,16 +605,24 @@ class QueryExecuter(object):
         if not state.text.strip():
             return
 
+        # The comparisons are done on StoqNormalizeString(table_field), the
+        # same expression the trigram indexes are created on (see
+        # patch-06-31.sql). Both sides are already in lower case, so there's
+        # no need to use ILIKE, which is more expensive.
         def _like(value):
             return Like(StoqNormalizeString(table_field),
-                        StoqNormalizeString(u'%%%s%%' % value.lower()),
-                        case_sensitive=False)
+                        StoqNormalizeString(u'%%%s%%' % value.lower()))
 
         if state.mode == StringQueryState.CONTAINS_ALL:
             queries = [_like(word) for word in re.split('[ \n\r]', state.text) if word]
             retval = And(*queries)
         elif state.mode == StringQueryState.IDENTICAL_TO:
-            retval = Lower(table_field) == state.text.lower()
+            # The LIKE is only there to allow the use of the indexes,
+            # since it is less strict than the comparison
+            text = re.sub(r'([\\%_])', r'\\\1', state.text.lower())
+            retval = And(Like(StoqNormalizeString(table_field),
+                              StoqNormalizeString(text)),
+                         Lower(table_field) == state.text.lower())
         elif state.mode == StringQueryState.CONTAINS_EXACTLY:
             retval = (_like(state.text.lower()))
         elif state.mode == StringQueryState.NOT_CONTAINS:
@@ -528,16 +635,12 @@ class QueryExecuter(object):
 
     def _parse_date_state(self, state, table_field):
         if state.date:
-            return Date(table_field) == Date(state.date)
+            return DayInterval(table_field, state.date, state.date)
 
     def _parse_date_interval_state(self, state, table_field):
-        queries = []
-        if state.start:
-            queries.append(Date(table_field) >= Date(state.start))
-        if state.end:
-            queries.append(Date(table_field) <= Date(state.end))
-        if queries:
-            return And(*queries)
+        if state.start or state.end:
+            return DayInterval(table_field, state.start or None,
+                               state.end or None)
 
     def _parse_bool_state(self, state, table_field):
         return table_field == state.value
@@ -599,8 +702,15 @@ class AsyncQueryOperation(GObject.GObject):
         self.status = self.STATUS_WAITING
         self.resultset = resultset
         self.expr = expr
+        #: When the operation was scheduled, started and finished executing
+        self.scheduled_time = None
+        self.start_time = None
+        self.finish_time = None
 
         self._conn = store._connection
+        # Protects the status and the connection executing the query, so
+        # we only cancel the query on the database if it is still running
+        self._lock = threading.Lock()
         self._async_cursor = None
         self._async_conn = None
         self._statement = None
@@ -613,17 +723,18 @@ class AsyncQueryOperation(GObject.GObject):
     def execute(self, async_conn):
         """Executes a query within an asyncronous psycopg2 connection
         """
-        if self.status == self.STATUS_CANCELLED:
-            return
-
-        self.status = self.STATUS_EXECUTING
-
         # Async variant of Connection.execute() in storm/database.py
         state = State()
         statement = compile(self.expr, state)
         stmt = convert_param_marks(statement, "?", "%s")
-        self._async_cursor = async_conn.cursor()
-        self._async_conn = async_conn
+
+        with self._lock:
+            if self.status == self.STATUS_CANCELLED:
+                return
+            self.status = self.STATUS_EXECUTING
+            self.start_time = time.monotonic()
+            self._async_cursor = async_conn.cursor()
+            self._async_conn = async_conn
 
         # This is postgres specific, see storm/databases/postgres.py
         self._statement = stmt
@@ -631,14 +742,26 @@ class AsyncQueryOperation(GObject.GObject):
 
         trace("connection_raw_execute", self._conn,
               self._async_cursor, self._statement, self._parameters)
-        self._async_cursor.execute(self._statement,
-                                   self._parameters)
+        try:
+            self._async_cursor.execute(self._statement,
+                                       self._parameters)
+        except psycopg2.extensions.QueryCanceledError:
+            # Cancelled by cancel() while executing. The transaction is
+            # aborted now, so roll it back to be able to use the connection
+            if self.status != self.STATUS_CANCELLED:
+                raise
+            async_conn.rollback()
+            return
+        finally:
+            with self._lock:
+                self._async_conn = None
 
         # This can happen if another thread cancelled this while the cursor was
         # executing. In that case, it is not interested in the retval anymore
         if self.status == self.STATUS_CANCELLED:
             return
 
+        self.finish_time = time.monotonic()
         self.status = self.STATUS_FINISHED
         GLib.idle_add(self._on_finish)
 
@@ -660,8 +783,19 @@ class AsyncQueryOperation(GObject.GObject):
         return AsyncResultSet(self.resultset, result)
 
     def cancel(self):
-        """Cancel the operation scheduling"""
-        self.status = self.STATUS_CANCELLED
+        """Cancel the operation
+
+        If it is still waiting to be executed, it will just be dropped.
+        If it is already executing, the query will be cancelled on the
+        database (the same as ``pg_cancel_backend()`` does), releasing
+        the connection to execute the next operations.
+        """
+        with self._lock:
+            # Even if it finished already, the finish signal should not be
+            # emitted anymore
+            self.status = self.STATUS_CANCELLED
+            if self._async_conn is not None:
+                self._async_conn.cancel()
 
     #
     #  Private
@@ -25,26 +25,187 @@
 ##
 """ Database startup routines"""
 
+import contextlib
 import logging
 import os
 import sys
+import time
+
+from storm.expr import LeftJoin
+from storm.tracer import install_tracer, remove_tracer
 
 from stoqlib.lib.component import provide_utility
 from stoqlib.database.migration import StoqlibSchemaMigration
 from stoqlib.database.debug import enable as enable_debugging
 from stoqlib.database.runtime import (get_default_store,
                                       set_current_branch_station)
+from stoqlib.database.settings import parse_database_version
 from stoqlib.exceptions import DatabaseError
 from stoqlib.lib.configparser import register_config, StoqConfig
 from stoqlib.lib.interfaces import IApplicationDescriptions
 from stoqlib.lib.message import error
 from stoqlib.lib.osutils import read_registry_key
 from stoqlib.lib.translation import stoqlib_gettext as _
+from stoqlib.net.socketutils import get_hostname
 
 from stoq.lib.options import get_option_parser
 
 log = logging.getLogger(__name__)
 
+# Everything StartupInfo needs, except for the station, in a single query
+_STARTUP_INFO_QUERY = """
+SELECT current_setting('server_version_num'),
+       (SELECT ARRAY[generation, patchlevel] FROM system_table
+            ORDER BY updated DESC LIMIT 1),
+       (SELECT json_object_agg(plugin_name, plugin_version) FROM installed_plugin
+            WHERE plugin_version IS NOT NULL),
+       (SELECT json_object_agg(field_name, field_value) FROM parameter_data)
+"""
+
+
+class StartupProfiler(object):
+    """Measures how long each phase of the startup takes
+
+    Each phase is recorded with its wall time and the number of queries
+    executed during it. The queries are counted by a storm tracer, which
+    is only installed between :meth:`.start` and :meth:`.stop`.
+
+    Use :func:`get_startup_profiler` to get the profiler used by :func:`setup`.
+    """
+
+    def __init__(self):
+        #: a list of ``(name, seconds, queries)`` tuples, one for each phase
+        self.phases = []
+        self._queries = 0
+        self._running = False
+
+    #
+    #  Storm tracer
+    #
+
+    def connection_raw_execute(self, connection, raw_cursor, statement, params):
+        self._queries += 1
+
+    #
+    #  Public API
+    #
+
+    def start(self):
+        """Start counting the queries"""
+        if not self._running:
+            install_tracer(self)
+            self._running = True
+
+    def stop(self):
+        """Stop counting the queries"""
+        if self._running:
+            remove_tracer(self)
+            self._running = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Record a phase of the startup
+
+        Use this as a context manager around the code of the phase::
+
+            with profiler.phase('plugins'):
+                manager.activate_installed_plugins()
+
+        :param name: the name of the phase
+        """
+        start = time.monotonic()
+        queries = self._queries
+        try:
+            yield
+        finally:
+            self.phases.append(
+                (name, time.monotonic() - start, self._queries - queries))
+
+    def get_total(self):
+        """Get the totals of all the phases recorded
+
+        :returns: a ``(seconds, queries)`` tuple
+        """
+        return (sum(phase[1] for phase in self.phases),
+                sum(phase[2] for phase in self.phases))
+
+    def log_phases(self):
+        """Log the phases recorded so far"""
+        for name, seconds, queries in self.phases:
+            log.info("Startup phase %s took %.3fs (%d queries)",
+                     name, seconds, queries)
+        log.info("Startup took %.3fs (%d queries)", *self.get_total())
+
+
+_profiler = StartupProfiler()
+
+
+def get_startup_profiler():
+    """Get the profiler used to measure the startup
+
+    :returns: a :class:`StartupProfiler`
+    """
+    return _profiler
+
+
+class StartupInfo(object):
+    """Information needed to start stoq, fetched from the database at once
+
+    Each of these used to be fetched separately (some of them more than once)
+    during the startup, which adds up when the database is far away.
+    """
+
+    def __init__(self, server_version, schema_version, plugin_versions,
+                 parameters, station):
+        #: the database server version as a 3 item tuple
+        self.server_version = server_version
+        #: the ``(generation, patchlevel)`` of the database schema
+        self.schema_version = schema_version
+        #: a dict mapping the installed plugins' names to their patch level
+        self.plugin_versions = plugin_versions
+        #: a dict mapping the parameters' names to their raw values
+        self.parameters = parameters
+        #: the |branchstation| of this computer, or ``None`` if it was not
+        #: registered yet. Its branch is fetched together with it.
+        self.station = station
+
+    @property
+    def installed_plugins_names(self):
+        return list(self.plugin_versions.keys())
+
+    @classmethod
+    def fetch(cls, store, station_name=None):
+        """Fetch the information from the database
+
+        This uses two queries: one for the station (and its branch) and
+        another one for everything else.
+
+        :param store: a store
+        :param station_name: the name of the station, or ``None`` to use the
+          name of this computer
+        :returns: a :class:`StartupInfo`
+        """
+        from stoqlib.domain.person import Branch
+        from stoqlib.domain.station import BranchStation
+
+        version_num, schema_version, plugin_versions, parameters = (
+            store.execute(_STARTUP_INFO_QUERY).get_one())
+
+        if station_name is None:
+            station_name = get_hostname()
+        tables = [BranchStation,
+                  LeftJoin(Branch, Branch.id == BranchStation.branch_id)]
+        # Fetching the branch here will put it in the store's cache, so
+        # it will not be queried again when accessing station.branch
+        row = store.using(*tables).find(
+            (BranchStation, Branch), BranchStation.name == str(station_name)).one()
+
+        return cls(server_version=parse_database_version(version_num),
+                   schema_version=tuple(schema_version or ()),
+                   plugin_versions=plugin_versions or {},
+                   parameters=parameters or {},
+                   station=row and row[0])
+
 
 def setup_path():
     import platform
@@ -118,38 +279,68 @@ def setup(config=None, options=None, register_station=True, check_schema=True,
                     replace=True)
 
     db_settings = config.get_settings()
+    profiler = get_startup_profiler()
+    profiler.start()
     try:
-        default_store = get_default_store()
-    except DatabaseError as e:
-        # Only raise an error if a database is actually required
-        if register_station or load_plugins or check_schema:
-            error(e.short, str(e.msg))
-        else:
-            default_store = None
+        _setup_database(db_settings, register_station=register_station,
+                        check_schema=check_schema, load_plugins=load_plugins)
+    finally:
+        profiler.stop()
+        profiler.log_phases()
 
-    if register_station:
-        db_settings.check_version(default_store)
-        if check_schema:
-            migration = StoqlibSchemaMigration()
-            migration.check()
 
-        if options and options.sqldebug:
-            enable_debugging()
+def _setup_database(db_settings, register_station, check_schema,
+                    load_plugins):
+    from stoqlib.lib.parameters import sysparam
+    profiler = get_startup_profiler()
 
-        set_current_branch_station(default_store, station_name=None)
+    with profiler.phase('connect'):
+        try:
+            default_store = get_default_store()
+        except DatabaseError as e:
+            # Only raise an error if a database is actually required
+            if register_station or load_plugins or check_schema:
+                error(e.short, str(e.msg))
+            else:
+                default_store = None
 
-    if load_plugins:
-        from stoqlib.lib.pluginmanager import get_plugin_manager
-        manager = get_plugin_manager()
-        manager.activate_installed_plugins()
+    if default_store is None:
+        return
 
     if check_schema:
-        if not default_store.table_exists('system_table'):
-            error(
-                _("Database schema error"),
-                _("Table 'system_table' does not exist.\n"
-                  "Consult your database administrator to solve this problem."))
+        with profiler.phase('check system table'):
+            if not default_store.table_exists('system_table'):
+                error(
+                    _("Database schema error"),
+                    _("Table 'system_table' does not exist.\n"
+                      "Consult your database administrator to solve this problem."))
+
+    if not (register_station or check_schema or load_plugins):
+        return
+
+    with profiler.phase('fetch startup info'):
+        info = StartupInfo.fetch(default_store)
+        sysparam.fill_cache(info.parameters)
+
+    if register_station:
+        with profiler.phase('check version'):
+            db_settings.check_version(default_store,
+                                      server_version=info.server_version)
 
-        if check_schema:
+    if check_schema:
+        with profiler.phase('check schema'):
             migration = StoqlibSchemaMigration()
-            migration.check()
+            migration.check(current_version=info.schema_version,
+                            plugin_versions=info.plugin_versions)
+
+    if register_station:
+        with profiler.phase('register station'):
+            set_current_branch_station(default_store, station_name=None,
+                                       station=info.station)
+
+    if load_plugins:
+        from stoqlib.lib.pluginmanager import get_plugin_manager
+        with profiler.phase('activate plugins'):
+            manager = get_plugin_manager()
+            manager.activate_installed_plugins(
+                installed_plugins=info.installed_plugins_names)
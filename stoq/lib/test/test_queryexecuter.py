@@ -23,11 +23,15 @@
 ##
 """ This module tests stoq/database/database.py """
 
+import time
 from unittest import mock
 
+from storm.expr import SQL
+
 from stoqlib.domain.test.domaintest import DomainTest
 from stoqlib.domain.person import ClientCategory
-from stoq.lib.queryexecuter import QueryExecuter, StringQueryState
+from stoq.lib.queryexecuter import (AsyncQueryOperation, QueryExecuter,
+                                    StringQueryState)
 
 
 class QueryExecuterTest(DomainTest):
@@ -99,6 +103,23 @@ class QueryExecuterTest(DomainTest):
         self.assertEqual(self._search_string_not(u'eye').count(), 0)
         self.assertEqual(self._search_string_not(u'moon 120').count(), 1)
 
+    def test_string_query_identical(self):
+        self.create_client_category(u'EYE 50% OFF')
+        self.create_client_category(u'EYE 50X OFF')
+        self.create_client_category(u'Pão')
+
+        def search(text):
+            return self.qe.search([
+                StringQueryState(filter=self.sfilter,
+                                 mode=StringQueryState.IDENTICAL_TO,
+                                 text=text)])
+
+        self.assertEqual(search(u'eye 50% off').count(), 1)
+        self.assertEqual(search(u'eye 50_ off').count(), 0)
+        self.assertEqual(search(u'eye').count(), 0)
+        self.assertEqual(search(u'pão').count(), 1)
+        self.assertEqual(search(u'pao').count(), 0)
+
     def test_search_async(self):
         self.assertEqual(self.store.find(ClientCategory).count(), 0)
         try:
@@ -134,3 +155,46 @@ class QueryExecuterTest(DomainTest):
         finally:
             self.clean_domain([ClientCategory])
             self.store.commit()
+
+    def test_search_async_cancel_last(self):
+        executer = self.qe._operation_executer
+        with mock.patch.object(executer, 'schedule'):
+            op1 = self.qe.search_async()
+            op2 = self.qe.search_async()
+        # The first search was superseded by the second one
+        self.assertEqual(op1.status, AsyncQueryOperation.STATUS_CANCELLED)
+        self.assertEqual(op2.status, AsyncQueryOperation.STATUS_WAITING)
+
+        # Cancelled operations are dropped without being executed
+        executer.schedule(op1)
+        executer._queue.join()
+        self.assertIsNone(op1.start_time)
+
+    def test_cancel_executing(self):
+        executer = self.qe._operation_executer
+        op = AsyncQueryOperation(self.store, None, SQL('SELECT pg_sleep(30)'))
+        executer.schedule(op)
+        for i in range(100):
+            if op.status == AsyncQueryOperation.STATUS_EXECUTING:
+                break
+            time.sleep(0.05)
+
+        start = time.monotonic()
+        op.cancel()
+        executer._queue.join()
+        # The query was cancelled on the database
+        self.assertLess(time.monotonic() - start, 30)
+        self.assertEqual(op.status, AsyncQueryOperation.STATUS_CANCELLED)
+
+        # The connection is still usable after that
+        self.assertEqual(len(self._search_async([])), 0)
+
+    def test_get_async_stats(self):
+        self._search_async([])
+        stats = QueryExecuter.get_async_stats()
+        self.assertEqual(stats.connections,
+                         self.qe._operation_executer.pool_size)
+        self.assertEqual(stats.queue_depth, 0)
+        self.assertEqual(stats.executing, 0)
+        self.assertGreaterEqual(stats.average_wait, 0)
+        self.assertGreater(stats.average_duration, 0)
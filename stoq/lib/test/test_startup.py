@@ -0,0 +1,47 @@
+from storm.expr import Ne
+
+from stoqlib.database.runtime import get_current_station
+from stoqlib.domain.plugin import InstalledPlugin
+from stoqlib.domain.test.domaintest import DomainTest
+from stoqlib.domain.parameter import ParameterData
+
+from stoq.lib.startup import StartupInfo, StartupProfiler
+
+
+class TestStartupInfo(DomainTest):
+    def test_fetch(self):
+        station = get_current_station(self.store)
+        info = StartupInfo.fetch(self.store, station_name=station.name)
+        self.assertEqual(info.station, station)
+        self.assertEqual(len(info.server_version), 3)
+        self.assertEqual(len(info.schema_version), 2)
+
+        plugins = self.store.find(InstalledPlugin,
+                                  Ne(InstalledPlugin.plugin_version, None))
+        self.assertEqual(info.plugin_versions,
+                         dict((p.plugin_name, p.plugin_version) for p in plugins))
+        self.assertEqual(info.parameters,
+                         dict((p.field_name, p.field_value)
+                              for p in self.store.find(ParameterData)))
+
+    def test_fetch_unknown_station(self):
+        info = StartupInfo.fetch(self.store, station_name=u'unknown station')
+        self.assertIsNone(info.station)
+
+
+class TestStartupProfiler(DomainTest):
+    def test_phase(self):
+        profiler = StartupProfiler()
+        profiler.start()
+        try:
+            with profiler.phase('nothing'):
+                pass
+            with profiler.phase('queries'):
+                self.store.execute('SELECT 1')
+                self.store.execute('SELECT 2')
+        finally:
+            profiler.stop()
+
+        self.assertEqual([(name, queries) for name, seconds, queries in profiler.phases],
+                         [('nothing', 0), ('queries', 2)])
+        self.assertEqual(profiler.get_total()[1], 2)
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+"""A feed of the objects changed on the database
+
+Every synchronized table has a te_id column, referencing the
+transaction_entry that holds when the object was last modified. The
+:class:`ChangeFeed` lists the objects changed after a given
+:class:`FeedPosition`, in the order they were modified, so the consumers
+can pull only what changed instead of reading whole tables::
+
+    feed = ChangeFeed(store, tables=['sellable', 'image'])
+    for changes in feed.pull('ecommerce'):
+        for change in changes:
+            ...
+        store.commit()
+
+The positions are (te_time, te_id) pairs, which are paginated using
+the transaction_entry_te_time_id_idx index. The removed objects are
+registered on the deleted_object table by a trigger, which is installed on
+the synchronized tables when the schema or the plugins are updated (see
+the ensure_deleted_object_triggers database function). The tables without
+that trigger are not listed by the feed.
+"""
+
+import collections
+import datetime
+
+#: A position on the feed
+FeedPosition = collections.namedtuple('FeedPosition', ['te_time', 'te_id'])
+
+#: An object that was changed
+Change = collections.namedtuple('Change', ['table', 'id', 'operation',
+                                           'te_time', 'te_id'])
+
+#: The position before all the changes
+FEED_START = FeedPosition(datetime.datetime.min, 0)
+
+
+class ChangeFeed(object):
+    """The feed of changed objects
+
+    The te_time of an object is the time of the statement that modified
+    it, but it will only be visible after its transaction is committed.
+    To avoid skipping changes that are committed later, the feed only
+    goes up to the start of the oldest open transaction. Transactions open
+    for more than :attr:`.max_transaction_age` are not waited for.
+
+    :param store: a store
+    :param tables: the names of the tables to list the changes from,
+        or ``None`` for all the synchronized tables
+    """
+
+    OPERATION_INSERT = u'insert'
+    OPERATION_UPDATE = u'update'
+    OPERATION_DELETE = u'delete'
+
+    #: How many transaction entries are read by each batch
+    batch_size = 1000
+
+    #: Open transactions older than this will not hold the feed back
+    max_transaction_age = datetime.timedelta(minutes=10)
+
+    def __init__(self, store, tables=None):
+        self.store = store
+        self.tables = tables
+        self._tables = None
+
+    #
+    #  Private
+    #
+
+    def _get_horizon(self):
+        # Anything modified before the start of the oldest open transaction
+        # is already committed (or will never be)
+        return self.store.execute("""
+            SELECT GREATEST(
+                LEAST(MIN(xact_start), statement_timestamp())::timestamp,
+                statement_timestamp()::timestamp - ?::interval)
+              FROM pg_stat_activity
+             WHERE datname = current_database() AND
+                   pid <> pg_backend_pid() AND
+                   xact_start IS NOT NULL""",
+                                  (self.max_transaction_age, )).get_one()[0]
+
+    def _fetch_entries(self, position, horizon, limit):
+        return list(self.store.execute("""
+            SELECT id, te_time, te_created
+              FROM transaction_entry
+             WHERE (te_time, id) > (?, ?) AND te_time < ?
+             ORDER BY te_time, id
+             LIMIT ?""", (position.te_time, position.te_id, horizon, limit)))
+
+    def _fetch_deleted(self, position, horizon, limit):
+        query = """
+            SELECT table_name, object_id, te_time, te_id
+              FROM deleted_object
+             WHERE (te_time, te_id) > (?, ?) AND te_time < ?"""
+        params = [position.te_time, position.te_id, horizon]
+        if self.tables is not None:
+            query += " AND table_name = ANY(?)"
+            params.append(list(self.tables))
+        query += " ORDER BY te_time, te_id LIMIT ?"
+        params.append(limit)
+        return list(self.store.execute(query, params))
+
+    def _resolve_entries(self, te_ids):
+        # Each table has an unique index on te_id, so this is a
+        # lookup on each one of them
+        tables = self.get_tables()
+        if not te_ids or not tables:
+            return {}
+        query = ' UNION ALL '.join(
+            "SELECT '%s', id::text, te_id FROM \"%s\" WHERE te_id = ANY(?)" % (
+                table, table) for table in tables)
+        return dict((te_id, (table, object_id)) for table, object_id, te_id in
+                    self.store.execute(query, [te_ids] * len(tables)))
+
+    #
+    #  Public API
+    #
+
+    def get_tables(self):
+        """Get the names of the tables the changes are listed from
+
+        Only the tables with the trigger that registers their deleted
+        objects are listed, since their removals would be missed otherwise.
+
+        :returns: a list of table names
+        :raises: :exc:`ValueError` if one of the tables given to the
+            constructor is not synchronized
+        """
+        if self._tables is None:
+            tables = [row[0] for row in self.store.execute("""
+                SELECT c.relname::text
+                  FROM pg_trigger t
+                  JOIN pg_class c ON c.oid = t.tgrelid
+                  JOIN pg_namespace n ON n.oid = c.relnamespace
+                 WHERE n.nspname = current_schema() AND
+                       t.tgname = 'register_deleted_object_trigger'
+                 ORDER BY c.relname""")]
+            if self.tables is not None:
+                unknown = set(self.tables) - set(tables)
+                if unknown:
+                    raise ValueError("Not synchronized tables: %s" % (
+                        ', '.join(sorted(unknown)), ))
+                tables = list(self.tables)
+            self._tables = tables
+        return self._tables
+
+    def fetch(self, position=FEED_START, limit=None):
+        """Fetch a batch of changes after a position
+
+        At most *limit* transaction entries (and the same number of removed
+        objects) are read. Note that the batch can be empty even if there are
+        more changes after it (e.g. when only some tables are being listed),
+        so this should be called again until the returned position stops
+        moving.
+
+        An object modified more than once after *position* is only listed
+        once. Objects created after *position* are listed as inserted, even
+        if they were modified after that.
+
+        :param position: the :class:`FeedPosition` to list the changes after
+        :param limit: the maximum number of entries to read, defaults
+            to :attr:`.batch_size`
+        :returns: a list of :class:`Change` and the :class:`FeedPosition`
+            to fetch the next batch from
+        """
+        limit = limit or self.batch_size
+        horizon = self._get_horizon()
+        entries = self._fetch_entries(position, horizon, limit)
+        deleted = self._fetch_deleted(position, horizon, limit)
+        resolved = self._resolve_entries([te_id for te_id, te_time, te_created in entries])
+
+        changes = []
+        for te_id, te_time, te_created in entries:
+            # The entry may belong to a table that is not being listed
+            if te_id not in resolved:
+                continue
+            table, object_id = resolved[te_id]
+            # te_created is NULL for the entries created before it existed
+            if te_created is not None and te_created > position.te_time:
+                operation = self.OPERATION_INSERT
+            else:
+                operation = self.OPERATION_UPDATE
+            changes.append(Change(table, object_id, operation, te_time, te_id))
+        for table, object_id, te_time, te_id in deleted:
+            changes.append(Change(table, object_id, self.OPERATION_DELETE,
+                                  te_time, te_id))
+        changes.sort(key=lambda c: (c.te_time, c.te_id))
+
+        entry_positions = [FeedPosition(te_time, te_id)
+                           for te_id, te_time, te_created in entries]
+        deleted_positions = [FeedPosition(te_time, te_id)
+                             for table, object_id, te_time, te_id in deleted]
+        # When one of them reached the limit, there may be more changes
+        # after it, so the changes are only complete up to its end
+        ends = [positions[-1] for positions in [entry_positions, deleted_positions]
+                if len(positions) == limit]
+        if ends:
+            end = min(ends)
+            changes = [c for c in changes if (c.te_time, c.te_id) <= end]
+        else:
+            end = max(entry_positions + deleted_positions + [position])
+        return changes, end
+
+    def iter_batches(self, position=FEED_START, limit=None):
+        """Iterate over all the changes after a position, in batches
+
+        Like :meth:`.fetch`, some batches may be empty.
+
+        :param position: the :class:`FeedPosition` to list the changes after
+        :param limit: see :meth:`.fetch`
+        :returns: a generator of (changes, position) tuples, where position
+            is the one after the changes
+        """
+        while True:
+            changes, end = self.fetch(position, limit=limit)
+            if end == position:
+                return
+            yield changes, end
+            position = end
+
+    def get_cursor(self, name):
+        """Get the position saved for a consumer
+
+        :param name: the name of the consumer
+        :returns: a :class:`FeedPosition`, or :obj:`FEED_START` if there
+            is no position saved for *name*
+        """
+        row = self.store.execute(
+            "SELECT te_time, te_id FROM change_feed_cursor WHERE name = ?",
+            (name, )).get_one()
+        return FEED_START if row is None else FeedPosition(*row)
+
+    def save_cursor(self, name, position):
+        """Save the position of a consumer
+
+        The position is only persisted when the store is committed.
+
+        :param name: the name of the consumer
+        :param position: a :class:`FeedPosition`
+        """
+        self.store.execute("""
+            INSERT INTO change_feed_cursor (name, te_time, te_id) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                te_time = EXCLUDED.te_time, te_id = EXCLUDED.te_id,
+                last_update = statement_timestamp()""",
+                           (name, position.te_time, position.te_id))
+
+    def pull(self, name, limit=None):
+        """Pull the changes a consumer did not get yet
+
+        The consumer's position is saved after it processes each
+        batch, that is, when the next one is requested. If it stops
+        in the middle of a batch, that batch will be pulled again.
+
+        :param name: the name of the consumer
+        :param limit: see :meth:`.fetch`
+        :returns: a generator of lists of :class:`Change`
+        """
+        for changes, end in self.iter_batches(self.get_cursor(name), limit=limit):
+            if changes:
+                yield changes
+            self.save_cursor(name, end)
@@ -28,9 +28,11 @@ This contains a list of expressions that are unsupported by Storm.
 Most of them are specific to PostgreSQL
 """
 
+import datetime
+
 from storm.expr import (Expr, NamedFunc, PrefixExpr, SuffixExpr, SQL, ComparableExpr,
                         compile as expr_compile, FromExpr, Undef, EXPR, is_safe_token,
-                        BinaryOper, SetExpr)
+                        BinaryOper, SetExpr, And, Ge, Lt)
 
 
 class Age(NamedFunc):
@@ -167,6 +169,13 @@ class CharLength(NamedFunc):
     name = "CHAR_LENGTH"
 
 
+class Md5(NamedFunc):
+    """The md5 hash of the string or bytea, as an hexadecimal string"""
+    # http://www.postgresql.org/docs/9.5/static/functions-binarystring.html
+    __slots__ = ()
+    name = "MD5"
+
+
 class LPad(NamedFunc):
     """Fill up the string to length by prepending the characters fill"""
     # http://www.postgresql.org/docs/8.4/static/functions-string.html
@@ -247,15 +256,28 @@ class StoqNormalizeString(NamedFunc):
     it's similar to NLKD normailzation in unicode, but it is run
     inside the database.
 
-    Note, this is very slow and should be avoided.
-    In the future this will be replaced by fulltext search which
-    does normalization in a cheaper way.
+    Note, this is very slow when done for every row of a table. Comparisons
+    should be done on columns that have a trigram index created on this
+    expression (see patch-06-31.sql), so LIKE comparisons can use it.
     """
     # See functions.sql
     __slots__ = ()
     name = "stoq_normalize_string"
 
 
+class Quantize(NamedFunc):
+    """Rounds a numeric value the same way
+    :func:`stoqlib.lib.defaults.quantize` does.
+
+    Unlike :class:`Round`, half values are rounded to the nearest even
+    number, just like python's :meth:`decimal.Decimal.quantize`. The second
+    argument is the number of decimal places, 2 by default.
+    """
+    # See functions.sql
+    __slots__ = ()
+    name = "stoq_quantize"
+
+
 class Case(ComparableExpr):
     """Works like a Python's if-then-else clause.
 
@@ -351,6 +373,43 @@ def compile_between(compile, expr, state):
         expr_compile(expr.end, state))
 
 
+class DayInterval(Expr):
+    """Check if a timestamp falls on the days from start to end
+
+    This is the same as ``Date(value) >= Date(start) AND Date(value) <=
+    Date(end)``, but the value is compared directly with a half-open interval
+    of timestamps: from the beginning of start's day up to, but not including,
+    the beginning of the day after end. That way an index on the value
+    can be used.
+
+    start or end can be ``None`` to leave that side of the interval open.
+    """
+    __slots__ = ('value', 'start', 'end')
+
+    def __init__(self, value, start=None, end=None):
+        assert start is not None or end is not None
+        self.value = value
+        self.start = start
+        self.end = end
+
+
+def _get_day_start(date):
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    return datetime.datetime.combine(date, datetime.time())
+
+
+@expr_compile.when(DayInterval)
+def compile_day_interval(compile, expr, state):
+    queries = []
+    if expr.start is not None:
+        queries.append(Ge(expr.value, _get_day_start(expr.start)))
+    if expr.end is not None:
+        day_after = _get_day_start(expr.end) + datetime.timedelta(days=1)
+        queries.append(Lt(expr.value, day_after))
+    return '(%s)' % (expr_compile(And(*queries), state), )
+
+
 class GenerateSeries(FromExpr):
     __slots__ = ('start', 'end', 'step')
 
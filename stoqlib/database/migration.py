@@ -44,6 +44,7 @@ from stoqlib.domain.profile import update_profile_applications
 from stoqlib.exceptions import (DatabaseInconsistency, StoqlibError,
                                 DatabaseError)
 from stoqlib.lib.crashreport import collect_traceback
+from stoqlib.lib.decorators import cached_property
 from stoqlib.lib.defaults import stoqlib_gettext
 from stoqlib.lib.message import error, info
 from stoqlib.lib.parameters import sysparam
@@ -240,10 +241,14 @@ class SchemaMigration(object):
 
     # Public API
 
-    def check(self, check_plugins=True):
+    def check(self, check_plugins=True, current_version=None,
+              plugin_versions=None):
         # always check if schema is up to date and optionally (depending on check_plugins flag)
-        # check if plugins are up to date as well
-        if self.check_uptodate() and (not check_plugins or self.check_plugins()):
+        # check if plugins are up to date as well.
+        # current_version and plugin_versions can be passed if they were
+        # already fetched, see check_uptodate and check_plugins
+        if (self.check_uptodate(current_version) and
+                (not check_plugins or self.check_plugins(plugin_versions))):
             return True
 
         error(_("Database schema error"),
@@ -252,16 +257,20 @@ class SchemaMigration(object):
                 "update the schema  to the latest available version."))
         return False
 
-    def check_uptodate(self):
+    def check_uptodate(self, current_version=None):
         """
         Verify if the schema is up to date.
+        :param current_version: the current database patch version, if it
+          was already fetched. See :meth:`.get_current_version`
         :returns: True or False.
         """
         # Fetch the latest, eg the last in the list
         patches = self._get_patches()
         latest_available = patches[-1].get_version()
 
-        current_version = self.get_current_version()
+        if current_version is None:
+            current_version = self.get_current_version()
+        current_version = tuple(current_version)
         if current_version == latest_available:
             return True
         elif current_version > latest_available:
@@ -459,9 +468,11 @@ class StoqlibSchemaMigration(SchemaMigration):
         log.info("Migration done")
         return True
 
-    def _get_plugins(self):
+    def _get_plugins(self, plugin_names=None):
         manager = get_plugin_manager()
-        for plugin_name in manager.installed_plugins_names:
+        if plugin_names is None:
+            plugin_names = manager.installed_plugins_names
+        for plugin_name in plugin_names:
             if plugin_name in manager.available_plugins_names:
                 yield manager.get_plugin(plugin_name)
 
@@ -471,15 +482,25 @@ class StoqlibSchemaMigration(SchemaMigration):
             if migration:
                 migration.update()
 
-    def check_plugins(self):
+    def check_plugins(self, plugin_versions=None):
+        """Verify if the installed plugins' schemas are up to date
+
+        :param plugin_versions: a dict mapping the installed plugins' names
+          to their current patch level, if it was already fetched
+        :returns: True or False.
+        """
         # This cannot be done in check_uptodate since the plugin domain
         # classes were introduced as a patch and the way the callsites
         # works in stoq/lib/startup.py
-        for plugin in self._get_plugins():
+        for plugin in self._get_plugins(plugin_versions):
             migration = plugin.get_migration()
             if not migration:
                 continue
-            if not migration.check_uptodate():
+            if plugin_versions is None:
+                current_version = None
+            else:
+                current_version = (0, plugin_versions[plugin.name])
+            if not migration.check_uptodate(current_version):
                 return False
         return True
 
@@ -516,7 +537,8 @@ class StoqlibSchemaMigration(SchemaMigration):
         It may happen that the developer forgets to add the update_te rule after the table is
         created, leaving a table that will not be properly synchronized.
 
-        This makes sure that all tables have the update_te rule.
+        This makes sure that all tables have the update_te rule, and the
+        trigger that registers their deleted objects for the change feed.
         """
         query = """
         ALTER TABLE {table} ALTER COLUMN te_id SET DEFAULT new_te('{table}');
@@ -526,6 +548,7 @@ class StoqlibSchemaMigration(SchemaMigration):
 
         for table in self._get_transaction_entry_tables(store):
             store.execute(query.format(table=table))
+        store.execute("SELECT ensure_deleted_object_triggers()")
 
 
 class PluginSchemaMigration(SchemaMigration):
@@ -546,7 +569,9 @@ class PluginSchemaMigration(SchemaMigration):
         self.patch_patterns = patterns
         SchemaMigration.__init__(self)
 
-        self._plugin = self.default_store.find(
+    @cached_property(ttl=0)
+    def _plugin(self):
+        return self.default_store.find(
             InstalledPlugin, plugin_name=self.plugin_name).one()
 
     def _log(self, msg):
@@ -560,13 +585,32 @@ class PluginSchemaMigration(SchemaMigration):
             "WHERE id = %s;",
             (patch.level, self._plugin.id))
 
+    def apply_all_patches(self):
+        super(PluginSchemaMigration, self).apply_all_patches()
+        self.after_update()
+
     def get_current_version(self):
         if self._plugin:
             return (0, self._plugin.plugin_version)
         return (0, 0)
 
+    def after_update(self):
+        # The tables created by the plugin also need to have their
+        # deleted objects registered for the change feed
+        store = new_store()
+        store.execute("SELECT ensure_deleted_object_triggers()")
+        store.commit(close=True)
 
-def needs_schema_update():
+
+def needs_schema_update(current_version=None, plugin_versions=None):
+    """Checks if the database schema or the plugins need to be updated
+
+    :param current_version: the current database patch version, if it
+      was already fetched
+    :param plugin_versions: a dict mapping the installed plugins' names
+      to their current patch level, if it was already fetched
+    :returns: True or False.
+    """
     try:
         migration = StoqlibSchemaMigration()
     except StoqlibError:
@@ -575,7 +619,8 @@ def needs_schema_update():
                 "schema."))
 
     try:
-        update = not (migration.check_uptodate() and migration.check_plugins())
+        update = not (migration.check_uptodate(current_version) and
+                      migration.check_plugins(plugin_versions))
     except DatabaseInconsistency as e:
         error(str(e))
 
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+"""Receive PostgreSQL notifications (LISTEN/NOTIFY) sent by other stations"""
+
+import logging
+import select
+import threading
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from stoqlib.database.settings import db_settings
+from stoqlib.lib.threadutils import threadit
+
+log = logging.getLogger(__name__)
+
+
+class NotificationListener(object):
+    """Listens to a notification channel on a separate thread
+
+    The listener uses its own connection, so it doesn't interfere with
+    any transaction. Notifications are only delivered by the database after
+    the transaction that sent them is committed.
+
+    Note that *callback* is called on the listener thread. It will receive
+    the payload of each notification or ``None`` when some notifications
+    may have been lost (e.g. the connection to the database was reestablished),
+    meaning that anything could have changed.
+
+    :param channel: the channel to listen to
+    :param callback: a callable that will receive the notifications' payload
+    """
+
+    #: Seconds to wait before trying to reconnect to the database
+    retry_interval = 10
+
+    #: Seconds to wait for notifications before checking if we should stop
+    poll_interval = 5
+
+    def __init__(self, channel, callback):
+        self.channel = channel
+        self.callback = callback
+        self._stop_event = None
+        self._thread = None
+
+    #
+    #  Private
+    #
+
+    def _connect(self):
+        conn = psycopg2.connect(db_settings.get_store_dsn())
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = conn.cursor()
+        cursor.execute('LISTEN "%s"' % (self.channel, ))
+        cursor.close()
+        return conn
+
+    def _listen(self, conn, stop_event):
+        while not stop_event.is_set():
+            ready = select.select([conn], [], [], self.poll_interval)
+            if ready == ([], [], []):
+                continue
+
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self.callback(notify.payload)
+
+    def _run(self, stop_event):
+        reconnecting = False
+        while not stop_event.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                # We may have missed some notifications while disconnected
+                if reconnecting:
+                    self.callback(None)
+                self._listen(conn, stop_event)
+            except psycopg2.Error as e:
+                log.warning('Lost connection while listening to %s: %s',
+                            self.channel, e)
+                reconnecting = True
+                stop_event.wait(self.retry_interval)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+    #
+    #  Public API
+    #
+
+    def is_running(self):
+        """If the listener is running
+
+        :returns: ``True`` if it is running, ``False`` otherwise
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start listening for notifications"""
+        if self.is_running():
+            return
+        # Each thread has its own event, so a thread that is still
+        # finishing after stop() won't be resumed by a new start()
+        self._stop_event = threading.Event()
+        self._thread = threadit(self._run, self._stop_event)
+
+    def stop(self):
+        """Stop listening for notifications
+
+        The listener thread will finish after at most :attr:`.poll_interval`
+        seconds.
+        """
+        if self._stop_event is not None:
+            self._stop_event.set()
+        self._stop_event = None
+        self._thread = None
@@ -24,6 +24,7 @@
 """ Runtime routines for applications"""
 
 from collections import namedtuple
+import itertools
 import logging
 import sys
 import warnings
@@ -32,7 +33,8 @@ import os
 
 from stoqlib.lib.component import get_utility, provide_utility
 from storm import Undef
-from storm.expr import SQL, Avg
+from storm.database import convert_param_marks
+from storm.expr import SQL, Avg, State
 from storm.info import get_obj_info
 from storm.store import Store, ResultSet, PENDING_REMOVE, PENDING_ADD
 from storm.tracer import trace
@@ -63,6 +65,12 @@ _default_store = None
 #: should not be used by anything except autoreload_object()
 _stores = weakref.WeakSet()
 
+#: used to give an unique name to the server side cursors
+_stream_cursor_ids = itertools.count()
+
+#: default stores inherited from the parent process, see reset_default_store()
+_inherited_stores = []
+
 
 def autoreload_object(obj, obj_store=False):
     """Autoreload object in any other existing store.
@@ -89,6 +97,10 @@ def autoreload_object(obj, obj_store=False):
 
 
 class StoqlibResultSet(ResultSet):
+
+    #: The default number of rows fetched on each round trip by :meth:`.stream`
+    stream_fetch_size = 500
+
     # FIXME: Remove. See bug 4985
     def __bool__(self):
         warnings.warn("use self.is_empty()", DeprecationWarning, stacklevel=2)
@@ -176,7 +188,67 @@ class StoqlibResultSet(ResultSet):
         else:
             return objects[0]
 
-    def fast_iter(self):
+    def _execute_stream(self, fetch_size):
+        """Execute the query on a server side cursor
+
+        Instead of transferring all the rows to the client when the query
+        is executed, they will be fetched *fetch_size* rows at a time while
+        the result is iterated.
+
+        The cursor is declared ``WITH HOLD`` so it survives a commit on
+        the store while the results are still being iterated. It is closed
+        after the result is garbage collected.
+
+        :param fetch_size: how many rows to fetch on each round trip
+        :returns: a :class:`storm.database.Result`
+        """
+        # Server side variant of Connection.execute() in storm/database.py
+        connection = self._store._connection
+        if connection._event:
+            connection._event.emit("register-transaction")
+        connection._ensure_connected()
+
+        state = State()
+        statement = connection.compile(self._get_select(), state)
+        statement = convert_param_marks(statement, "?", connection.param_mark)
+        params = state.parameters
+
+        name = 'stoq_stream_%d' % (next(_stream_cursor_ids), )
+        raw_cursor = connection._check_disconnect(
+            connection._raw_connection.cursor, name=name, withhold=True)
+        # arraysize is used by Result.__iter__ and itersize when iterating
+        # over the cursor directly
+        raw_cursor.arraysize = raw_cursor.itersize = fetch_size
+        connection._prepare_execution(raw_cursor, params, statement)
+        args = connection._execution_args(params, statement)
+        connection._run_execution(raw_cursor, args, params, statement)
+        return connection.result_factory(connection, raw_cursor)
+
+    def stream(self, fetch_size=None):
+        """Iterate over the results using a server side cursor
+
+        This is the same as iterating over the result set, but the rows are
+        fetched from the database in batches of *fetch_size* as the
+        iteration advances, so the first results are available without
+        having to wait for the whole result to be transferred.
+
+        :param fetch_size: how many rows to fetch on each round trip or
+          ``None`` to use :attr:`.stream_fetch_size`
+        """
+        result = self._execute_stream(fetch_size or self.stream_fetch_size)
+        for values in result:
+            yield self._load_objects(result, values)
+
+    def fast_iter(self, fetch_size=None):
+        """Iterate over the results without creating the storm objects
+
+        Each object in the find spec will be returned as a namedtuple
+        instead (or a viewable, if this is a viewable query).
+
+        :param fetch_size: if not ``None``, the results will be streamed
+          from a server side cursor in batches of this size. See
+          :meth:`.stream` for more information.
+        """
         # First build all named tuples
         named_tuples = []
         for is_expr, info in self._find_spec._cls_spec_info:
@@ -186,9 +258,14 @@ class StoqlibResultSet(ResultSet):
                 named_tuples.append(namedtuple(info.cls.__name__,
                                                [i.name for i in info.columns]))
 
+        if fetch_size:
+            result = self._execute_stream(fetch_size)
+        else:
+            result = self._store._connection.execute(self._get_select())
+
         is_viewable = hasattr(self, '_viewable')
         # Then interate over the results bypassing storm object creation
-        for values in self._store._connection.execute(self._get_select()):
+        for values in result:
             value = self._load_fast_object(named_tuples, values)
             if is_viewable:
                 value = self._load_viewable(value)
@@ -704,6 +781,20 @@ def set_default_store(store):
     _default_store = store
 
 
+def reset_default_store():
+    """Replaces the default store inherited from the parent process
+
+    This must be called by the processes forked after connecting to the
+    database (e.g. as the initializer of a :class:`multiprocessing.Pool`),
+    since the connection of the inherited store is the same one used
+    by the parent process.
+    """
+    # Keep a reference to the inherited store, since closing it (even by
+    # garbage collecting it) would also close the connection of the parent
+    _inherited_stores.append(_default_store)
+    set_default_store(db_settings.create_store())
+
+
 def new_store():
     """
     Create a new transaction.
@@ -752,11 +843,13 @@ def _register_branch_station(caller_store, station_name, confirm=True):
     return caller_store.fetch(station)
 
 
-def set_current_branch_station(store, station_name, confirm=True):
+def set_current_branch_station(store, station_name, confirm=True, station=None):
     """Registers the current station and the branch of the station
     as the current branch for the system
     :param store: a store
     :param station_name: name of the station to register
+    :param station: the station named *station_name*, if it was already
+      fetched
     """
     # This is called from stoq-daemon, which doesn't know about Branch yet
     from stoqlib.lib.parameters import sysparam
@@ -768,7 +861,8 @@ def set_current_branch_station(store, station_name, confirm=True):
 
     station_name = str(station_name)
     from stoqlib.domain.station import BranchStation
-    station = store.find(BranchStation, name=station_name).one()
+    if station is None:
+        station = store.find(BranchStation, name=station_name).one()
     if station is None:
         station = _register_branch_station(store, station_name, confirm=confirm)
 
@@ -189,6 +189,15 @@ def get_database_version(store):
     :returns: the version as a 3 item tuple
     """
     version_num = store.execute('SHOW server_version_num;').get_one()[0]
+    return parse_database_version(version_num)
+
+
+def parse_database_version(version_num):
+    """Parses the database version number as a tuple
+
+    :param version_num: the version as returned by ``server_version_num``
+    :returns: the version as a 3 item tuple
+    """
     version_num = '0' * (6 - len(version_num)) + version_num
     return tuple(map(
         int, [version_num[i:i + 2] for i in range(0, len(version_num), 2)]))
@@ -727,16 +736,18 @@ class DatabaseSettings(object):
         else:
             raise NotImplementedError(self.rdbms)
 
-    def check_version(self, store):
+    def check_version(self, store, server_version=None):
         """Verify that the database version is recent enough to be supported
         by stoq. Emits a warning if the version isn't recent enough, suitable
         for usage by an installer.
 
         :param store: a store
+        :param server_version: the database version, as returned by
+          :func:`get_database_version`, if it was already fetched
         """
         if self.rdbms == 'postgres':
             try:
-                svs = get_database_version(store)
+                svs = server_version or get_database_version(store)
             except DatabaseError as e:
                 log.info(str(e))
                 return
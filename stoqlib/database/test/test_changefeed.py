@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+__tests__ = 'stoqlib/database/changefeed.py'
+
+import datetime
+from unittest import mock
+
+from stoqlib.database.changefeed import ChangeFeed, FeedPosition, FEED_START
+from stoqlib.domain.test.domaintest import DomainTest
+
+
+class TestChangeFeed(DomainTest):
+
+    def _get_feed(self, tables=None):
+        feed = ChangeFeed(self.store, tables=tables)
+        # The other connections used by the tests may be in the middle
+        # of a transaction, which would hold the feed back
+        feed._get_horizon = mock.Mock(return_value=datetime.datetime.max)
+        return feed
+
+    def _get_position(self, obj):
+        self.store.flush()
+        return FeedPosition(obj.te.te_time, obj.te_id)
+
+    def test_get_tables(self):
+        tables = ChangeFeed(self.store).get_tables()
+        self.assertIn('sellable', tables)
+        self.assertNotIn('transaction_entry', tables)
+        self.assertNotIn('change_feed_cursor', tables)
+
+        feed = ChangeFeed(self.store, tables=['sellable', 'foo'])
+        with self.assertRaisesRegex(ValueError, 'foo'):
+            feed.get_tables()
+
+    def test_get_tables_new_table(self):
+        # Like the tables created by the plugins
+        self.store.execute("""
+            CREATE TABLE _test_changefeed (
+                id serial NOT NULL PRIMARY KEY,
+                te_id bigint UNIQUE REFERENCES transaction_entry(id)
+                );
+            """)
+        # Its removals would not be registered without the trigger
+        self.assertNotIn('_test_changefeed', ChangeFeed(self.store).get_tables())
+
+        self.store.execute("SELECT ensure_deleted_object_triggers()")
+        self.assertIn('_test_changefeed', ChangeFeed(self.store).get_tables())
+
+    def test_fetch(self):
+        feed = self._get_feed(tables=['sellable_category'])
+        start = self._get_position(self.create_sellable())
+
+        category = self.create_sellable_category()
+        changes, end = feed.fetch(start)
+        self.assertEqual([(c.table, c.id, c.operation) for c in changes],
+                         [('sellable_category', category.id, ChangeFeed.OPERATION_INSERT)])
+        self.assertEqual(end, self._get_position(category))
+        self.assertEqual(feed.fetch(end), ([], end))
+
+        category.description = u'Modified'
+        changes, end = feed.fetch(end)
+        self.assertEqual([(c.id, c.operation) for c in changes],
+                         [(category.id, ChangeFeed.OPERATION_UPDATE)])
+        # Still inserted, when looking from before it was created
+        changes, unused = feed.fetch(start)
+        self.assertEqual([c.operation for c in changes],
+                         [ChangeFeed.OPERATION_INSERT])
+
+        category_id = category.id
+        self.store.remove(category)
+        changes, end = feed.fetch(end)
+        self.assertEqual([(c.table, c.id, c.operation) for c in changes],
+                         [('sellable_category', category_id, ChangeFeed.OPERATION_DELETE)])
+        self.assertEqual(feed.fetch(end), ([], end))
+
+    def test_iter_batches(self):
+        feed = self._get_feed(tables=['sellable_category'])
+        start = self._get_position(self.create_sellable())
+        categories = [self.create_sellable_category() for i in range(3)]
+        # Not listed, but it still moves the position
+        self.create_sellable()
+        self.store.flush()
+
+        batches = list(feed.iter_batches(start, limit=2))
+        self.assertEqual([[c.id for c in changes] for changes, end in batches],
+                         [[categories[0].id, categories[1].id], [categories[2].id]])
+        self.assertEqual(feed.fetch(batches[-1][1])[0], [])
+
+    def test_pull(self):
+        feed = self._get_feed(tables=['sellable_category'])
+        self.assertEqual(feed.get_cursor(u'test'), FEED_START)
+        start = self._get_position(self.create_sellable())
+        feed.save_cursor(u'test', start)
+        self.assertEqual(feed.get_cursor(u'test'), start)
+
+        categories = [self.create_sellable_category() for i in range(3)]
+        self.store.flush()
+        pulled = []
+        for changes in feed.pull(u'test', limit=2):
+            pulled.extend(c.id for c in changes)
+            # Stopping in the middle does not save the position
+            break
+        self.assertEqual(feed.get_cursor(u'test'), start)
+
+        for changes in feed.pull(u'test', limit=2):
+            pulled.extend(c.id for c in changes)
+        self.assertEqual(pulled, [categories[0].id, categories[1].id] +
+                         [c.id for c in categories])
+        self.assertEqual(feed.get_cursor(u'test'), self._get_position(categories[-1]))
+        self.assertEqual(list(feed.pull(u'test')), [])
+
+    def test_get_horizon(self):
+        horizon = ChangeFeed(self.store)._get_horizon()
+        self.assertIsInstance(horizon, datetime.datetime)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+__tests__ = 'stoqlib/database/notification.py'
+
+import queue
+import time
+
+from stoqlib.database.notification import NotificationListener
+from stoqlib.database.runtime import new_store
+from stoqlib.domain.test.domaintest import DomainTest
+
+
+class TestNotificationListener(DomainTest):
+
+    def _wait_listening(self, store, channel):
+        # LISTEN is executed on the listener thread, so wait for it
+        for i in range(100):
+            if store.execute("SELECT 1 FROM pg_stat_activity WHERE query = %s",
+                             ('LISTEN "%s"' % (channel, ), )).get_one():
+                return
+            time.sleep(0.05)
+        self.fail("The listener did not start")
+
+    def test_listen(self):
+        notifications = queue.Queue()
+        listener = NotificationListener('test_notification',
+                                        notifications.put)
+        listener.poll_interval = 0.1
+        listener.start()
+        self.assertTrue(listener.is_running())
+
+        store = new_store()
+        try:
+            self._wait_listening(store, 'test_notification')
+            store.execute("SELECT pg_notify('test_notification', 'foo')")
+            # Nothing is notified before the commit
+            self.assertTrue(notifications.empty())
+            store.commit(close=False)
+
+            self.assertEqual(notifications.get(timeout=10), 'foo')
+        finally:
+            store.close()
+            listener.stop()
+
+        self.assertFalse(listener.is_running())
@@ -462,3 +462,30 @@ class TestStoqlibResultSet(DomainTest):
         for obj, tpl in zip(results, results.fast_iter()):
             for prop in ['name', 'status', 'cpf']:
                 self.assertEqual(getattr(obj, prop), getattr(tpl, prop))
+
+    def test_fast_iter_fetch_size(self):
+        results = self.store.find(Person).order_by(Person.te_id)
+        # Make sure there are more results than the fetch size
+        assert results.count() > 2
+        self.assertEqual([tpl.id for tpl in results.fast_iter(fetch_size=2)],
+                         [tpl.id for tpl in results.fast_iter()])
+
+    def test_stream(self):
+        results = self.store.find(Person).order_by(Person.te_id)
+        # Make sure there are more results than the fetch size
+        assert results.count() > 2
+        self.assertEqual(list(results.stream(fetch_size=2)), list(results))
+
+    def test_stream_commit(self):
+        store = new_store()
+        try:
+            results = store.find(Person).order_by(Person.te_id)
+            ids = [person.id for person in results]
+            stream = results.stream(fetch_size=1)
+            first = next(stream)
+            # The cursor should survive the end of the transaction
+            store.commit(close=False)
+            self.assertEqual([first.id] + [person.id for person in stream],
+                             ids)
+        finally:
+            store.close()
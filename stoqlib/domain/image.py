@@ -27,22 +27,40 @@
 # pylint: enable=E1101
 
 import base64
+import hashlib
 
+from storm.expr import Update
 from storm.references import Reference
 from zope.interface import implementer
 
 from stoqlib.database.expr import StatementTimestamp
 from stoqlib.database.properties import (IdCol, BLOBCol, UnicodeCol, BoolCol,
                                          DateTimeCol)
+from stoqlib.database.orm import ORMObject
 from stoqlib.domain.base import Domain
 from stoqlib.domain.events import (ImageCreateEvent, ImageEditEvent,
                                    ImageRemoveEvent)
 from stoqlib.domain.interfaces import IDescribable
+from stoqlib.lib.imagecache import get_image_cache
 from stoqlib.lib.translation import stoqlib_gettext
 
 _ = stoqlib_gettext
 
 
+class _ImageContent(ORMObject):
+    """The contents of an |image|
+
+    This maps to the same table as |image|, but only to the columns that
+    have its contents, so they can be fetched and updated separately.
+    """
+
+    __storm_table__ = 'image'
+
+    id = IdCol(primary=True)
+    image = BLOBCol(default=None)
+    thumbnail = BLOBCol(default=None)
+
+
 @implementer(IDescribable)
 class Image(Domain):
     """Class responsible for storing images and it's description
@@ -57,11 +75,11 @@ class Image(Domain):
     (THUMBNAIL_SIZE_HEIGHT,
      THUMBNAIL_SIZE_WIDTH) = (128, 128)
 
-    #: the image itself in a bin format
-    image = BLOBCol(default=None)
+    #: the md5sum of :obj:`.image`. This is maintained by the database
+    image_md5sum = UnicodeCol(default=None)
 
-    #: the image thumbnail in a bin format
-    thumbnail = BLOBCol(default=None)
+    #: the md5sum of :obj:`.thumbnail`. This is maintained by the database
+    thumbnail_md5sum = UnicodeCol(default=None)
 
     #: the image description
     description = UnicodeCol(default=u'')
@@ -98,6 +116,67 @@ class Image(Domain):
     #: The station type this image should be used instead of the main image.
     station_type = Reference(station_type_id, 'StationType.id')
 
+    #
+    #  Properties
+    #
+
+    @property
+    def image(self):
+        """the image itself in a bin format
+
+        The contents are only fetched when accessed, and are kept on
+        the local images cache, see :func:`stoqlib.lib.imagecache.get_image_cache`
+        """
+        return self._get_content('image')
+
+    @image.setter
+    def image(self, image):
+        self._set_content('image', image)
+
+    @property
+    def thumbnail(self):
+        """the image thumbnail in a bin format
+
+        Like :obj:`.image`, it is only fetched when accessed
+        """
+        return self._get_content('thumbnail')
+
+    @thumbnail.setter
+    def thumbnail(self, thumbnail):
+        self._set_content('thumbnail', thumbnail)
+
+    #
+    #  Private
+    #
+
+    def _get_content(self, name):
+        pending = self.__dict__.get('_pending_content', {})
+        if name in pending:
+            return pending[name]
+
+        md5sum = getattr(self, name + '_md5sum')
+        if md5sum is None:
+            return None
+
+        cache = get_image_cache()
+        content = cache.get(md5sum)
+        if content is None:
+            content = self.store.find(getattr(_ImageContent, name),
+                                      _ImageContent.id == self.id).one()
+            if content is not None:
+                cache.put(md5sum, content)
+        return content
+
+    def _set_content(self, name, content):
+        md5sum = None if content is None else hashlib.md5(content).hexdigest()
+        if md5sum == getattr(self, name + '_md5sum'):
+            return
+
+        # The content is written after self is flushed, see __storm_flushed__.
+        # Changing the md5sum is what makes self be flushed
+        self.__dict__.setdefault('_pending_content', {})[name] = content
+        setattr(self, name + '_md5sum', md5sum)
+
     #
     #  Public API
     #
@@ -124,6 +203,23 @@ class Image(Domain):
         ImageRemoveEvent.emit(image)
         store.remove(image)
 
+    def __storm_flushed__(self):
+        pending = self.__dict__.pop('_pending_content', None)
+        store = self.store
+        # The object may have just been removed
+        if not pending or store is None:
+            return
+
+        # This is called in the middle of a flush
+        store.block_implicit_flushes()
+        try:
+            store.execute(Update(
+                dict((getattr(_ImageContent, name), content)
+                     for name, content in pending.items()),
+                _ImageContent.id == self.id, _ImageContent))
+        finally:
+            store.unblock_implicit_flushes()
+
     #
     # Domain
     #
@@ -28,13 +28,13 @@
 import collections
 from decimal import Decimal
 
-from storm.expr import And, Eq, Cast, Join, LeftJoin, Or, Coalesce
+from storm.expr import And, Eq, Cast, Insert, Join, LeftJoin, Ne, Or, Coalesce, Select
 from storm.references import Reference, ReferenceSet
 
 from stoqlib.database.properties import (QuantityCol, PriceCol, DateTimeCol,
                                          IntCol, UnicodeCol, IdentifierCol,
                                          IdCol, BoolCol, EnumCol)
-from stoqlib.database.expr import StatementTimestamp
+from stoqlib.database.expr import Case, StatementTimestamp
 from stoqlib.database.viewable import Viewable
 from stoqlib.domain.base import Domain, IdentifiableDomain
 from stoqlib.domain.fiscal import FiscalBookEntry
@@ -254,6 +254,10 @@ class Inventory(IdentifiableDomain):
         (STATUS_CANCELLED, _(u'Cancelled')),
     ])
 
+    #: How many storables are added by each statement when opening an
+    #: inventory reporting its progress, see :meth:`.create_inventory`
+    chunk_size = 5000
+
     #: A numeric identifier for this object. This value should be used instead of
     #: :obj:`Domain.id` when displaying a numerical representation of this object to
     #: the user, in dialogs, lists, reports and such.
@@ -430,6 +434,19 @@ class Inventory(IdentifiableDomain):
             And(InventoryItem.recorded_quantity != InventoryItem.counted_quantity,
                 Eq(InventoryItem.is_adjusted, False)))
 
+    def adjust_items(self, user: LoginUser, items, invoice_number):
+        """Adjust the stock of the given items at once
+
+        This is the same as calling :meth:`InventoryItem.adjust` for each one
+        of the items, but the stock movements will be written together.
+
+        :param items: a sequence of :class:`InventoryItem`
+        :param invoice_number: invoice number to register
+        """
+        with Storable.batch_stock_movements(self.store):
+            for item in items:
+                item.adjust(user, invoice_number)
+
     def has_adjusted_items(self):
         """Returns if we already have an item adjusted or not.
 
@@ -478,6 +495,28 @@ class Inventory(IdentifiableDomain):
             (InventoryItem, Storable, Product, Sellable, StorableBatch),
             InventoryItem.inventory_id == self.id)
 
+    @classmethod
+    def _get_sellables_tables(cls):
+        # XXX: If we should want all storables to be inclued in the inventory, even if if
+        #      never had a ProductStockItem before, than we should inclue this query in the
+        #      LeftJoin with ProductStockItem below
+        return [Sellable,
+                Join(Product, Product.id == Sellable.id),
+                Join(Storable, Storable.id == Product.id),
+                LeftJoin(StorableBatch, StorableBatch.storable_id == Storable.id),
+                LeftJoin(ProductStockItem,
+                         And(ProductStockItem.storable_id == Storable.id,
+                             Or(ProductStockItem.batch_id == StorableBatch.id,
+                                Eq(ProductStockItem.batch_id, None)))),
+                ]
+
+    @classmethod
+    def _get_sellables_query(cls, branch, extra_query=None):
+        query = ProductStockItem.branch_id == branch.id
+        if extra_query:
+            query = And(query, extra_query)
+        return query
+
     @classmethod
     def get_sellables_for_inventory(cls, store, branch, extra_query=None):
         """Returns a generator with the necessary data about the stock to open an Inventory
@@ -491,33 +530,27 @@ class Inventory(IdentifiableDomain):
         :returns: a generator of the following objects:
             (Sellable, Product, Storable, StorableBatch, ProductStockItem)
         """
-        # XXX: If we should want all storables to be inclued in the inventory, even if if
-        #      never had a ProductStockItem before, than we should inclue this query in the
-        #      LeftJoin with ProductStockItem below
-        query = ProductStockItem.branch_id == branch.id
-        if extra_query:
-            query = And(query, extra_query)
-
-        tables = [Sellable,
-                  Join(Product, Product.id == Sellable.id),
-                  Join(Storable, Storable.id == Product.id),
-                  LeftJoin(StorableBatch, StorableBatch.storable_id == Storable.id),
-                  LeftJoin(ProductStockItem,
-                           And(ProductStockItem.storable_id == Storable.id,
-                               Or(ProductStockItem.batch_id == StorableBatch.id,
-                                  Eq(ProductStockItem.batch_id, None)))),
-                  ]
-        return store.using(*tables).find(
+        return store.using(*cls._get_sellables_tables()).find(
             (Sellable, Product, Storable, StorableBatch, ProductStockItem),
-            query)
+            cls._get_sellables_query(branch, extra_query))
 
     @classmethod
     def create_inventory(cls, store, branch: Branch, station: BranchStation, responsible,
-                         query=None):
+                         query=None, progress_callback=None):
         """Create a inventory with products that match the given query
 
+        The items are created by the database from the result of
+        :meth:`.get_sellables_for_inventory`, without loading them. Storables
+        controlled by batches will have one item for each |batch| with a stock
+        item, and the other storables one item without a batch, which are
+        the only combinations :meth:`.validate_batch` accepts.
+
         :param store: A store to open the inventory in
         :param query: A query to restrict the products that should be in the inventory.
+        :param progress_callback: if not ``None``, the items will be created
+            :attr:`.chunk_size` storables at a time and this will be called
+            after each of those with the number of storables added so far
+            and the total number of them
         """
         inventory = cls(store=store,
                         branch=branch,
@@ -525,21 +558,44 @@ class Inventory(IdentifiableDomain):
                         open_date=localnow(),
                         responsible_id=responsible.id)
 
-        for data in cls.get_sellables_for_inventory(store, branch, query):
-            sellable, product, storable, batch, stock_item = data
-            quantity = stock_item and stock_item.quantity or 0
-            if storable.is_batch:
-                # This used to test 'stock_item.quantity > 0' too to avoid
-                # creating inventory items for old batches not used anymore.
-                # We can't do that since that would make it impossible to
-                # adjust a batch that was wrongly set to 0. We need to find a
-                # way to mark the batches as "not used anymore" because they
-                # tend to grow to very large proportions and we are duplicating
-                # everyone here
-                if batch and stock_item:
-                    inventory.add_product(product, quantity, batch=batch)
-            else:
-                inventory.add_product(product, quantity)
+        tables = cls._get_sellables_tables()
+        query = And(cls._get_sellables_query(branch, query),
+                    # This used to test 'stock_item.quantity > 0' too to avoid
+                    # creating inventory items for old batches not used anymore.
+                    # We can't do that since that would make it impossible to
+                    # adjust a batch that was wrongly set to 0. We need to find a
+                    # way to mark the batches as "not used anymore" because they
+                    # tend to grow to very large proportions and we are duplicating
+                    # everyone here
+                    Or(Eq(Storable.is_batch, False),
+                       And(Ne(StorableBatch.id, None),
+                           Ne(ProductStockItem.id, None))))
+        columns = (InventoryItem.inventory_id, InventoryItem.product_id,
+                   InventoryItem.batch_id, InventoryItem.product_cost,
+                   InventoryItem.recorded_quantity, InventoryItem.reason,
+                   InventoryItem.is_adjusted)
+        values = [Cast(inventory.id, 'uuid'), Product.id,
+                  Case(Storable.is_batch, StorableBatch.id),
+                  Sellable.cost, Coalesce(ProductStockItem.quantity, 0),
+                  u'', False]
+
+        def insert_items(where):
+            # Each item will have its own transaction entry, created by the
+            # te_id column default
+            store.execute(Insert(columns, table=InventoryItem,
+                                 values=Select(values, where, tables=tables)))
+
+        if progress_callback is None:
+            insert_items(query)
+            return inventory
+
+        storable_ids = list(store.using(*tables).find(
+            Storable.id, query).config(distinct=True))
+        total = len(storable_ids)
+        for i in range(0, total, cls.chunk_size):
+            chunk = storable_ids[i:i + cls.chunk_size]
+            insert_items(And(query, Storable.id.is_in(chunk)))
+            progress_callback(i + len(chunk), total)
         return inventory
 
 
@@ -84,19 +84,23 @@ stock_items are unique:
 # pylint: enable=E1101
 
 import collections
+import contextlib
+import weakref
 from decimal import Decimal
 
 from kiwi.currency import currency
 from storm.references import Reference, ReferenceSet
 from storm.exceptions import NotOneError
+from storm.store import AutoReload
 from storm.expr import (And, Eq, LeftJoin, Alias, Sum, Coalesce, Select, Join,
-                        Cast, Or, In)
+                        Cast, Or, In, Insert, Delete, Ne)
 from zope.interface import implementer
 
 from stoqlib.api import api
 from stoqlib.database.expr import (Field, TransactionTimestamp,
                                    ArrayAgg, Contains, IsContainedBy,
-                                   SplitPart)
+                                   SplitPart, UnionAll)
+from stoqlib.database.orm import ORMObject
 from stoqlib.database.properties import (BoolCol, DateTimeCol, DecimalCol,
                                          EnumCol, IdCol, IntCol, PercentCol,
                                          PriceCol, QuantityCol, UnicodeCol)
@@ -123,6 +127,10 @@ _ = stoqlib_gettext
 #
 Person  # pylint: disable=W0104
 
+#: The :class:`StockMovementBatch` active for each store, see
+#: :meth:`Storable.batch_stock_movements`
+_stock_movement_batches = weakref.WeakKeyDictionary()
+
 
 class ProductSupplierInfo(Domain):
     """Supplier information for a |product|.
@@ -1150,6 +1158,27 @@ class ProductHistory(Domain):
             sold_date=TransactionTimestamp(),
             store=store)
 
+    @classmethod
+    def add_sold_items(cls, store, branch, sale_items):
+        """Adds a lot of |saleitems| to the history at once
+
+        This is the same as calling :meth:`.add_sold_item` for each
+        one of them, but they will all be inserted in a single statement.
+
+        :param store: a store
+        :param branch: the |branch|
+        :param sale_items: the |saleitems| for the sold |products|
+        """
+        values = [(branch.id, item.sellable_id, item.quantity,
+                   TransactionTimestamp())
+                  for item in sale_items]
+        if not values:
+            return
+
+        columns = (cls.branch_id, cls.sellable_id, cls.quantity_sold,
+                   cls.sold_date)
+        store.execute(Insert(columns, table=cls, values=values))
+
     @classmethod
     def add_received_item(cls, store, branch, receiving_order_item):
         """
@@ -1282,6 +1311,102 @@ class ProductStockItem(Domain):
                                batch=self.batch)
 
 
+class ProductStockSummary(ORMObject):
+    """The stock of a |storable| on a |branch|
+
+    This is the sum of all the |productstockitems| of the storable on the
+    branch (there is one for each |batch|). It is maintained by the database
+    every time a stock item changes, so the stock views can read the totals
+    from here instead of aggregating the stock items on every query.
+
+    This should never be modified manually. Use :meth:`.check_consistency`
+    to verify it and :meth:`.rebuild` to fix it, if needed.
+    """
+
+    __storm_table__ = 'product_stock_summary'
+
+    id = IdCol(primary=True, default=AutoReload)
+
+    storable_id = IdCol()
+
+    #: the |storable| this summary refers to
+    storable = Reference(storable_id, 'Storable.id')
+
+    branch_id = IdCol()
+
+    #: the |branch| this summary refers to
+    branch = Reference(branch_id, 'Branch.id')
+
+    #: the sum of the quantities of the stock items
+    quantity = QuantityCol(default=0)
+
+    #: the sum of the quantity * stock_cost of the stock items
+    total_cost = DecimalCol(default=0)
+
+    @classmethod
+    def _get_expected_select(cls):
+        return Select(
+            columns=[ProductStockItem.storable_id, ProductStockItem.branch_id,
+                     Coalesce(Sum(ProductStockItem.quantity), 0),
+                     Coalesce(Sum(ProductStockItem.quantity *
+                                  ProductStockItem.stock_cost), 0)],
+            tables=[ProductStockItem],
+            where=Ne(ProductStockItem.storable_id, None),
+            group_by=[ProductStockItem.storable_id, ProductStockItem.branch_id])
+
+    @classmethod
+    def check_consistency(cls, store):
+        """Compare the summaries with the stock items
+
+        :param store: a store
+        :returns: a list of ``(storable_id, branch_id, quantity,
+          expected_quantity, total_cost, expected_total_cost)`` tuples, one
+          for each summary that does not match its stock items
+        """
+        # Summaries first, with zeros for the expected values, and the stock
+        # items later, with zeros for the summary values. Summing everything
+        # by storable and branch will put both side by side
+        diff = Alias(UnionAll(
+            Select(columns=[Alias(cls.storable_id, 'storable_id'),
+                            Alias(cls.branch_id, 'branch_id'),
+                            Alias(cls.quantity, 'quantity'),
+                            Alias(0, 'expected_quantity'),
+                            Alias(cls.total_cost, 'total_cost'),
+                            Alias(0, 'expected_total_cost')],
+                   tables=[cls]),
+            Select(columns=[ProductStockItem.storable_id,
+                            ProductStockItem.branch_id,
+                            0, Coalesce(ProductStockItem.quantity, 0),
+                            0, Coalesce(ProductStockItem.quantity *
+                                        ProductStockItem.stock_cost, 0)],
+                   tables=[ProductStockItem],
+                   where=Ne(ProductStockItem.storable_id, None))), '_diff')
+
+        group_by = [Field('_diff', 'storable_id'), Field('_diff', 'branch_id')]
+        quantity, expected_quantity, total_cost, expected_total_cost = [
+            Sum(Field('_diff', name)) for name in
+            ['quantity', 'expected_quantity', 'total_cost', 'expected_total_cost']]
+        select = Select(
+            columns=group_by + [quantity, expected_quantity,
+                                total_cost, expected_total_cost],
+            tables=[diff],
+            group_by=group_by,
+            having=Or(Ne(quantity, expected_quantity),
+                      Ne(total_cost, expected_total_cost)))
+        return list(store.execute(select))
+
+    @classmethod
+    def rebuild(cls, store):
+        """Rebuild all the summaries from the stock items
+
+        :param store: a store
+        """
+        store.execute(Delete(table=cls))
+        store.execute(Insert(
+            (cls.storable_id, cls.branch_id, cls.quantity, cls.total_cost),
+            table=cls, values=cls._get_expected_select()))
+
+
 class Storable(Domain):
     '''Storable represents the stock of a |product|.
 
@@ -1341,6 +1466,51 @@ class Storable(Domain):
 
         return store.using(*tables).find((Sellable, Product, Storable), query)
 
+    @classmethod
+    @contextlib.contextmanager
+    def batch_stock_movements(cls, store):
+        """Batch the stock movements done on the given store
+
+        While inside this context, :meth:`.increase_stock`,
+        :meth:`.decrease_stock` and :meth:`.update_stock_cost` will queue
+        the |stocktransactionhistory| instead of creating them one by one.
+        They will all be written in a single statement when leaving it,
+        and that is also when :class:`ProductStockUpdateEvent` will be
+        emitted for each of them.
+
+        Use this when moving the stock of a lot of items at once, like
+        when confirming a |sale| or a |receivingorder|::
+
+            with Storable.batch_stock_movements(store):
+                for item in items:
+                    item.storable.decrease_stock(...)
+
+        Nesting is allowed, in which case the movements will only be written
+        when leaving the outermost context.
+
+        Note that the |productstockitem| returned by :meth:`.decrease_stock`
+        inside this context is not updated until the movements are written,
+        so its quantity will not reflect the pending movements (its cost
+        is not changed by a decrease, so it can be used).
+
+        :param store: a store
+        """
+        movements = _stock_movement_batches.get(store)
+        if movements is not None:
+            yield movements
+            return
+
+        movements = StockMovementBatch(store)
+        _stock_movement_batches[store] = movements
+        try:
+            yield movements
+        except Exception:
+            del _stock_movement_batches[store]
+            raise
+
+        del _stock_movement_batches[store]
+        movements.flush()
+
     #
     #  Public API
     #
@@ -1364,6 +1534,12 @@ class Storable(Domain):
         if branch is None:
             raise ValueError(u"branch cannot be None")
 
+        movements = _stock_movement_batches.get(self.store)
+        if movements is not None:
+            movements.add(self, branch, batch, quantity, unit_cost, user,
+                          type, object_id)
+            return
+
         stock_item = self.get_stock_item(branch, batch)
         old_quantity = stock_item.quantity if stock_item else 0
 
@@ -1397,6 +1573,9 @@ class Storable(Domain):
             related, if any
         :param batch: The batch of the storable. Should be not ``None`` if
             self.is_batch is ``True``
+        :returns: the |productstockitem|. Inside
+            :meth:`.batch_stock_movements`, its quantity is only updated
+            after the movements are written
         """
         # FIXME: Put this back once 1.6 is released
         # assert isinstance(type, int)
@@ -1406,12 +1585,33 @@ class Storable(Domain):
         if branch is None:
             raise ValueError(u"branch cannot be None")
 
-        stock_item = self.get_stock_item(branch, batch)
-        if ((stock_item is None or quantity > stock_item.quantity)
+        movements = _stock_movement_batches.get(self.store)
+        if movements is not None:
+            stock_item = movements.get_stock_item(self, branch, batch)
+            available = movements.get_quantity(self, branch, batch)
+        else:
+            stock_item = self.get_stock_item(branch, batch)
+            available = stock_item.quantity if stock_item else 0
+
+        if ((stock_item is None or quantity > available)
                 and not sysparam.get_bool('ALLOW_NEGATIVE_STOCK')):
             raise StockError(
                 _('Quantity to decrease is greater than the available stock.'))
 
+        # The stock item needs to exist for us to know its cost and a
+        # cost center entry needs the transaction object itself. In those
+        # cases write the pending movements and do this one right away
+        if movements is not None and (stock_item is None or
+                                      cost_center is not None):
+            movements.flush()
+            stock_item = self.get_stock_item(branch, batch)
+            movements = None
+
+        if movements is not None:
+            movements.add(self, branch, batch, -quantity, stock_item.stock_cost,
+                          user, type, object_id)
+            return stock_item
+
         old_quantity = stock_item.quantity if stock_item else 0
         cost = stock_item.stock_cost if stock_item else 0
         stock_transaction = StockTransactionHistory(
@@ -1469,6 +1669,12 @@ class Storable(Domain):
         :param batch: The batch of the storable
             self.is_batch is ``True``
         """
+        movements = _stock_movement_batches.get(self.store)
+        if movements is not None:
+            movements.add(self, branch, batch, 0, stock_cost, responsible,
+                          StockTransactionHistory.TYPE_UPDATE_STOCK_COST, None)
+            return
+
         StockTransactionHistory(
             store=self.store,
             storable=self,
@@ -1933,6 +2139,178 @@ class StockTransactionHistory(Domain):
         return self.types[self.type] % number
 
 
+class StockMovementBatch(object):
+    """A queue of stock movements to be written at once
+
+    Creating a |stocktransactionhistory| requires flushing the store so
+    the database trigger can update the |productstockitem|, and then
+    reloading both of them. When moving the stock of a lot of items at
+    once, this queues the movements instead and writes them all in a single
+    multi-row ``INSERT`` on :meth:`.flush`. The trigger will still process
+    each of them, in the order they were added.
+
+    This should not be used directly. Use
+    :meth:`Storable.batch_stock_movements` instead.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._movements = []
+        self._stock_items = {}
+        self._quantities = {}
+        self._cost_changed = set()
+
+    def __len__(self):
+        return len(self._movements)
+
+    #
+    #  Private
+    #
+
+    def _get_key(self, storable, branch, batch):
+        return (storable.id, branch.id, batch and batch.id)
+
+    #
+    #  Public API
+    #
+
+    def get_stock_item(self, storable, branch, batch):
+        """Get the |productstockitem| for the given storable and branch
+
+        The stock item is only queried once for each one of them. Note that
+        its quantity will only be updated after :meth:`.flush`, use
+        :meth:`.get_quantity` to get the quantity taking the pending
+        movements in consideration.
+
+        If the cost of that stock item is going to be changed by one of the
+        pending movements, they will be flushed first so the returned stock
+        item has the right cost.
+
+        :param storable: a |storable|
+        :param branch: a |branch|
+        :param batch: a |storablebatch| or ``None``
+        :returns: the |productstockitem| or ``None`` if it doesn't exist
+        """
+        key = self._get_key(storable, branch, batch)
+        if key in self._cost_changed:
+            self.flush()
+
+        if key not in self._stock_items:
+            stock_item = storable.get_stock_item(branch, batch)
+            self._stock_items[key] = stock_item
+            self._quantities[key] = stock_item.quantity if stock_item else 0
+        return self._stock_items[key]
+
+    def preload_stock_items(self, storables, branch):
+        """Query the |productstockitems| of a lot of storables at once
+
+        Use this before moving the stock of a lot of storables, so
+        :meth:`.get_stock_item` doesn't need to query them one by one.
+
+        :param storables: a sequence of |storables|
+        :param branch: the |branch| of the stock items
+        """
+        storables = dict((storable.id, storable) for storable in storables)
+        stock_items = dict(((storable_id, branch.id, None), None)
+                           for storable_id, storable in storables.items()
+                           if not storable.is_batch)
+        if storables:
+            query = And(ProductStockItem.branch_id == branch.id,
+                        In(ProductStockItem.storable_id, list(storables)))
+            for stock_item in self.store.find(ProductStockItem, query):
+                key = (stock_item.storable_id, branch.id, stock_item.batch_id)
+                stock_items[key] = stock_item
+
+        for key, stock_item in stock_items.items():
+            if key in self._stock_items:
+                continue
+            self._stock_items[key] = stock_item
+            self._quantities[key] = stock_item.quantity if stock_item else 0
+
+    def get_quantity(self, storable, branch, batch):
+        """Get the stock quantity considering the pending movements
+
+        :param storable: a |storable|
+        :param branch: a |branch|
+        :param batch: a |storablebatch| or ``None``
+        :returns: the quantity the stock item will have after :meth:`.flush`
+        """
+        self.get_stock_item(storable, branch, batch)
+        return self._quantities[self._get_key(storable, branch, batch)]
+
+    def add(self, storable, branch, batch, quantity, unit_cost, user, type,
+            object_id):
+        """Queue a stock movement
+
+        See :meth:`Storable.increase_stock` and
+        :meth:`Storable.decrease_stock` for the meaning of the arguments.
+        Note that *quantity* should be negative when decreasing the stock.
+        """
+        self.get_stock_item(storable, branch, batch)
+        key = self._get_key(storable, branch, batch)
+
+        old_quantity = self._quantities[key]
+        self._quantities[key] = old_quantity + quantity
+        if ((quantity > 0 and unit_cost is not None) or
+                type == StockTransactionHistory.TYPE_UPDATE_STOCK_COST):
+            self._cost_changed.add(key)
+
+        self._movements.append(
+            (storable, branch, batch, quantity, unit_cost, user, type,
+             object_id, old_quantity))
+
+    def flush(self):
+        """Write all the pending movements to the database
+
+        The affected |productstockitems| are reloaded in a single query
+        and :class:`ProductStockUpdateEvent` is emitted for each movement.
+        """
+        movements = self._movements
+        stock_items = [i for i in self._stock_items.values() if i is not None]
+        self._movements = []
+        self._stock_items.clear()
+        self._quantities.clear()
+        self._cost_changed.clear()
+        if not movements:
+            return
+
+        # Make sure that everything the movements reference (e.g. a
+        # batch created just now) is already on the database
+        self.store.flush()
+
+        now = localnow()
+        columns = (StockTransactionHistory.date,
+                   StockTransactionHistory.storable_id,
+                   StockTransactionHistory.branch_id,
+                   StockTransactionHistory.batch_id,
+                   StockTransactionHistory.quantity,
+                   StockTransactionHistory.unit_cost,
+                   StockTransactionHistory.responsible_id,
+                   StockTransactionHistory.type,
+                   StockTransactionHistory.object_id)
+        values = [(now, storable.id, branch.id, batch and batch.id, quantity,
+                   unit_cost, user and user.id, type, object_id)
+                  for (storable, branch, batch, quantity, unit_cost, user,
+                       type, object_id, old_quantity) in movements]
+        self.store.execute(Insert(columns, table=StockTransactionHistory,
+                                  values=values))
+
+        # The trigger changed the stock items behind storm's back
+        for stock_item in stock_items:
+            autoreload_object(stock_item, obj_store=True)
+        if stock_items:
+            list(self.store.find(ProductStockItem,
+                                 In(ProductStockItem.id,
+                                    [i.id for i in stock_items])))
+
+        for (storable, branch, batch, quantity, unit_cost, user, type,
+             object_id, old_quantity) in movements:
+            if type == StockTransactionHistory.TYPE_UPDATE_STOCK_COST:
+                continue
+            ProductStockUpdateEvent.emit(storable.product, branch, old_quantity,
+                                         old_quantity + quantity)
+
+
 class ProductComponent(Domain):
     """A |product| and it's related |component| eg other product
 
@@ -42,7 +42,7 @@ from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.payment.payment import Payment
 from stoqlib.domain.person import LoginUser
 from stoqlib.domain.product import (ProductHistory, StockTransactionHistory,
-                                    StorableBatch)
+                                    Storable, StorableBatch)
 from stoqlib.domain.purchase import PurchaseOrder
 from stoqlib.domain.stockdecrease import StockDecreaseItem
 from stoqlib.lib.dateutils import localnow
@@ -272,8 +272,9 @@ class ReceivingOrder(IdentifiableDomain):
         if self.receiving_invoice:
             self.receiving_invoice.confirm(user)
 
-        for item in self.get_items():
-            item.add_stock_items(user)
+        with Storable.batch_stock_movements(self.store):
+            for item in self.get_items():
+                item.add_stock_items(user)
 
         purchases = list(self.purchase_orders)
         for purchase in purchases:
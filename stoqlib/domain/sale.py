@@ -34,14 +34,15 @@ from decimal import Decimal
 from kiwi.currency import currency
 from stoqlib.lib.objutils import Settable
 from stoqdrivers.enum import TaxType
-from storm.expr import (And, Avg, Count, LeftJoin, Join, Max, In,
+from storm.expr import (And, Avg, Count, LeftJoin, Join, Max, In, Neg, Not,
                         Or, Sum, Alias, Select, Cast, Eq, Coalesce, Ne)
 from storm.info import ClassAlias
 from storm.references import Reference, ReferenceSet
 from zope.interface import implementer
 
-from stoqlib.database.expr import (Concat, Date, Distinct, Field, NullIf,
-                                   Round, TransactionTimestamp)
+from stoqlib.database.expr import (Case, Concat, Date, Distinct, Field,
+                                   NullIf, Quantize, Round,
+                                   TransactionTimestamp)
 from stoqlib.database.properties import (UnicodeCol, DateTimeCol, IntCol,
                                          PriceCol, QuantityCol, IdentifierCol,
                                          IdCol, BoolCol, EnumCol, TimeCol)
@@ -67,13 +68,16 @@ from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.person import (Person, Client, Branch, LoginUser,
                                    SalesPerson, Company, Individual,
                                    ClientCategory)
-from stoqlib.domain.product import (Product, ProductHistory, Storable,
-                                    StockTransactionHistory, StorableBatch)
+from stoqlib.domain.product import (Product, ProductComponent, ProductHistory,
+                                    Storable, StockTransactionHistory,
+                                    StorableBatch)
 from stoqlib.domain.returnedsale import ReturnedSale, ReturnedSaleItem
 from stoqlib.domain.sellable import Sellable, SellableCategory
 from stoqlib.domain.service import Service
 from stoqlib.domain.station import BranchStation
-from stoqlib.domain.taxes import check_tax_info_presence, InvoiceItemIpi
+from stoqlib.domain.taxes import (check_tax_info_presence, InvoiceItemCofins,
+                                  InvoiceItemIcms, InvoiceItemIpi,
+                                  InvoiceItemPis)
 from stoqlib.exceptions import SellError, StockError, DatabaseInconsistency
 from stoqlib.lib.dateutils import localnow
 from stoqlib.lib.defaults import quantize, DECIMAL_PRECISION
@@ -1299,17 +1303,34 @@ class Sale(IdentifiableDomain):
         assert self.can_confirm()
         assert self.branch
 
-        for item in self.get_items():
-            self.validate_batch(item.batch, sellable=item.sellable)
-            if item.sellable.product:
-                ProductHistory.add_sold_item(self.store, self.branch, item)
-            item.sell(user)
-
-        self.total_amount = self.get_total_sale_amount()
+        items = self._get_items_to_confirm()
+        with Storable.batch_stock_movements(self.store) as movements:
+            movements.preload_stock_items(
+                [storable for item, product, service, storable in items
+                 if storable is not None], self.branch)
+            for item, product, service, storable in items:
+                self.validate_batch(item.batch, sellable=item.sellable,
+                                    storable=storable)
+            ProductHistory.add_sold_items(
+                self.store, self.branch,
+                [item for item, product, service, storable in items
+                 if product is not None])
+            for item, product, service, storable in items:
+                item.sell(user)
+
+        # Selling the items may have updated their taxes, and thus the total
+        subtotal = currency(sum(item.get_total()
+                                for item, product, service, storable in items))
+        self.total_amount = self.get_total_sale_amount(subtotal=subtotal)
 
         self.group.confirm()
         self._add_inpayments(till=till)
-        self._create_fiscal_entries(user)
+        self._create_fiscal_entries(
+            user, subtotal=subtotal,
+            products=[item for item, product, service, storable in items
+                      if product is not None],
+            services=[item for item, product, service, storable in items
+                      if service is not None])
 
         # Save operation_nature and branch in Invoice table.
         self.invoice.branch = self.branch
@@ -1348,12 +1369,12 @@ class Sale(IdentifiableDomain):
                         u"confirmed with value {total_value:.2f}.").format(
                     sale_number=self.identifier,
                     client_name=self.client.person.name,
-                    total_value=self.get_total_sale_amount())
+                    total_value=self.total_amount)
             else:
                 msg = _(u"Sale {sale_number} without a client was "
                         u"confirmed with value {total_value:.2f}.").format(
                     sale_number=self.identifier,
-                    total_value=self.get_total_sale_amount())
+                    total_value=self.total_amount)
             Event.log(self.store, Event.TYPE_SALE, msg)
 
         StockOperationConfirmedEvent.emit(self, old_status)
@@ -1573,35 +1594,50 @@ class Sale(IdentifiableDomain):
         """Fetch the subtotal for the sale, eg the sum of the
         prices for of all items.
 
+        This is the sum of :meth:`SaleItem.get_total` for all items, but
+        calculated by the database in a single query.
+
         :returns: subtotal
         """
-        total = 0
-        for sale_item in self.get_items():
-            total += sale_item.get_total()
-
-        return currency(total)
+        tables = [SaleItem,
+                  LeftJoin(InvoiceItemIpi,
+                           InvoiceItemIpi.id == SaleItem.ipi_info_id)]
+        item_total = Quantize(SaleItem.price * SaleItem.quantity +
+                              Coalesce(InvoiceItemIpi.v_ipi, 0))
+        total = self.store.using(*tables).find(
+            SaleItem, SaleItem.sale_id == self.id).sum(item_total)
+        return currency(total or 0)
 
     def get_sale_base_subtotal(self):
         """Get the base subtotal of items
 
         Just a helper that, unlike :meth:`.get_sale_subtotal`, will
-        return the total based on item's base price.
+        return the total based on item's base price. Components of a
+        package are summed using their price on the |productcomponent|
+        and the package itself is not summed.
 
         :returns: the base subtotal
         """
-        items = self.get_items()
-        subtotal = 0
-        for item in items:
-            sellable = item.sellable
-            if sellable.product and sellable.product.is_package:
+        ParentItem = ClassAlias(SaleItem, 'parent_item')
+        component_price = Select(
+            ProductComponent.price,
+            where=And(ProductComponent.product_id == ParentItem.sellable_id,
+                      ProductComponent.component_id == SaleItem.sellable_id),
+            tables=ProductComponent, limit=1)
+        tables = [SaleItem,
+                  LeftJoin(Product, Product.id == SaleItem.sellable_id),
+                  LeftJoin(ParentItem,
+                           ParentItem.id == SaleItem.parent_item_id)]
+        item_subtotal = Quantize(
+            SaleItem.quantity * Case(condition=Eq(ParentItem.id, None),
+                                     result=SaleItem.base_price,
+                                     else_=component_price))
+        subtotal = self.store.using(*tables).find(
+            SaleItem,
+            And(SaleItem.sale_id == self.id,
                 # We should not sum package_product
-                continue
-            if item.parent_item:
-                component = item.get_component(item.parent_item)
-                subtotal += quantize(item.quantity * component.price)
-            else:
-                subtotal += quantize(item.quantity * item.base_price)
-        return currency(subtotal)
+                Not(Coalesce(Product.is_package, False)))).sum(item_subtotal)
+        return currency(subtotal or 0)
 
     def get_items_total_quantity(self):
         """Fetches the total number of items in the sale
@@ -1615,17 +1651,19 @@ class Sale(IdentifiableDomain):
 
         :returns: the total amount paid
         """
-        total_paid = 0
-        for payment in self.group.get_valid_payments():
-            if payment.is_inpayment() and payment.is_paid():
-                # Already paid by client. Value instead of paid_value as the
-                # second might have penalties and discounts not applicable here
-                total_paid += payment.value
-            elif payment.is_outpayment():
-                # Already returned to client
-                total_paid -= payment.value
-
-        return currency(total_paid)
+        is_outpayment = Payment.payment_type == Payment.TYPE_OUT
+        query = And(Payment.group_id == self.group_id,
+                    Payment.status != Payment.STATUS_CANCELLED,
+                    # Already paid by client or already returned to client
+                    Or(And(Payment.payment_type == Payment.TYPE_IN,
+                           Payment.status == Payment.STATUS_PAID),
+                       is_outpayment))
+        # Value instead of paid_value as the second might have penalties and
+        # discounts not applicable here
+        total_paid = self.store.find(Payment, query).sum(
+            Case(condition=is_outpayment, result=Neg(Payment.value),
+                 else_=Payment.value))
+        return currency(total_paid or 0)
 
     def get_total_to_pay(self):
         """Missing payment value for this sale.
@@ -2095,6 +2133,31 @@ class Sale(IdentifiableDomain):
                 continue
             till.add_entry(payment)
 
+    def _get_items_to_confirm(self):
+        # Load the items together with everything needed to confirm them
+        # in a single query, instead of a few queries for each item
+        tables = [SaleItem,
+                  Join(Sellable, Sellable.id == SaleItem.sellable_id),
+                  LeftJoin(Product, Product.id == Sellable.id),
+                  LeftJoin(Service, Service.id == Sellable.id),
+                  LeftJoin(Storable, Storable.id == Sellable.id),
+                  LeftJoin(StorableBatch, StorableBatch.id == SaleItem.batch_id),
+                  LeftJoin(InvoiceItemIcms,
+                           InvoiceItemIcms.id == SaleItem.icms_info_id),
+                  LeftJoin(InvoiceItemIpi,
+                           InvoiceItemIpi.id == SaleItem.ipi_info_id),
+                  LeftJoin(InvoiceItemPis,
+                           InvoiceItemPis.id == SaleItem.pis_info_id),
+                  LeftJoin(InvoiceItemCofins,
+                           InvoiceItemCofins.id == SaleItem.cofins_info_id)]
+        results = self.store.using(*tables).find(
+            (SaleItem, Product, Service, Storable, StorableBatch,
+             InvoiceItemIcms, InvoiceItemIpi, InvoiceItemPis,
+             InvoiceItemCofins),
+            SaleItem.sale_id == self.id).order_by(SaleItem.te_id)
+        return [(item, product, service, storable)
+                for item, product, service, storable, *_ in results]
+
     def _create_commission_at_confirm(self):
         return sysparam.get_bool('SALE_PAY_COMMISSION_WHEN_CONFIRMED')
 
@@ -2117,16 +2180,20 @@ class Sale(IdentifiableDomain):
         """
         return currency(0)
 
-    def _get_icms_total(self, av_difference):
+    def _get_icms_total(self, av_difference, products=None):
         """A Brazil-specific method
         Calculates the icms total value
 
         :param av_difference: the average difference for the sale items.
                               it means the average discount or surcharge
                               applied over all sale items
+        :param products: the sale items containing products, pass this
+           to avoid querying them again
         """
+        if products is None:
+            products = self.products
         icms_total = Decimal(0)
-        for item in self.products:
+        for item in products:
             price = item.price + av_difference
             sellable = item.sellable
             tax_constant = sellable.get_tax_constant()
@@ -2137,22 +2204,26 @@ class Sale(IdentifiableDomain):
 
         return icms_total
 
-    def _get_iss_total(self, av_difference):
+    def _get_iss_total(self, av_difference, services=None):
         """A Brazil-specific method
         Calculates the iss total value
 
         :param av_difference: the average difference for the sale items.
                               it means the average discount or surcharge
                               applied over all sale items
+        :param services: the sale items containing services, pass this
+           to avoid querying them again
         """
+        if services is None:
+            services = self.services
         iss_total = Decimal(0)
         iss_tax = sysparam.get_decimal('ISS_TAX') / Decimal(100)
-        for item in self.services:
+        for item in services:
             price = item.price + av_difference
             iss_total += iss_tax * quantize(price * item.quantity)
         return iss_total
 
-    def _get_average_difference(self):
+    def _get_average_difference(self, subtotal=None):
         if self.get_items().is_empty():
             raise DatabaseInconsistency(
                 _(u"Sale orders must have items, which means products or "
@@ -2164,9 +2235,10 @@ class Sale(IdentifiableDomain):
         # If there is a discount or a surcharge applied in the whole total
         # sale amount, we must share it between all the item values
         # otherwise the icms and iss won't be calculated properly
-        total = (self.get_total_sale_amount() -
+        if subtotal is None:
+            subtotal = self.get_sale_subtotal()
+        total = (self.get_total_sale_amount(subtotal=subtotal) -
                  self._get_pm_commission_total())
-        subtotal = self.get_sale_subtotal()
         return (total - subtotal) / total_quantity
 
     def _get_iss_entry(self):
@@ -2174,7 +2246,8 @@ class Sale(IdentifiableDomain):
             self.store, self.group,
             FiscalBookEntry.TYPE_SERVICE)
 
-    def _create_fiscal_entries(self, user: LoginUser):
+    def _create_fiscal_entries(self, user: LoginUser, subtotal=None,
+                               products=None, services=None):
         """A Brazil-specific method
         Create new ICMS and ISS entries in the fiscal book
         for a given sale.
@@ -2182,20 +2255,28 @@ class Sale(IdentifiableDomain):
         Important: freight and interest are not part of the base value for
         ICMS. Only product values and surcharge which applies increasing the
         product totals are considered here.
+
+        :param subtotal: pre calculated subtotal
+        :param products: the sale items containing products
+        :param services: the sale items containing services
         """
-        av_difference = self._get_average_difference()
+        if products is None:
+            products = list(self.products)
+        if services is None:
+            services = list(self.services)
+        av_difference = self._get_average_difference(subtotal=subtotal)
 
-        if not self.products.is_empty():
+        if products:
             FiscalBookEntry.create_product_entry(
                 self.store, self.branch, user,
                 self.group, self.cfop, self.coupon_id,
-                self._get_icms_total(av_difference))
+                self._get_icms_total(av_difference, products=products))
 
-        if not self.services.is_empty() and self.service_invoice_number:
+        if services and self.service_invoice_number:
             FiscalBookEntry.create_service_entry(
                 self.store, self.branch, user,
                 self.group, self.cfop, self.service_invoice_number,
-                self._get_iss_total(av_difference))
+                self._get_iss_total(av_difference, services=services))
 
 
 class SaleToken(Domain):
@@ -37,10 +37,12 @@ or a |service|.
 
 import collections
 from decimal import Decimal
+import datetime
+import time
 
 from kiwi.currency import currency
 from stoqdrivers.enum import TaxType, UnitType
-from storm.expr import And, Or, In, Eq
+from storm.expr import And, Or, In, Eq, Join, LeftJoin, Lower, Select, Union
 from storm.references import Reference, ReferenceSet
 from zope.interface import implementer
 
@@ -53,6 +55,7 @@ from stoqlib.domain.events import (CategoryCreateEvent, CategoryEditEvent,
 from stoqlib.domain.interfaces import IDescribable
 from stoqlib.domain.image import Image
 from stoqlib.domain.overrides import SellableBranchOverride
+from stoqlib.domain.system import TransactionEntry
 from stoqlib.exceptions import SellableError, TaxError
 from stoqlib.lib.defaults import quantize
 from stoqlib.lib.dateutils import localnow
@@ -1079,3 +1082,198 @@ class Sellable(Domain):
 
         query = cls.get_unblocked_sellables_query(store)
         return And(query, Or(*queries))
+
+
+class SellableCodeIndex(object):
+    """An in memory index of sellables' barcodes, codes and batch numbers
+
+    Scanning an item on the |pos| (or typing its code on a wizard) used to
+    run up to three queries. This index maps the lowercased barcodes, codes
+    and batch numbers to their objects' ids, so a scan can be resolved
+    without going to the database most of the time.
+
+    The index is loaded once per station (see :meth:`.load`) and kept fresh
+    incrementally by looking at the objects whose
+    |transactionentry| changed since the last refresh.
+
+    Note that the index only stores ids. The objects it points to are
+    always checked against the store before being returned, so an out of
+    date entry will never resolve to the wrong item. When nothing in the
+    index matches, a single query is used to look the text up in the database.
+    """
+
+    _SINGLETON = None
+
+    #: Seconds between incremental refreshes done by :meth:`.lookup`
+    refresh_interval = 30
+
+    #: Objects are refreshed if their |transactionentry| changed up to this
+    #: much before the last refresh, since a transaction that was still open
+    #: when we refreshed may have been committed later
+    refresh_overlap = datetime.timedelta(minutes=5)
+
+    def __init__(self):
+        self.clear()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._SINGLETON is None:
+            cls._SINGLETON = cls()
+        return cls._SINGLETON
+
+    #
+    #  Private
+    #
+
+    def _get_db_time(self, store):
+        # te_time is a timestamp without timezone, like LOCALTIMESTAMP
+        return store.execute('SELECT LOCALTIMESTAMP').get_one()[0]
+
+    def _add(self, index, key, value):
+        if not key:
+            return
+        key = key.lower()
+        values = index.get(key, ())
+        if value not in values:
+            index[key] = values + (value, )
+
+    def _add_sellable(self, sellable_id, barcode, code):
+        self._add(self._barcodes, barcode, sellable_id)
+        self._add(self._codes, code, sellable_id)
+
+    def _add_batch(self, batch_id, storable_id, batch_number):
+        # Storable.id is the same as Product.id, which is the same as Sellable.id
+        self._add(self._batches, batch_number, (batch_id, storable_id))
+
+    def _load_rows(self, store, since=None):
+        from stoqlib.domain.product import StorableBatch
+
+        sellables = store.using(
+            Sellable, Join(TransactionEntry, TransactionEntry.id == Sellable.te_id))
+        batches = store.using(
+            StorableBatch, Join(TransactionEntry, TransactionEntry.id == StorableBatch.te_id))
+        query = None if since is None else TransactionEntry.te_time > since
+
+        for row in sellables.find((Sellable.id, Sellable.barcode, Sellable.code), query):
+            self._add_sellable(*row)
+        for row in batches.find((StorableBatch.id, StorableBatch.storable_id,
+                                 StorableBatch.batch_number), query):
+            self._add_batch(*row)
+
+    def _resolve(self, store, key, accept):
+        from stoqlib.domain.product import StorableBatch
+
+        # First try barcode, then code since there might be a product
+        # with a code equal to another product's barcode
+        for index, attr in [(self._barcodes, 'barcode'), (self._codes, 'code')]:
+            for sellable_id in index.get(key, ()):
+                sellable = store.get(Sellable, sellable_id)
+                if (sellable is not None and
+                        (getattr(sellable, attr) or u'').lower() == key and
+                        accept(sellable)):
+                    return sellable, None
+
+        for batch_id, storable_id in self._batches.get(key, ()):
+            batch = store.get(StorableBatch, batch_id)
+            if batch is None or batch.batch_number.lower() != key:
+                continue
+            sellable = store.get(Sellable, batch.storable_id)
+            if sellable is not None and accept(sellable):
+                return sellable, batch
+
+        return None
+
+    def _fetch(self, store, key):
+        from stoqlib.domain.product import StorableBatch
+
+        ids = Union(
+            Select(Sellable.id, Lower(Sellable.barcode) == key, tables=[Sellable]),
+            Select(Sellable.id, Lower(Sellable.code) == key, tables=[Sellable]),
+            Select(StorableBatch.storable_id, Lower(StorableBatch.batch_number) == key,
+                   tables=[StorableBatch]),
+            all=True)
+        tables = [
+            Sellable,
+            LeftJoin(StorableBatch,
+                     And(StorableBatch.storable_id == Sellable.id,
+                         Lower(StorableBatch.batch_number) == key)),
+        ]
+        for sellable, batch in store.using(*tables).find(
+                (Sellable, StorableBatch), Sellable.id.is_in(ids)):
+            self._add_sellable(sellable.id, sellable.barcode, sellable.code)
+            if batch is not None:
+                self._add_batch(batch.id, batch.storable_id, batch.batch_number)
+
+    #
+    #  Public API
+    #
+
+    def is_loaded(self):
+        """If the index was already loaded
+
+        :returns: ``True`` if :meth:`.load` was called, ``False`` otherwise
+        """
+        return self._last_te_time is not None
+
+    def clear(self):
+        """Remove everything from the index"""
+        self._barcodes = {}
+        self._codes = {}
+        self._batches = {}
+        self._last_te_time = None
+        self._last_refresh = None
+
+    def load(self, store):
+        """Load all the sellables and batches into the index
+
+        :param store: a store
+        """
+        self.clear()
+        now = self._get_db_time(store)
+        self._load_rows(store)
+        self._last_te_time = now
+        self._last_refresh = time.monotonic()
+
+    def refresh(self, store):
+        """Update the index with the objects changed since the last refresh
+
+        If the index was not loaded yet, it will be fully loaded.
+
+        :param store: a store
+        """
+        if not self.is_loaded():
+            self.load(store)
+            return
+
+        now = self._get_db_time(store)
+        self._load_rows(store, since=self._last_te_time - self.refresh_overlap)
+        self._last_te_time = now
+        self._last_refresh = time.monotonic()
+
+    def lookup(self, store, text, accept=None):
+        """Find a sellable given its barcode, code or batch number
+
+        The text is compared case insensitively with, in this order, the
+        barcode, the code and the batch number of the sellables.
+
+        :param store: a store
+        :param text: the barcode, code or batch number
+        :param accept: a callable that receives a |sellable| and returns
+          ``True`` if it can be returned, or ``None`` to accept any sellable
+        :returns: a tuple with the |sellable| and the |storablebatch| found
+          (``None`` if the text was not a batch number) or
+          ``(None, None)`` if nothing was found
+        """
+        if accept is None:
+            accept = lambda sellable: True
+        key = text.lower()
+
+        if (self.is_loaded() and
+                time.monotonic() - self._last_refresh > self.refresh_interval):
+            self.refresh(store)
+
+        found = self._resolve(store, key, accept)
+        if found is None:
+            self._fetch(store, key)
+            found = self._resolve(store, key, accept)
+        return found or (None, None)
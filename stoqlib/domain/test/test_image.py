@@ -24,6 +24,9 @@
 
 __tests__ = 'stoqlib/domain/image.py'
 
+import hashlib
+from unittest import mock
+
 from stoqlib.domain.image import Image
 from stoqlib.domain.test.domaintest import DomainTest
 from stoqlib.domain.events import (ImageCreateEvent, ImageEditEvent)
@@ -40,6 +43,37 @@ class TestImage(DomainTest):
         # the second argument is the string 'teste' with base64 encoding
         self.assertEqual(image.get_base64_encoded(), 'dGVzdGU=')
 
+    def test_content(self):
+        image = self.create_image()
+        self.assertIsNone(image.image)
+        self.assertIsNone(image.image_md5sum)
+
+        image.image = b'image'
+        image.thumbnail = b'thumbnail'
+        self.assertEqual(image.image_md5sum, hashlib.md5(b'image').hexdigest())
+        self.assertEqual(image.image, b'image')
+        self.store.flush()
+
+        # Loading the image should not load its contents
+        self.store.invalidate(image)
+        with mock.patch('stoqlib.domain.image.get_image_cache') as get_image_cache:
+            get_image_cache.return_value.get.return_value = None
+            self.assertEqual(image.thumbnail_md5sum,
+                             hashlib.md5(b'thumbnail').hexdigest())
+            self.assertEqual(image.image, b'image')
+            get_image_cache.return_value.put.assert_called_once_with(
+                image.image_md5sum, b'image')
+
+            # The next time it comes from the cache
+            get_image_cache.return_value.get.return_value = b'cached'
+            self.assertEqual(image.image, b'cached')
+
+        image.thumbnail = None
+        self.store.flush()
+        self.store.invalidate(image)
+        self.assertIsNone(image.thumbnail_md5sum)
+        self.assertIsNone(image.thumbnail)
+
     def test_get_description(self):
         image = self.create_image()
         image.description = u'Test test'
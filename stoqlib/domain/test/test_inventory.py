@@ -22,6 +22,7 @@
 ## Author(s): Stoq Team <stoq-devel@async.com.br>
 ##
 from decimal import Decimal
+from unittest import mock
 
 from kiwi.currency import currency
 
@@ -105,6 +106,34 @@ class TestInventory(DomainTest):
         self.assertEqual(set(i[4] for i in data),
                          set([None, batch1, batch2]))
 
+    def test_create_inventory_progress(self):
+        branch = self.create_branch()
+        cat = self.create_sellable_category()
+        storables = []
+        for i in range(3):
+            storable = self.create_storable(branch=branch, stock=i + 1)
+            storable.product.sellable.category = cat
+            storables.append(storable)
+        # Another category, it should not be in the inventory
+        self.create_storable(branch=branch, stock=1)
+
+        progress = []
+        with mock.patch.object(Inventory, 'chunk_size', 2):
+            inventory = Inventory.create_inventory(
+                self.store, branch, self.current_station, self.create_user(),
+                Sellable.category == cat,
+                progress_callback=lambda *args: progress.append(args))
+        self.assertEqual(progress, [(2, 3), (3, 3)])
+
+        items = inventory.get_items()
+        self.assertEqual(
+            set((i.product, i.batch, i.recorded_quantity, i.product_cost,
+                 i.reason, i.is_adjusted) for i in items),
+            set((s.product, None, i + 1, s.product.sellable.cost, u'', False)
+                for i, s in enumerate(storables)))
+        # Each item has its own transaction entry
+        self.assertEqual(len(set(i.te_id for i in items)), 3)
+
     def test_add_product(self):
         inventory = self.create_inventory()
         sellable = self.create_sellable()
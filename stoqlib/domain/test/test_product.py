@@ -25,16 +25,17 @@
 from decimal import Decimal
 
 from storm.exceptions import NotOneError
+from storm.expr import Update
 
 from stoqlib.exceptions import StockError
 from stoqlib.database.runtime import new_store
 from stoqlib.domain.events import (ProductCreateEvent, ProductEditEvent,
-                                   ProductRemoveEvent)
+                                   ProductRemoveEvent, ProductStockUpdateEvent)
 from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.payment.payment import Payment
 from stoqlib.domain.person import Branch
 from stoqlib.domain.product import (ProductSupplierInfo, Product,
-                                    ProductStockItem,
+                                    ProductStockItem, ProductStockSummary,
                                     ProductHistory, ProductComponent,
                                     ProductQualityTest, Storable,
                                     StorableBatch, StorableBatchView,
@@ -1356,6 +1357,142 @@ class TestStorable(DomainTest):
             set([(StockTransactionHistory.TYPE_INITIAL, 50),
                  (StockTransactionHistory.TYPE_UPDATE_STOCK_COST, 100)]))
 
+    def test_batch_stock_movements(self):
+        storable = self.create_storable()
+        b1 = self.create_branch()
+        b2 = self.create_branch()
+        storable.increase_stock(10, b1, StockTransactionHistory.TYPE_INITIAL,
+                                None, self.current_user, unit_cost=10)
+        stock_item = storable.get_stock_item(b1, None)
+
+        emitted = []
+
+        def on_stock_update(product, branch, old_quantity, new_quantity):
+            emitted.append((branch, old_quantity, new_quantity))
+
+        ProductStockUpdateEvent.connect(on_stock_update)
+        try:
+            with Storable.batch_stock_movements(self.store) as movements:
+                storable.decrease_stock(4, b1, StockTransactionHistory.TYPE_SELL,
+                                        None, self.current_user)
+                storable.decrease_stock(6, b1, StockTransactionHistory.TYPE_SELL,
+                                        None, self.current_user)
+                storable.increase_stock(5, b2, StockTransactionHistory.TYPE_INITIAL,
+                                        None, self.current_user, unit_cost=20)
+                self.assertEqual(len(movements), 3)
+                # Nothing was written yet
+                self.assertEqual(stock_item.quantity, 10)
+                self.assertIsNone(storable.get_stock_item(b2, None))
+                self.assertEqual(emitted, [])
+                # The pending movements are considered for the validation
+                with self.assertRaises(StockError):
+                    storable.decrease_stock(1, b1, StockTransactionHistory.TYPE_SELL,
+                                            None, self.current_user)
+        finally:
+            ProductStockUpdateEvent.disconnect(on_stock_update)
+
+        self.assertEqual(len(movements), 0)
+        self.assertEqual(stock_item.quantity, 0)
+        self.assertEqual(stock_item.stock_cost, 10)
+        self.assertEqual(storable.get_balance_for_branch(b2), 5)
+        self.assertEqual(storable.get_stock_item(b2, None).stock_cost, 20)
+        self.assertEqual(emitted, [(b1, 10, 6), (b1, 6, 0), (b2, 0, 5)])
+        self.assertEqual(
+            sorted(t.quantity for t in stock_item.transactions), [-6, -4, 10])
+
+    def test_batch_stock_movements_cost(self):
+        storable = self.create_storable()
+        branch = self.create_branch()
+        storable.increase_stock(10, branch, StockTransactionHistory.TYPE_INITIAL,
+                                None, self.current_user, unit_cost=10)
+
+        with Storable.batch_stock_movements(self.store):
+            storable.increase_stock(10, branch,
+                                    StockTransactionHistory.TYPE_RECEIVED_PURCHASE,
+                                    None, self.current_user, unit_cost=20)
+            # The increase above changes the cost, so it will be written
+            # before the decrease to get the right cost
+            stock_item = storable.decrease_stock(
+                5, branch, StockTransactionHistory.TYPE_SELL, None,
+                self.current_user)
+            self.assertEqual(stock_item.stock_cost, 15)
+
+        self.assertEqual(stock_item.quantity, 15)
+        self.assertEqual(stock_item.stock_cost, 15)
+
+    def test_batch_stock_movements_error(self):
+        storable = self.create_storable()
+        branch = self.create_branch()
+
+        with self.assertRaises(ValueError):
+            with Storable.batch_stock_movements(self.store):
+                storable.increase_stock(10, branch,
+                                        StockTransactionHistory.TYPE_INITIAL,
+                                        None, self.current_user)
+                raise ValueError
+
+        self.assertIsNone(storable.get_stock_item(branch, None))
+
+
+class TestProductStockSummary(DomainTest):
+
+    def _get_summary(self, storable, branch):
+        return self.store.find(ProductStockSummary, storable=storable,
+                               branch=branch).one()
+
+    def test_stock_changes(self):
+        b1 = self.create_branch()
+        b2 = self.create_branch()
+        storable = self.create_storable(is_batch=True)
+        self.assertIsNone(self._get_summary(storable, b1))
+
+        storable.register_initial_stock(10, b1, unit_cost=2, user=self.current_user,
+                                        batch_number=u'1')
+        storable.register_initial_stock(5, b1, unit_cost=4, user=self.current_user,
+                                        batch_number=u'2')
+        storable.register_initial_stock(3, b2, unit_cost=1, user=self.current_user,
+                                        batch_number=u'3')
+        self.store.flush()
+
+        summary = self._get_summary(storable, b1)
+        self.assertEqual(summary.quantity, 15)
+        self.assertEqual(summary.total_cost, 40)
+        summary = self._get_summary(storable, b2)
+        self.assertEqual(summary.quantity, 3)
+        self.assertEqual(summary.total_cost, 3)
+
+        batch = self.store.find(StorableBatch, storable=storable,
+                                batch_number=u'1').one()
+        storable.decrease_stock(4, b1, StockTransactionHistory.TYPE_INITIAL,
+                                None, self.current_user, batch=batch)
+        self.store.flush()
+        self.store.invalidate()
+        summary = self._get_summary(storable, b1)
+        self.assertEqual(summary.quantity, 11)
+        self.assertEqual(summary.total_cost, 32)
+
+        # Removing the last stock item should remove the summary too
+        self.store.find(StockTransactionHistory, storable=storable,
+                        branch=b2).remove()
+        self.store.find(ProductStockItem, storable=storable, branch=b2).remove()
+        self.assertIsNone(self._get_summary(storable, b2))
+        self.assertEqual(ProductStockSummary.check_consistency(self.store), [])
+
+    def test_check_consistency(self):
+        branch = self.create_branch()
+        storable = self.create_storable(branch=branch, stock=10, unit_cost=2)
+        self.store.flush()
+        self.assertEqual(ProductStockSummary.check_consistency(self.store), [])
+
+        self.store.execute(Update({ProductStockSummary.quantity: 7},
+                                  ProductStockSummary.storable_id == storable.id,
+                                  ProductStockSummary))
+        self.assertEqual(ProductStockSummary.check_consistency(self.store),
+                         [(storable.id, branch.id, 7, 10, 20, 20)])
+
+        ProductStockSummary.rebuild(self.store)
+        self.assertEqual(ProductStockSummary.check_consistency(self.store), [])
+
 
 class TestStorableBatch(DomainTest):
 
@@ -40,7 +40,8 @@ from stoqlib.domain.fiscal import FiscalBookEntry
 from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.payment.payment import Payment, PaymentChangeHistory
 from stoqlib.domain.person import LoginUser
-from stoqlib.domain.product import StockTransactionHistory, Storable
+from stoqlib.domain.product import (ProductHistory, StockTransactionHistory,
+                                    Storable)
 from stoqlib.domain.returnedsale import ReturnedSaleItem
 from stoqlib.domain.sale import (ClientsWithSaleView, Delivery,
                                  ReturnedSaleItemsView, ReturnedSaleView, Sale,
@@ -584,6 +585,37 @@ class TestSale(DomainTest):
         self.assertEqual(storable3.get_balance_for_branch(branch),
                          stock3 - 10)
 
+    def test_confirm_many_items(self):
+        sale = self.create_sale()
+        branch = sale.branch
+        sellables = [self.add_product(sale, price=10, quantity=i + 1)
+                     for i in range(5)]
+        service = self.create_service()
+        sale.add_sellable(service.sellable, quantity=1, price=15)
+        sale.order(self.current_user)
+        self.add_payments(sale)
+
+        stocks = [s.product_storable.get_balance_for_branch(branch)
+                  for s in sellables]
+        sale.confirm(self.current_user)
+
+        self.assertEqual(sale.total_amount, 165)
+        for i, sellable in enumerate(sellables):
+            self.assertEqual(
+                sellable.product_storable.get_balance_for_branch(branch),
+                stocks[i] - (i + 1))
+            history = self.store.find(ProductHistory, sellable=sellable).one()
+            self.assertEqual(history.quantity_sold, i + 1)
+            self.assertEqual(history.branch, branch)
+        # Services don't have any history
+        self.assertTrue(self.store.find(ProductHistory,
+                                        sellable=service.sellable).is_empty())
+
+        book_entry = self.store.find(FiscalBookEntry,
+                                     entry_type=FiscalBookEntry.TYPE_PRODUCT,
+                                     payment_group=sale.group).one()
+        self.assertEqual(book_entry.icms_value, Decimal("27"))
+
     def test_pay(self):
         sale = self.create_sale()
         self.assertFalse(sale.can_set_paid())
@@ -1739,6 +1771,38 @@ class TestSale(DomainTest):
         self.add_payments(item.sale)
         self.assertEqual(item.sale.get_total_to_pay(), 100)
 
+    def test_get_sale_subtotal_rounding(self):
+        sale = self.create_sale()
+        # Half values are rounded to the nearest even number, like
+        # Decimal.quantize does: 0.125 -> 0.12, 0.375 -> 0.38
+        for price, quantity in [(Decimal('0.25'), Decimal('0.5')),
+                                (Decimal('0.75'), Decimal('0.5')),
+                                (Decimal('10.01'), Decimal('1.333'))]:
+            sellable = self.create_sellable(price=price)
+            item = sale.add_sellable(sellable, quantity=quantity)
+            item.base_price = price
+
+        expected = sum(item.get_total() for item in sale.get_items())
+        self.assertEqual(expected, Decimal('13.84'))
+        self.assertEqual(sale.get_sale_subtotal(), expected)
+        self.assertEqual(sale.get_sale_base_subtotal(), expected)
+
+    def test_get_sale_base_subtotal_package(self):
+        sale = self.create_sale()
+        package = self.create_product(price=10, is_package=True)
+        component = self.create_product(price=3)
+        self.create_product_component(product=package, component=component,
+                                      component_quantity=2, price=4)
+        parent = sale.add_sellable(package.sellable, quantity=1)
+        sale.add_sellable(component.sellable, quantity=2, price=4,
+                          parent=parent)
+        other = sale.add_sellable(self.create_sellable(price=5), quantity=3)
+        other.base_price = 7
+
+        # The package itself is not summed, its components use their price
+        # on the package instead of their base price
+        self.assertEqual(sale.get_sale_base_subtotal(), 8 + 21)
+
     def test_set_items_discount(self):
         sale = self.create_sale()
         sale_item1 = sale.add_sellable(self.store.find(Sellable, code=u'01').one())
@@ -37,7 +37,7 @@ from stoqlib.domain.sellable import (Sellable,
                                      SellableCategory,
                                      SellableUnit,
                                      SellableTaxConstant,
-                                     ClientCategoryPrice)
+                                     ClientCategoryPrice, SellableCodeIndex)
 from stoqlib.domain.taxes import ProductTaxTemplate, ProductIcmsTemplate
 from stoqlib.domain.test.domaintest import DomainTest
 from stoqlib.domain.views import (ProductFullStockView,
@@ -942,3 +942,56 @@ class TestSellable(DomainTest):
         for prop in props:
             # Checking that all attributes have the same value
             self.assertEqual(getattr(sellable, prop), getattr(new_sellable, prop))
+
+
+class TestSellableCodeIndex(DomainTest):
+
+    def test_lookup(self):
+        index = SellableCodeIndex()
+        sellable = self.create_sellable(code=u'Code1')
+        sellable.barcode = u'7891234'
+        other = self.create_sellable(code=u'7891234')
+        batch = self.create_storable_batch(
+            storable=self.create_storable(product=other.product), batch_number=u'Lot1')
+
+        # The barcode has precedence over the code
+        self.assertEqual(index.lookup(self.store, u'7891234'), (sellable, None))
+        self.assertEqual(index.lookup(self.store, u'code1'), (sellable, None))
+        self.assertEqual(index.lookup(self.store, u'LOT1'), (other, batch))
+        self.assertEqual(index.lookup(self.store, u'xxx'), (None, None))
+
+        accept = lambda s: s is not sellable
+        self.assertEqual(index.lookup(self.store, u'7891234', accept=accept),
+                         (other, None))
+        self.assertEqual(index.lookup(self.store, u'code1', accept=accept),
+                         (None, None))
+
+    def test_lookup_in_memory(self):
+        index = SellableCodeIndex()
+        sellable = self.create_sellable(code=u'Code1')
+        self.store.flush()
+        index.load(self.store)
+        self.assertTrue(index.is_loaded())
+
+        with mock.patch.object(index, '_fetch') as fetch:
+            self.assertEqual(index.lookup(self.store, u'CODE1'), (sellable, None))
+            self.assertEqual(fetch.call_count, 0)
+
+        # The index is out of date, but the sellable is not returned anymore
+        sellable.code = u'Code2'
+        self.assertEqual(index.lookup(self.store, u'code1'), (None, None))
+        self.assertEqual(index.lookup(self.store, u'code2'), (sellable, None))
+
+    def test_refresh(self):
+        index = SellableCodeIndex()
+        index.load(self.store)
+        sellable = self.create_sellable(code=u'Code1')
+        self.store.flush()
+
+        index.refresh(self.store)
+        with mock.patch.object(index, '_fetch') as fetch:
+            self.assertEqual(index.lookup(self.store, u'code1'), (sellable, None))
+            self.assertEqual(fetch.call_count, 0)
+
+        index.clear()
+        self.assertFalse(index.is_loaded())
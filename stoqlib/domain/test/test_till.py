@@ -30,6 +30,7 @@ from unittest import mock
 from kiwi.currency import currency
 
 from stoqlib.exceptions import TillError
+from stoqlib.domain.payment.card import CreditCardData, CreditProvider
 from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.payment.payment import Payment
 from stoqlib.domain.till import Till, TillEntry
@@ -202,6 +203,26 @@ class TestTill(DomainTest):
         till.add_credit_entry(currency(5), u"")
         self.assertEqual(till.get_debits_total(), old - 10)
 
+    def test_get_balance_summary(self):
+        till = Till(store=self.store,
+                    branch=self.current_branch,
+                    station=self.create_station())
+        till.open_till(self.current_user)
+        till.initial_cash_amount = 100
+
+        till.add_credit_entry(currency(10), u"")
+        till.add_debit_entry(currency(5), u"")
+        # non-money operations are not on the cash amount
+        till.add_entry(self._create_inpayment())
+
+        summary = till.get_balance_summary()
+        self.assertEqual(summary.initial_cash_amount, 100)
+        self.assertEqual(summary.cash_amount, 105)
+        self.assertEqual(summary.credits_total, till.get_credits_total())
+        self.assertEqual(summary.debits_total, -5)
+        self.assertEqual(summary.balance, 100 + summary.credits_total - 5)
+        self.assertEqual(summary.balance, till.get_balance())
+
     def test_till_open_yesterday(self):
         yesterday = localnow() - datetime.timedelta(1)
 
@@ -397,3 +418,24 @@ class TestTillSummary(DomainTest):
 
         card_summary = [i for i in summary if i.method.method_name == 'card'][0]
         self.assertEqual(card_summary.description, 'Card VISA Credit')
+
+    def test_get_day_summary_data(self):
+        till = self.create_till()
+        till.open_till(self.current_user)
+        till.initial_cash_amount = 0
+        till.add_credit_entry(currency(10), u"")
+        till.add_debit_entry(currency(3), u"")
+        for value in [20, 30]:
+            payment = self.create_card_payment(provider_id='VISA',
+                                               payment_value=value)
+            TillEntry(description=u'test', value=payment.value, till=till,
+                      station=self.current_station, branch=till.station.branch,
+                      payment=payment, store=self.store)
+
+        money = PaymentMethod.get_by_name(self.store, u'money')
+        card = PaymentMethod.get_by_name(self.store, u'card')
+        provider = self.store.find(CreditProvider, provider_id=u'VISA').one()
+        self.assertEqual(till.get_day_summary_data(), {
+            (money, None, None): 7,
+            (card, provider, CreditCardData.TYPE_CREDIT): 50,
+        })
@@ -309,11 +309,10 @@ class TestProductFullStockView(DomainTest):
 
         results = ProductFullStockView.find_by_branch(self.store, branch)
         self.assertTrue(list(results))
-        # FIXME: Storm does not support count() with group_by
-        # self.assertEqual(results.count(), 1)
         # The results should have 11 items. 10 for the products that already
         # exists, and 1 more for the one we created
         self.assertEqual(len(list(results)), 11)
+        self.assertEqual(results.count(), 11)
 
         results = ProductFullStockView.find_by_branch(self.store, branch)
         results = results.find(ProductFullStockView.product_id == p1.id)
@@ -339,7 +338,7 @@ class TestProductFullStockView(DomainTest):
             # Total stock = (10 * 10) + (20 * 5) = 200
             self.store.execute(postresults[1]).get_one(), (30, 200))
 
-        sresults.having(ProductFullStockView.stock > 5)
+        sresults = sresults.find(ProductFullStockView.stock > 5)
         postresults = ProductFullStockView.post_search_callback(sresults)
         self.assertEqual(postresults[0], ('count', 'sum'))
         self.assertEqual(
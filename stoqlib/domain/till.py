@@ -32,18 +32,18 @@ from typing import Dict, Optional, Tuple, List
 
 from kiwi.currency import currency
 from kiwi.decorators import deprecated
-from storm.expr import And, Eq, Join, LeftJoin, Or
+from storm.expr import And, Eq, Join, LeftJoin, Or, Sum
 from storm.info import ClassAlias
 from storm.references import Reference, ReferenceSet
 
 import stoqlib
-from stoqlib.database.expr import Date, TransactionTimestamp
+from stoqlib.database.expr import Date, Filter, TransactionTimestamp
 from stoqlib.database.properties import (PriceCol, DateTimeCol, UnicodeCol,
                                          IdentifierCol, IdCol, EnumCol)
 from stoqlib.database.viewable import Viewable
 from stoqlib.domain.base import Domain, IdentifiableDomain
 from stoqlib.domain.events import TillOpenedEvent, TillClosedEvent
-from stoqlib.domain.payment.card import CreditCardData
+from stoqlib.domain.payment.card import CreditCardData, CreditProvider
 from stoqlib.domain.payment.payment import Payment
 from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.person import Person, LoginUser
@@ -58,6 +58,11 @@ _ = stoqlib_gettext
 
 log = logging.getLogger(__name__)
 
+#: The totals of a |till|, see :meth:`Till.get_balance_summary`
+TillBalanceSummary = collections.namedtuple('TillBalanceSummary', [
+    'initial_cash_amount', 'cash_amount', 'credits_total', 'debits_total',
+    'balance'])
+
 #
 # Domain Classes
 #
@@ -244,12 +249,13 @@ class Till(IdentifiableDomain):
         if self.status == Till.STATUS_CLOSED:
             raise TillError(_("Till is already closed"))
 
-        if self.get_cash_amount() < 0:
+        cash_amount = self.get_cash_amount()
+        if cash_amount < 0:
             raise ValueError(_("Till balance is negative, but this should not "
                                "happen. Contact Stoq Team if you need "
                                "assistance"))
 
-        self.final_cash_amount = self.get_cash_amount()
+        self.final_cash_amount = cash_amount
         self.closing_date = TransactionTimestamp()
         self.status = Till.STATUS_CLOSED
         self.observations = observations
@@ -312,14 +318,43 @@ class Till(IdentifiableDomain):
 
         return True
 
+    def get_balance_summary(self) -> TillBalanceSummary:
+        """Get all the totals of this till at once
+
+        This is the same as calling :meth:`.get_cash_amount`,
+        :meth:`.get_credits_total`, :meth:`.get_debits_total` and
+        :meth:`.get_balance`, but using a single query.
+
+        :returns: a :class:`TillBalanceSummary`
+        """
+        value = TillEntry.value
+        is_cash = Or(Eq(TillEntry.payment_id, None),
+                     PaymentMethod.method_name == u'money')
+        tables = [
+            TillEntry,
+            LeftJoin(Payment, Payment.id == TillEntry.payment_id),
+            LeftJoin(PaymentMethod, PaymentMethod.id == Payment.method_id),
+        ]
+        total, cash, credits, debits = self.store.using(*tables).find(
+            (Sum(value), Filter(Sum(value), is_cash),
+             Filter(Sum(value), value > 0), Filter(Sum(value), value < 0)),
+            TillEntry.till_id == self.id).one()
+
+        initial_cash_amount = self.initial_cash_amount or 0
+        return TillBalanceSummary(
+            initial_cash_amount=currency(initial_cash_amount),
+            cash_amount=currency(initial_cash_amount + (cash or 0)),
+            credits_total=currency(credits or 0),
+            debits_total=currency(debits or 0),
+            balance=currency(initial_cash_amount + (total or 0)))
+
     def get_balance(self):
         """Returns the balance of all till operations plus the initial amount
         cash amount.
         :returns: the balance
         :rtype: currency
         """
-        total = self.get_entries().sum(TillEntry.value) or 0
-        return currency(self.initial_cash_amount + total)
+        return self.get_balance_summary().balance
 
     def get_cash_amount(self):
         """Returns the total cash amount on the till. That includes "extra"
@@ -328,18 +363,7 @@ class Till(IdentifiableDomain):
         :returns: the cash amount on the till
         :rtype: currency
         """
-        store = self.store
-        money = PaymentMethod.get_by_name(store, u'money')
-
-        clause = And(Or(Eq(TillEntry.payment_id, None),
-                        Payment.method_id == money.id),
-                     TillEntry.till_id == self.id)
-
-        join = LeftJoin(Payment, Payment.id == TillEntry.payment_id)
-        results = store.using(TillEntry, join).find(TillEntry, clause)
-
-        return currency(self.initial_cash_amount +
-                        (results.sum(TillEntry.value) or 0))
+        return self.get_balance_summary().cash_amount
 
     def get_entries(self):
         """Fetches all the entries related to this till
@@ -353,43 +377,59 @@ class Till(IdentifiableDomain):
         :returns: total credit
         :rtype: currency
         """
-        results = self.store.find(
-            TillEntry, And(TillEntry.value > 0,
-                           TillEntry.till_id == self.id))
-        return currency(results.sum(TillEntry.value) or 0)
+        return self.get_balance_summary().credits_total
 
     def get_debits_total(self):
         """Calculates the total debit for all entries in this till
         :returns: total debit
         :rtype: currency
         """
-        results = self.store.find(
-            TillEntry, And(TillEntry.value < 0,
-                           TillEntry.till_id == self.id))
-        return currency(results.sum(TillEntry.value) or 0)
+        return self.get_balance_summary().debits_total
 
     def get_day_summary_data(self) -> Dict[Tuple[PaymentMethod,
                                                  Optional['stoqlib.domain.payment.card.CreditProvider'],
                                                  Optional[str]], currency]:
         """Get the summary of this till.
+
+        The totals are calculated by the database in a single query,
+        grouped by the payment method, card provider and card type.
         """
-        money_method = PaymentMethod.get_by_name(self.store, u'money')
+        store = self.store
+        tables = [
+            TillEntry,
+            LeftJoin(Payment, Payment.id == TillEntry.payment_id),
+            LeftJoin(CreditCardData, CreditCardData.payment_id == Payment.id),
+        ]
+        key = (Payment.method_id, CreditCardData.provider_id,
+               CreditCardData.card_type)
+        rows = list(store.using(*tables).find(
+            key + (Sum(TillEntry.value), ),
+            TillEntry.till_id == self.id).group_by(*key))
+
+        # Fetch all the methods and providers at once, instead of
+        # loading them for each entry
+        money_method = PaymentMethod.get_by_name(store, u'money')
+        methods = {money_method.id: money_method}
+        method_ids = set(row[0] for row in rows) - set([None, money_method.id])
+        if method_ids:
+            methods.update((m.id, m) for m in store.find(
+                PaymentMethod, PaymentMethod.id.is_in(method_ids)))
+        providers = {None: None}
+        provider_ids = set(row[1] for row in rows) - set([None])
+        if provider_ids:
+            providers.update((p.id, p) for p in store.find(
+                CreditProvider, CreditProvider.id.is_in(provider_ids)))
+
         day_history = {}
         # Keys are (method, provider, card_type), provider and card_type may be None if
         # payment was not with card
         day_history[(money_method, None, None)] = currency(0)
-
-        for entry in self.get_entries():
-            provider = card_type = None
-            payment = entry.payment
-            method = payment.method if payment else money_method
-            if payment and payment.card_data:
-                provider = payment.card_data.provider
-                card_type = payment.card_data.card_type
-
-            key = (method, provider, card_type)
+        for method_id, provider_id, card_type, value in rows:
+            # Entries without a payment are always in cash
+            method = methods[method_id or money_method.id]
+            key = (method, providers[provider_id], card_type)
             day_history.setdefault(key, currency(0))
-            day_history[key] += entry.value
+            day_history[key] += value
 
         return day_history
 
@@ -42,7 +42,8 @@ from stoqlib.database.viewable import Viewable
 from stoqlib.domain.base import Domain, IdentifiableDomain
 from stoqlib.domain.events import StockOperationConfirmedEvent
 from stoqlib.domain.fiscal import Invoice
-from stoqlib.domain.product import ProductHistory, StockTransactionHistory
+from stoqlib.domain.product import (ProductHistory, StockTransactionHistory,
+                                    Storable)
 from stoqlib.domain.person import Person, Branch, Company, LoginUser, Employee
 from stoqlib.domain.interfaces import IContainer, IInvoice, IInvoiceItem
 from stoqlib.domain.sellable import Sellable
@@ -395,8 +396,9 @@ class TransferOrder(IdentifiableDomain):
         """
         assert self.can_send()
 
-        for item in self.get_items():
-            item.send(user)
+        with Storable.batch_stock_movements(self.store):
+            for item in self.get_items():
+                item.send(user)
 
         # Save the operation nature and branch in Invoice table.
         self.invoice.operation_nature = self.operation_nature
@@ -411,8 +413,9 @@ class TransferOrder(IdentifiableDomain):
         """
         assert self.can_receive()
 
-        for item in self.get_items():
-            item.receive(user)
+        with Storable.batch_stock_movements(self.store):
+            for item in self.get_items():
+                item.receive(user)
 
         self.receival_date = receival_date or localnow()
         self.destination_responsible = responsible
@@ -423,8 +426,9 @@ class TransferOrder(IdentifiableDomain):
         """Cancel a transfer order"""
         assert self.can_cancel(current_branch)
 
-        for item in self.get_items():
-            item.cancel(user)
+        with Storable.batch_stock_movements(self.store):
+            for item in self.get_items():
+                item.cancel(user)
 
         self.cancel_date = cancel_date or localnow()
         self.cancel_responsible_id = responsible.id
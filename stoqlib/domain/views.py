@@ -26,7 +26,7 @@
 
 from kiwi.currency import currency
 from storm.expr import (And, Coalesce, Eq, Join, LeftJoin, Or, Sum, Select,
-                        Alias, Count, Cast, Ne, JoinExpr)
+                        Alias, Count, Cast, Ne, JoinExpr, Undef)
 from storm.info import ClassAlias
 
 from stoqlib.database.expr import (Case, Distinct, Field, NullIf,
@@ -44,6 +44,7 @@ from stoqlib.domain.person import (Person, Supplier, Company, LoginUser,
                                    Individual, SalesPerson, ClientView)
 from stoqlib.domain.product import (Product,
                                     ProductStockItem,
+                                    ProductStockSummary,
                                     ProductHistory,
                                     ProductManufacturer,
                                     ProductSupplierInfo,
@@ -70,16 +71,57 @@ from stoqlib.lib.defaults import DECIMAL_PRECISION
 _StockBranchSummary = Alias(Select(
     columns=[Alias(Storable.id, 'storable_id'),
              Alias(Branch.id, 'branch_id'),
-             Alias(Sum(ProductStockItem.quantity), 'stock'),
-             Alias(Sum(ProductStockItem.quantity
-                       * ProductStockItem.stock_cost),
-                   'total_stock_cost')],
+             Alias(ProductStockSummary.quantity, 'stock'),
+             Alias(ProductStockSummary.total_cost, 'total_stock_cost')],
     tables=[Storable,
             # This is equivalent to a cross join
             Join(Branch, And(True)),
-            LeftJoin(ProductStockItem, And(ProductStockItem.branch_id == Branch.id,
-                                           ProductStockItem.storable_id == Storable.id))],
-    group_by=[Storable.id, Branch.id]), '_stock_summary')
+            LeftJoin(ProductStockSummary,
+                     And(ProductStockSummary.branch_id == Branch.id,
+                         ProductStockSummary.storable_id == Storable.id))]),
+    '_stock_summary')
+
+
+def _get_stock_summary(branch_id=None, by_branch=False):
+    """Get a subselect with the stock of the storables
+
+    The stock is read from :class:`ProductStockSummary`. The subselect will
+    have the ``storable_id``, ``quantity`` and ``total_cost`` columns, and
+    ``branch_id`` too when the stock is not summed for all branches.
+
+    :param branch_id: if not ``None``, only the stock on this branch
+      will be considered
+    :param by_branch: if ``True``, there will be one row for each branch
+      the storable has stock on, instead of the sum of all of them
+    """
+    summary = ProductStockSummary
+    if branch_id is not None or by_branch:
+        columns = [summary.storable_id, summary.branch_id,
+                   summary.quantity, summary.total_cost]
+        where = Undef if branch_id is None else summary.branch_id == branch_id
+        group_by = Undef
+    else:
+        columns = [summary.storable_id,
+                   Alias(Sum(summary.quantity), 'quantity'),
+                   Alias(Sum(summary.total_cost), 'total_cost')]
+        where = Undef
+        group_by = [summary.storable_id]
+
+    return Alias(Select(columns=columns, where=where, tables=[summary],
+                        group_by=group_by), '_stock')
+
+
+def _replace_stock_summary(tables, stock_summary):
+    tables = tables[:]
+    for i, table in enumerate(tables):
+        if (isinstance(table, JoinExpr) and isinstance(table.right, Alias) and
+                table.right.name == '_stock'):
+            tables[i] = LeftJoin(stock_summary,
+                                 Field('_stock', 'storable_id') == Storable.id)
+            return tables
+
+    raise AssertionError("Did not find the stock summary join")
+
 
 _price_search = Case(
     condition=Or(And(Date(StatementTimestamp()) >= Date(Sellable.on_sale_start_date),
@@ -151,16 +193,16 @@ class ProductFullStockView(Viewable):
     category_description = SellableCategory.description
     unit = SellableUnit.description
 
-    # Aggregates
-    total_stock_cost = Coalesce(Sum(ProductStockItem.quantity *
-                                    ProductStockItem.stock_cost), 0)
-    stock = Coalesce(Sum(ProductStockItem.quantity), 0)
+    # Stock, precomputed by the database on product_stock_summary
+    total_stock_cost = Coalesce(Field('_stock', 'total_cost'), 0)
+    stock = Coalesce(Field('_stock', 'quantity'), 0)
 
     tables = [
         Sellable,
         Join(Product, Product.id == Sellable.id),
         LeftJoin(Storable, Storable.id == Product.id),
-        LeftJoin(ProductStockItem, ProductStockItem.storable_id == Storable.id),
+        LeftJoin(_get_stock_summary(),
+                 Field('_stock', 'storable_id') == Storable.id),
         LeftJoin(SellableTaxConstant,
                  SellableTaxConstant.id == Sellable.tax_constant_id),
         LeftJoin(SellableCategory, SellableCategory.id == Sellable.category_id),
@@ -172,8 +214,6 @@ class ProductFullStockView(Viewable):
     ]
 
     clause = Sellable.status != Sellable.STATUS_CLOSED
-    group_by = [id, product_id, storable_id, category_description,
-                manufacturer, tax_description, unit, image_id]
 
     __hash__ = Viewable.__hash__
 
@@ -202,25 +242,14 @@ class ProductFullStockView(Viewable):
         if branch is None:
             return store.find(cls)
 
-        # Highjack the class being queried, since we need to add the branch
-        # on the ProductStockItem join to filter it.
+        # Highjack the class being queried, since we need to filter the
+        # stock summary by the branch.
         # Make sure to create it only once or else Viewable would fail to
         # compare both objects as their class would be different.
         hv = cls.highjacked.get(branch.id, None)
         if hv is None:
-            tables = cls.tables[:]
-            for i, table in enumerate(tables):
-                if not isinstance(table, JoinExpr):
-                    continue
-                if table.right is ProductStockItem:
-                    tables[i] = LeftJoin(
-                        ProductStockItem,
-                        And(ProductStockItem.storable_id == Storable.id,
-                            ProductStockItem.branch_id == branch.id))
-                    break
-            else:  # pragma nocoverage
-                raise AssertionError("Did not find ProductStockItem join")
-
+            tables = _replace_stock_summary(
+                cls.tables, _get_stock_summary(branch_id=branch.id))
             hv = type(
                 "Highjacked%s" % (cls.__name__, ),
                 (cls, ),
@@ -311,7 +340,8 @@ class ProductWithStockView(ProductFullStockView):
     :cvar stock: the stock of the product
      """
 
-    having = ProductFullStockView.stock > 0
+    clause = And(ProductFullStockView.clause,
+                 ProductFullStockView.stock > 0)
 
 
 class ProductWithStockBranchView(ProductFullStockView):
@@ -322,17 +352,17 @@ class ProductWithStockBranchView(ProductFullStockView):
     filter, otherwise, the results may be duplicated (once for each branch in
     the database)
     """
-    branch_id = ProductStockItem.branch_id
+    branch_id = Field('_stock', 'branch_id')
     minimum_quantity = Storable.minimum_quantity
     maximum_quantity = Storable.maximum_quantity
 
+    tables = _replace_stock_summary(ProductFullStockView.tables,
+                                    _get_stock_summary(by_branch=True))
+
     clause = And(ProductFullStockView.clause,
                  Eq(Product.is_grid, False),
                  Eq(Product.is_package, False))
 
-    group_by = ProductFullStockView.group_by[:]
-    group_by.append(branch_id)
-
 
 # This subselect should query only from PurchaseItem, otherwise, more one
 # product may appear more than once in the results (if there are purchase
@@ -349,11 +379,8 @@ _PurchaseItemTotal = Select(
 
 
 class ProductFullStockItemView(ProductFullStockView):
-    # ProductFullStockView already joins with a 1 to Many table (Sellable
-    # with ProductStockItem).
-    #
-    # This is why we must join PurchaseItem (another 1 to many table) in a
-    # subquery
+    # PurchaseItem is a 1 to many table, so we must join it in a subquery
+    # to not duplicate the results
 
     minimum_quantity = Storable.minimum_quantity
     maximum_quantity = Storable.maximum_quantity
@@ -369,9 +396,6 @@ class ProductFullStockItemView(ProductFullStockView):
     clause = And(ProductFullStockView.clause,
                  Eq(Product.is_grid, False))
 
-    group_by = ProductFullStockView.group_by[:]
-    group_by.append(to_receive_quantity)
-
 
 class ProductFullStockItemSupplierView(ProductFullStockItemView):
     """ Just like ProductFullStockView, but will also be joined with
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+"""CSV exporter"""
+
+import csv
+import datetime
+
+from stoqlib.exporters.streamexporter import StreamExporter
+
+
+class CSVExporter(StreamExporter):
+    """Exports the rows to a CSV file, encoded as UTF-8"""
+
+    extension = '.csv'
+    mime_type = 'text/csv'
+
+    def __init__(self, name=None):
+        super(CSVExporter, self).__init__(name=name)
+        # The BOM makes spreadsheet applications detect the encoding
+        self._file.write('\ufeff')
+        self._writer = csv.writer(self._file)
+
+    def _convert_one(self, data):
+        if data is None:
+            return ''
+        if isinstance(data, datetime.date):
+            return data.isoformat()
+        if isinstance(data, bytes):
+            return data.decode()
+        return data
+
+    #
+    # StreamExporter
+    #
+
+    def write_row(self, row, header=False):
+        self._writer.writerow([self._convert_one(data) for data in row])
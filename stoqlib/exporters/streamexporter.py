@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+"""Base class for the exporters that write the rows as they are added
+
+Unlike :class:`stoqlib.exporters.xlsexporter.XLSExporter`, which builds the
+whole workbook in memory, those exporters write each row to a temporary
+file as soon as it is added. Combined with :meth:`StreamExporter.add_from_resultset`,
+which fetches the rows from the database in batches, exporting a huge
+result uses a constant amount of memory.
+"""
+
+import os
+import shutil
+import tempfile
+
+from stoqlib.lib.translation import stoqlib_gettext
+
+_ = stoqlib_gettext
+
+
+class StreamExporter(object):
+    """An exporter that writes the rows as they are added
+
+    Subclasses must implement :meth:`.write_row` and may implement
+    :meth:`.write_description` and :meth:`.finish`.
+
+    :param name: the name of the sheet, if the format supports it
+    """
+
+    #: The extension of the exported files, including the dot
+    extension = None
+
+    #: The mime type of the exported files
+    mime_type = None
+
+    #: How many rows are fetched from the database on each round trip
+    #: by :meth:`.add_from_resultset`
+    fetch_size = 1000
+
+    def __init__(self, name=None):
+        self.name = name or _('Stoq sheet')
+        self.n_rows = 0
+        self._headers = None
+        self._column_types = None
+        self._headers_written = False
+        self._finished = False
+        # Where the rows are written to until the file is saved
+        fd, self._filename = tempfile.mkstemp(prefix='stoq', suffix='.export')
+        self._file = os.fdopen(fd, mode='w+', encoding='utf-8', newline='')
+
+    #
+    # Hooks
+    #
+
+    def write_row(self, row, header=False):
+        """Write a row
+
+        :param row: a sequence with the value of each cell
+        :param header: ``True`` if the row is the column headers
+        """
+        raise NotImplementedError
+
+    def write_description(self, description):
+        """Write a description of the exported data before the rows
+
+        :param description: the description, usually the filters used
+        """
+        self.write_row([description], header=True)
+
+    def finish(self, fp):
+        """Write the exported file
+
+        By default the rows are copied as they were written
+
+        :param fp: a binary file where the file should be written to
+        """
+        with open(self._filename, 'rb') as rows:
+            shutil.copyfileobj(rows, fp)
+
+    #
+    # Public API
+    #
+
+    def set_column_headers(self, headers):
+        self._headers = headers
+
+    def set_column_types(self, column_types):
+        self._column_types = column_types
+
+    def add_cells(self, cells, filter_description=None):
+        """Add rows to the exported file
+
+        :param cells: an iterable of rows, each one a sequence with the
+          value of each cell. It will only be iterated once, so it can be
+          a generator.
+        :param filter_description: a description written before the first
+          row, see :meth:`.write_description`
+        """
+        assert not self._finished
+        if filter_description:
+            self.write_description(filter_description)
+
+        if self._headers and not self._headers_written:
+            self.write_row(self._headers, header=True)
+            self._headers_written = True
+
+        n_columns = self._column_types and len(self._column_types)
+        for row in cells:
+            if n_columns and len(row) > n_columns:
+                raise ValueError(row, n_columns)
+            self.write_row(row)
+            self.n_rows += 1
+
+    def add_from_object_list(self, objectlist, data=None,
+                             filter_description=None):
+        """Add the rows from an objectlist
+
+        The cells are the same displayed on the objectlist's visible columns.
+
+        :param objectlist: a kiwi ObjectList
+        :param data: the objects that should be exported or ``None`` to export
+          the objects on *objectlist*. If this is a result set, the objects
+          will be fetched in batches of :attr:`.fetch_size`
+        :param filter_description: a description written before the
+          first row
+        """
+        columns = objectlist.get_visible_columns()
+        self.set_column_types([c.data_type for c in columns])
+        self.set_column_headers([
+            getattr(c, 'long_title', None) or c.title for c in columns])
+        if hasattr(data, 'stream'):
+            data = data.stream(self.fetch_size)
+        self.add_cells(objectlist.get_cell_contents(data),
+                       filter_description=filter_description)
+
+    def add_from_resultset(self, resultset, attributes, headers=None,
+                           column_types=None, filter_description=None):
+        """Add the rows from a result set
+
+        The objects are fetched in batches of :attr:`.fetch_size`, using
+        a server side cursor.
+
+        :param resultset: a result set
+        :param attributes: the name of the attribute of each column
+        :param headers: the title of each column, by default the same
+          as *attributes*
+        :param column_types: the type of each column
+        :param filter_description: a description written before the
+          first row
+        """
+        self.set_column_headers(headers or attributes)
+        if column_types is not None:
+            self.set_column_types(column_types)
+        rows = ([getattr(obj, attr) for attr in attributes]
+                for obj in resultset.stream(self.fetch_size))
+        self.add_cells(rows, filter_description=filter_description)
+
+    def save_as(self, filename):
+        """Save the exported file
+
+        No rows can be added after it is saved.
+
+        :param filename: where the file should be saved
+        """
+        with open(filename, 'wb') as fp:
+            self._save(fp)
+
+    def save(self, prefix=''):
+        """Save the exported file on a temporary file
+
+        No rows can be added after it is saved.
+
+        :param prefix: a prefix for the temporary file name
+        :returns: the temporary file, which should be closed by the caller
+        """
+        if prefix:
+            prefix = 'Stoq-%s-' % (prefix, )
+        else:
+            prefix = 'Stoq-'
+
+        temporary = tempfile.NamedTemporaryFile(
+            prefix=prefix, suffix=self.extension, delete=False)
+        try:
+            self._save(temporary)
+            temporary.flush()
+            temporary.seek(0)
+        except Exception:
+            temporary.close()
+            os.remove(temporary.name)
+            raise
+
+        return temporary
+
+    def close(self):
+        """Discard the rows added so far
+
+        This is done automatically when the file is saved.
+        """
+        self._finished = True
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._filename)
+
+    #
+    # Private
+    #
+
+    def _save(self, fp):
+        assert not self._finished
+        self._finished = True
+        try:
+            self._file.flush()
+            self.finish(fp)
+        finally:
+            self.close()
+
+
+def get_stream_exporter(filename, name=None):
+    """Get the exporter for a file according to its extension
+
+    :param filename: the name of the file, which should end with
+      ``.csv`` or ``.xlsx``
+    :param name: the name of the sheet, if the format supports it
+    :returns: a :class:`StreamExporter`
+    :raises: ValueError if the extension is not supported
+    """
+    from stoqlib.exporters.csvexporter import CSVExporter
+    from stoqlib.exporters.xlsxexporter import XLSXExporter
+
+    for exporter_class in [CSVExporter, XLSXExporter]:
+        if filename.lower().endswith(exporter_class.extension):
+            return exporter_class(name)
+    raise ValueError("Unsupported file extension: %s" % (filename, ))
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+"""XLSX exporter
+
+The file is written without any external library: the sheet is streamed
+to a temporary file and the other (small and constant) parts of the
+package are generated when it is saved.
+"""
+
+import datetime
+import decimal
+import math
+import re
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+from kiwi.currency import currency
+
+from stoqlib.exporters.streamexporter import StreamExporter
+from stoqlib.exporters.xlsutils import get_date_format, get_number_format
+
+# The characters that are not allowed on XML 1.0 documents
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+_EPOCH = datetime.datetime(1899, 12, 30)
+
+# Indexes on the cellXfs of the styles part
+(_STYLE_GENERAL,
+ _STYLE_HEADER,
+ _STYLE_DATE,
+ _STYLE_NUMBER) = range(4)
+
+_CONTENT_TYPES = """\
+<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>
+"""
+
+_RELS = """\
+<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>
+"""
+
+_WORKBOOK_RELS = """\
+<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>
+"""
+
+_WORKBOOK = """\
+<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" \
+xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name=%(name)s sheetId="1" r:id="rId1"/></sheets>
+</workbook>
+"""
+
+_STYLES = """\
+<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<numFmts count="2">
+<numFmt numFmtId="164" formatCode=%(date_format)s/>
+<numFmt numFmtId="165" formatCode=%(number_format)s/>
+</numFmts>
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>\
+<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill>\
+<fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="4">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>
+<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+</cellXfs>
+</styleSheet>
+"""
+
+_SHEET_START = """\
+<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<sheetData>
+"""
+
+_SHEET_END = """\
+</sheetData>
+</worksheet>
+"""
+
+
+def _is_number(data):
+    if isinstance(data, bool):
+        return False
+    if isinstance(data, decimal.Decimal):
+        return data.is_finite()
+    if isinstance(data, float):
+        return math.isfinite(data)
+    return isinstance(data, int)
+
+
+def _get_column_name(index):
+    name = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(ord('A') + remainder) + name
+    return name
+
+
+class XLSXExporter(StreamExporter):
+    """Exports the rows to an Office Open XML spreadsheet
+
+    The rows are written to the sheet as soon as they are added, so
+    the memory used does not depend on the number of rows.
+    """
+
+    extension = '.xlsx'
+    mime_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    #: The maximum number of rows supported by the format
+    max_rows = 1048576
+
+    def __init__(self, name=None):
+        super(XLSXExporter, self).__init__(name=name)
+        self._row = 0
+        self._column_names = []
+        self._column_styles = []
+        self._file.write(_SHEET_START)
+
+    def _get_cell(self, column, data, style):
+        if data is None:
+            return ''
+        if isinstance(data, bytes):
+            data = data.decode()
+
+        if isinstance(data, datetime.date):
+            if not isinstance(data, datetime.datetime):
+                data = datetime.datetime.combine(data, datetime.time())
+            delta = data.replace(tzinfo=None) - _EPOCH
+            value = repr(delta.days + delta.seconds / 86400.0)
+            if style == _STYLE_GENERAL:
+                style = _STYLE_DATE
+        elif _is_number(data):
+            value = str(data)
+        else:
+            text = escape(_INVALID_XML_CHARS.sub('', str(data)))
+            return '<c r="%s%d" s="%d" t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>' % (
+                self._get_column_name(column), self._row, style, text)
+
+        return '<c r="%s%d" s="%d"><v>%s</v></c>' % (
+            self._get_column_name(column), self._row, style, value)
+
+    def _get_column_name(self, column):
+        while column >= len(self._column_names):
+            self._column_names.append(_get_column_name(len(self._column_names)))
+        return self._column_names[column]
+
+    #
+    # StreamExporter
+    #
+
+    def set_column_types(self, column_types):
+        super(XLSXExporter, self).set_column_types(column_types)
+        styles = []
+        for column_type in column_types:
+            if column_type in (datetime.datetime, datetime.date):
+                style = _STYLE_DATE
+            elif column_type in [int, float, currency, decimal.Decimal]:
+                style = _STYLE_NUMBER
+            else:
+                style = _STYLE_GENERAL
+            styles.append(style)
+        self._column_styles = styles
+
+    def write_row(self, row, header=False):
+        if self._row >= self.max_rows:
+            raise ValueError("The sheet cannot have more than %d rows" % (
+                self.max_rows, ))
+        self._row += 1
+
+        cells = []
+        for column, data in enumerate(row):
+            if header:
+                style = _STYLE_HEADER
+            elif column < len(self._column_styles):
+                style = self._column_styles[column]
+            else:
+                style = _STYLE_GENERAL
+            cells.append(self._get_cell(column, data, style))
+        self._file.write('<row r="%d">%s</row>\n' % (self._row, ''.join(cells)))
+
+    def finish(self, fp):
+        self._file.write(_SHEET_END)
+        self._file.flush()
+
+        # Sheet names cannot have some characters and are limited to 31 chars
+        name = re.sub(r'[\[\]:*?/\\]', '', self.name)[:31] or 'Sheet1'
+        with zipfile.ZipFile(fp, 'w', zipfile.ZIP_DEFLATED) as package:
+            package.writestr('[Content_Types].xml', _CONTENT_TYPES)
+            package.writestr('_rels/.rels', _RELS)
+            package.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+            package.writestr('xl/workbook.xml', _WORKBOOK % dict(
+                name=quoteattr(name)))
+            package.writestr('xl/styles.xml', _STYLES % dict(
+                date_format=quoteattr(get_date_format()),
+                number_format=quoteattr(get_number_format())))
+            # This will copy the sheet in chunks, without loading it in memory
+            package.write(self._filename, 'xl/worksheets/sheet1.xml')
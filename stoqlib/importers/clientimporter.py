@@ -29,6 +29,8 @@ from stoqlib.importers.csvimporter import CSVImporter
 
 
 class ClientImporter(CSVImporter):
+    supports_parallel = True
+
     fields = ['name',
               'phone_number',
               'mobile_number',
@@ -42,6 +44,13 @@ class ClientImporter(CSVImporter):
               'streetnumber',
               'district']
 
+    def prepare_parallel(self, store):
+        for data in self.iter_rows():
+            CityLocation.get_or_create(store=store,
+                                       city=data.city,
+                                       state=data.state,
+                                       country=data.country)
+
     def process_one(self, data, fields, store):
         person = Person(
             store=store,
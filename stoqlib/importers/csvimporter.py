@@ -28,8 +28,6 @@ CSV import classes
 """
 
 import csv
-import datetime
-import time
 
 from stoqlib.database.runtime import new_store
 from stoqlib.importers.importer import Importer
@@ -79,14 +77,49 @@ class CSVImporter(Importer):
         self.before_start(store)
         store.commit(close=True)
         self.lineno = 1
-        self.rows = list(csv.reader(fp, dialect=self.dialect))
+        self.fp = fp
+        if fp.seekable():
+            # The rows are only read when processing them, but we need to
+            # know how many of them are there beforehand
+            self.rows = None
+            self.n_rows = sum(1 for row in csv.reader(fp, dialect=self.dialect))
+            fp.seek(0)
+        else:
+            self.rows = list(csv.reader(fp, dialect=self.dialect))
+            self.n_rows = len(self.rows)
 
     def get_n_items(self):
-        return len(self.rows)
+        return self.n_rows
+
+    def get_items(self):
+        if self.rows is not None:
+            return iter(self.rows)
+        self.fp.seek(0)
+        return csv.reader(self.fp, dialect=self.dialect)
+
+    def iter_rows(self):
+        """Iterate over all the rows that are going to be imported, without
+        processing them. This is useful for :meth:`.prepare_parallel`
+        :returns: a sequence of objects representing each row
+        """
+        field_names = self.fields + self.optional_fields
+        for item in self.get_items():
+            if item and not item[0].startswith('%'):
+                yield CSVRow(item, field_names)
+
+    def before_worker_start(self):
+        # The offset of a file is shared between the processes, so each
+        # worker needs to open the file again to read it on its own
+        name = getattr(self.fp, 'name', None)
+        if self.rows is None and isinstance(name, str):
+            self.fp = open(name)
+
+    def skip_item(self, item):
+        if item and not item[0].startswith('%'):
+            self.skip_one(CSVRow(item, self.fields + self.optional_fields))
+        self.lineno += 1
 
-    def process_item(self, store, item_no):
-        t = time.time()
-        item = self.rows[item_no]
+    def process_item(self, store, item):
         if not item or item[0].startswith('%'):
             self.lineno += 1
             return False
@@ -117,14 +150,6 @@ class CSVImporter(Importer):
             print()
             raise
 
-        if self.items != -1:
-            if self.lineno % self.items == 0:
-                t2 = time.time()
-                print('%s Imported %d entries in %2.2f sec total=%d' % (
-                    datetime.datetime.now().strftime('%H:%M:%S'), self.items,
-                    t2 - t, self.lineno))
-                t = t2
-
         self.lineno += 1
         return True
 
@@ -153,6 +178,13 @@ class CSVImporter(Importer):
         """
         raise NotImplementedError
 
+    def skip_one(self, row):
+        """This is called instead of :meth:`process_one` for rows that were
+        already imported by a previous run, when resuming. Override this if
+        the importer keeps some state between rows.
+        :param row: object representing a row in the input
+        """
+
     def read(self, iterable):
         """This can be overridden by as subclass which wishes to specialize
         the CSV reader.
@@ -25,11 +25,14 @@
 
 import datetime
 import logging
+import math
+import multiprocessing
+import os
 import time
 
 from stoqlib.lib.importutils import import_from_string
 
-from stoqlib.database.runtime import new_store
+from stoqlib.database.runtime import new_store, reset_default_store
 
 log = logging.getLogger(__name__)
 create_log = logging.getLogger('stoqlib.importer.create')
@@ -51,12 +54,37 @@ _available_importers = {
     'transporter.csv': 'transporterimporter.TransporterImporter',
 }
 
+#: The importer being processed by the worker processes, see
+#: :meth:`Importer.set_workers`
+_parallel_importer = None
+
+
+def _process_shard(shard):
+    start, end = shard
+    importer = _parallel_importer
+    importer.before_worker_start()
+    store, imported_items = importer._process_items(new_store(), start, end,
+                                                    checkpoint=False)
+    if store is not None:
+        store.rollback(close=True)
+    return imported_items
+
 
 class Importer(object):
     """Class to assist the process of importing csv files.
 
+    The items returned by :meth:`get_items` are processed lazily and the
+    store is committed every :meth:`set_items_per_commit` items. After each
+    commit the number of items already imported is saved on a checkpoint
+    file next to the imported one, so that the importing can continue
+    from there if it gets interrupted, see :meth:`set_resume`.
+
+    :cvar supports_parallel: if the items can be processed in more than one
+      process at the same time, see :meth:`set_workers`
     """
 
+    supports_parallel = False
+
     def __init__(self, items=500, dry=False):
         """
         Create a new Importer object.
@@ -65,6 +93,9 @@ class Importer(object):
         """
         self.items = items
         self.dry = dry
+        self.resume = False
+        self.workers = 1
+        self.filename = None
 
     def feed_file(self, filename):
         """Feeds csv data from filename to the importer
@@ -79,7 +110,7 @@ class Importer(object):
         before committing
         :param items: number of items or
         """
-        self.n_items = items
+        self.items = items
 
     def set_dry(self, dry):
         """Tells the CSVImporter to run in dry mode, eg without committing
@@ -88,6 +119,37 @@ class Importer(object):
         """
         self.dry = dry
 
+    def set_resume(self, resume):
+        """Tells the importer to skip the items that were already committed
+        by a previous run that did not finish, eg because it crashed.
+        This only works when the data was fed using :meth:`feed_file`
+        :param resume: resume mode
+        """
+        self.resume = resume
+
+    def set_workers(self, workers):
+        """Sets the number of processes used to import the items.
+
+        When more than one, the items are split in contiguous shards and each
+        one of them is imported by a worker process, with its own store.
+        Note that the shards are committed independently, so the items
+        will not be committed in the same order as they are in the input,
+        and resuming is not supported. This is ignored if the importer does
+        not set :attr:`.supports_parallel`.
+        :param workers: number of processes
+        """
+        self.workers = workers
+
+    def get_checkpoint_filename(self):
+        """Get the name of the file where the number of items already
+        committed is saved
+
+        :returns: the filename or ``None`` if the data was not fed from a file
+        """
+        if self.filename is None:
+            return None
+        return self.filename + '.checkpoint'
+
     def process(self, store=None):
         """Do the main logic, create stores, import items etc"""
         n_items = self.get_n_items()
@@ -95,26 +157,30 @@ class Importer(object):
         create_log.info('ITEMS:%d' % (n_items, ))
         t1 = time.time()
 
-        imported_items = 0
-        if not store:
+        if self.workers > 1 and not self.supports_parallel:
+            log.warning('%s does not support parallel importing, using a '
+                        'single process' % (type(self).__name__, ))
+        if self.workers > 1 and self.supports_parallel and store is None:
+            imported_items = self._process_parallel(n_items)
             store = new_store()
-        self.before_start(store)
-        for i in range(n_items):
-            if self.process_item(store, i):
-                create_log.info('ITEM:%d' % (i + 1, ))
-                imported_items += 1
-            if not self.dry and i + 1 % 100 == 0:
-                store.commit(close=True)
-                store = new_store()
+        else:
+            committed_items = self._read_checkpoint() if self.resume else 0
+            if committed_items:
+                log.info('Resuming after %d items' % (committed_items, ))
 
-        if not self.dry:
-            store.commit(close=True)
-            store = new_store()
+            if not store:
+                store = new_store()
+            self.before_start(store)
+            store, imported_items = self._process_items(
+                store, committed_items, n_items, checkpoint=True)
+            if store is None:
+                store = new_store()
 
         self.when_done(store)
 
         if not self.dry:
             store.commit(close=True)
+            self._remove_checkpoint()
 
         t2 = time.time()
         log.info('%s Imported %d entries in %2.2f sec' % (
@@ -122,6 +188,107 @@ class Importer(object):
             t2 - t1))
         create_log.info('IMPORTED-ITEMS:%d' % (imported_items, ))
 
+    #
+    # Private
+    #
+
+    def _process_items(self, store, start, end, checkpoint):
+        # Process the items from start to end, committing every self.items.
+        # Returns the store and the number of imported items. The store will
+        # be None if it was committed and closed at the end
+        t_commit = time.time()
+        imported_items = 0
+        n_processed = 0
+        for i, item in enumerate(self.get_items()):
+            if i >= end:
+                break
+            if i < start:
+                self.skip_item(item)
+                continue
+
+            if self.process_item(store, item):
+                create_log.info('ITEM:%d' % (i + 1, ))
+                imported_items += 1
+            n_processed += 1
+            if not self.dry and self.items != -1 and (i + 1) % self.items == 0:
+                store.commit(close=True)
+                if checkpoint:
+                    self._write_checkpoint(i + 1)
+                t_commit = self._log_rate(n_processed, t_commit)
+                n_processed = 0
+                store = new_store()
+
+        if not self.dry:
+            store.commit(close=True)
+            self._log_rate(n_processed, t_commit)
+            store = None
+
+        return store, imported_items
+
+    def _process_parallel(self, n_items):
+        if self.resume:
+            raise ValueError("Resuming is not supported when importing "
+                             "with more than one process")
+
+        store = new_store()
+        self.before_start(store)
+        self.prepare_parallel(store)
+        # The workers can only see what prepare_parallel created
+        # if it is committed
+        store.confirm(not self.dry)
+        store.close()
+
+        size = int(math.ceil(n_items / self.workers)) or 1
+        shards = [(start, min(start + size, n_items))
+                  for start in range(0, n_items, size)]
+        log.info('Importing in %d processes' % (len(shards), ))
+
+        global _parallel_importer
+        _parallel_importer = self
+        try:
+            # Fork so the workers inherit the fed data
+            context = multiprocessing.get_context('fork')
+            with context.Pool(len(shards), initializer=reset_default_store) as pool:
+                imported_items = sum(pool.imap_unordered(_process_shard,
+                                                         shards))
+        finally:
+            _parallel_importer = None
+
+        return imported_items
+
+    def _log_rate(self, n_processed, t):
+        t2 = time.time()
+        if n_processed and t2 > t:
+            create_log.info('ITEMS-PER-SEC:%.1f' % (n_processed / (t2 - t), ))
+        return t2
+
+    def _read_checkpoint(self):
+        filename = self.get_checkpoint_filename()
+        if filename is None or not os.path.exists(filename):
+            return 0
+        with open(filename) as fp:
+            return int(fp.read().strip() or 0)
+
+    def _write_checkpoint(self, committed_items):
+        filename = self.get_checkpoint_filename()
+        if filename is None:
+            return
+        # Write to a temporary file and rename it so we never end up with
+        # an incomplete checkpoint if we crash while writing it
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w') as fp:
+            fp.write('%d\n' % (committed_items, ))
+        os.replace(tmp_filename, filename)
+
+    def _remove_checkpoint(self):
+        filename = self.get_checkpoint_filename()
+        if filename is not None and os.path.exists(filename):
+            os.unlink(filename)
+
+    #
+    # Override this in a subclass
+    #
+
     def feed(self, fp, filename='<stdin>'):
         """Feeds csv data from an iterable
         :param fp: a file descriptor
@@ -132,8 +299,9 @@ class Importer(object):
     def get_n_items(self):
         raise NotImplementedError
 
-    def process_item(self, store, item_no):
+    def process_item(self, store, item):
         """
+        :param item: one of the items returned by :meth:`get_items`
         :returns True if the item was imported, False if not
         """
         raise NotImplementedError
@@ -142,6 +310,34 @@ class Importer(object):
     # Optional to implement
     #
 
+    def get_items(self):
+        """Get the items that are going to be imported.
+
+        By default the items are just their indexes. Subclasses which
+        can read their input lazily should override this to return a
+        generator, so the whole input is never held in memory.
+        :returns: an iterable of items to be passed to :meth:`process_item`
+        """
+        return range(self.get_n_items())
+
+    def prepare_parallel(self, store):
+        """This is called before the worker processes start when importing
+        in parallel. Override this to create the objects that are shared
+        between items (e.g. categories), so two workers don't end up
+        creating the same object at the same time.
+        """
+
+    def before_worker_start(self):
+        """This is called on each worker process before it starts processing
+        its items, when importing in parallel.
+        """
+
+    def skip_item(self, item):
+        """This is called instead of :meth:`process_item` for items that
+        were already imported by a previous run, when resuming.
+        :param item: one of the items returned by :meth:`get_items`
+        """
+
     def before_start(self, store):
         """This is called before all the lines are parsed but
         after creating a store.
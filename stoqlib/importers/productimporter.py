@@ -42,6 +42,8 @@ from stoqlib.lib.parameters import sysparam
 
 
 class ProductImporter(CSVImporter):
+    supports_parallel = True
+
     fields = ['base_category',
               'barcode',
               'category',
@@ -116,7 +118,7 @@ class ProductImporter(CSVImporter):
                                               p_cofins=10)
         return taxes
 
-    def process_one(self, data, fields, store):
+    def _get_category(self, data, store):
         base_category = self._get_or_create(
             SellableCategory, store,
             suggested_markup=Decimal(data.markup),
@@ -136,6 +138,21 @@ class ProductImporter(CSVImporter):
             description=data.category,
             suggested_markup=Decimal(data.markup2),
             category=base_category)
+        return category
+
+    def prepare_parallel(self, store):
+        # The categories and taxes are shared between the products, so
+        # create them before the workers start looking for them
+        self._maybe_create_taxes(store)
+        for data in self.iter_rows():
+            self._get_category(data, store)
+
+    def skip_one(self, data):
+        # Keep the codes the same as if the row had been imported now
+        self._code += 1
+
+    def process_one(self, data, fields, store):
+        category = self._get_category(data, store)
 
         sellable = Sellable(store=store,
                             cost=Decimal(data.cost),
@@ -33,6 +33,8 @@ from stoqlib.importers.csvimporter import CSVImporter
 
 
 class ServiceImporter(CSVImporter):
+    supports_parallel = True
+
     fields = ['description',
               'barcode',
               'price',
@@ -48,6 +50,10 @@ class ServiceImporter(CSVImporter):
         self._code = 11
         assert self.tax_constant
 
+    def skip_one(self, data):
+        # The code depends on how many rows were imported before this one
+        self._code += 1
+
     def process_one(self, data, fields, store):
         tax = store.fetch(self.tax_constant)
         sellable = Sellable(store=store,
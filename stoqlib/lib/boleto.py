@@ -340,14 +340,30 @@ class BankInfo(object):
     #
 
     @classmethod
-    def get_cnab(cls, payments):
+    def create_cnab(cls, payments):
         branch = payments[0].branch
         bank = payments[0].method.destination_account.bank
         info = cls(payments[0])
 
         cnab = cls.cnab_class(branch, bank, info)
         cnab.setup(payments)
-        return cnab.as_string()
+        return cnab
+
+    @classmethod
+    def get_cnab(cls, payments):
+        return cls.create_cnab(payments).as_string()
+
+    @classmethod
+    def write_cnab(cls, payments, fp):
+        """Writes the CNAB of the payments to a file
+
+        Unlike :meth:`.get_cnab`, the contents are never held in memory
+        all at once.
+
+        :param payments: the payments to write the CNAB for
+        :param fp: a file opened for writing text
+        """
+        cls.create_cnab(payments).write(fp)
 
     @classmethod
     def get_extra_options(cls):
@@ -20,6 +20,7 @@
 ## Author(s): Stoq Team <stoq-devel@async.com.br>
 ##
 
+import io
 from decimal import Decimal
 
 from stoqlib.lib.stringutils import strip_accents
@@ -49,7 +50,14 @@ class Field(object):
 
         # Save default value separately, since it has a lower precedence
         self.default_value = default_value
-        self.value = None
+
+        # Resolve the formatter only once
+        if type is str:
+            self.format = self._format_str
+        elif type is int:
+            self.format = self._format_int
+        elif type is Decimal:
+            self.format = self._format_decimal
 
     def copy(self):
         size = self.size
@@ -59,56 +67,76 @@ class Field(object):
                           default_value=self.default_value,
                           decimals=self.decimals)
 
-    def get_value(self):
-        """Gets the value of this field.
+    def _format_str(self, value):
+        return strip_accents(str(value or '')).ljust(self.size)[:self.size]
+
+    def _format_int(self, value):
+        value = str(value or 0).rjust(self.size, '0')
+        assert len(value) == self.size, (self.name, value, len(value), self.size)
+        return value
+
+    def _format_decimal(self, value):
+        value = value or 0
+        value = str(int(value * (10 ** self.decimals)))
+        value = value.rjust(self.size, '0')
+        assert len(value) == self.size, (value, len(value), self.size)
+        return value
 
-        The order that the value is feched is:
+    def format(self, value):
+        """Formats a value of this field to its string representation
 
-            1 - First, the value set by calling set_value.
-            2 - If set_value was not called, then the record this fields
-                belongs to is asked for the value.
-            3 - If the record does not have a value, then the default value is returned
+        This is replaced by the formatter of the field's type when it
+        is constructed.
         """
-        if self.name in ('cnab', '_'):
-            return None
+        return value or ''
 
-        if self.value is not None:
-            return self.value
-        record_value = self.record.get_value(self.name)
-        if record_value is not None:
-            return record_value
-        return self.default_value
 
-    def set_value(self, value):
-        """Sets the value for this field"""
-        self.value = value
+class RecordLayout(object):
+    """The fields of a :class:`Record` class, in the order they are written
 
-    def set_record(self, record):
-        """Sets the record this field belongs to
+    This is built only once for each record class (see
+    :meth:`Record.get_layout`), so the records don't need to copy their
+    fields, apply the replace_fields and validate the size every time.
 
-        :param record: An instance of `Record`
-        """
-        self.record = record
+    :param record_class: a :class:`Record` subclass
+    """
 
-    def as_string(self):
-        """Formats this field to its string representation"""
-        value = self.get_value()
-        # cnab fields are always None
-        if self.name not in ['cnab', '_']:
-            assert value is not None, self.name
-
-        if self.type is str:
-            value = strip_accents(str(value or '')).ljust(self.size)[:self.size]
-        elif self.type is int:
-            value = str(value or 0).rjust(self.size, '0')
-            assert len(value) == self.size, (self.name, value, len(value), self.size)
-        elif self.type is Decimal:
-            value = value or 0
-            value = str(int(value * (10 ** self.decimals)))
-            value = str(value).rjust(self.size, '0')
-            assert len(value) == self.size, (value, len(value), self.size)
+    def __init__(self, record_class):
+        fields = []
+        field_map = {}
+        for field in record_class.fields:
+            field = field.copy()
+            field_map[field.name] = field
+            fields.append(field)
 
-        return value or ''
+        # Replace fields
+        for key, new_values in record_class.replace_fields.items():
+            pos = fields.index(field_map[key])
+            fields.pop(pos)
+            for field in reversed(new_values):
+                field = field.copy()
+                fields.insert(pos, field)
+                field_map[field.name] = field
+
+        # Validate the size
+        size = sum(field.size for field in fields)
+        assert size == record_class.size, (record_class, size)
+
+        #: The names of the fields that can be set on the record constructor
+        self.names = frozenset(field_map)
+
+        #: A (field, formatted, keyword, on_record) tuple for each field, where
+        #: formatted is the string for the fields that are always empty,
+        #: keyword tells if the field takes the value given to the
+        #: constructor and on_record if the value is defined by the record
+        #: class, instead of by the cnab.
+        self.table = []
+        for field in fields:
+            if field.name in ('cnab', '_'):
+                self.table.append((field, field.format(None), False, False))
+                continue
+            self.table.append((field, None, field_map[field.name] is field,
+                               hasattr(record_class, field.name)))
 
 
 class Record(object):
@@ -128,34 +156,24 @@ class Record(object):
     replace_fields = {}
 
     def __init__(self, **kwargs):
-        # Build a new private fields list based on fields and replace fields to
-        # avoid the class fields definition being overwriten by the replace
-        # fields bellow
-        self._fields = []
-        field_map = {}
-        for field in self.fields:
-            field = field.copy()
-            field.set_record(self)
-            field_map[field.name] = field
-            self._fields.append(field)
+        layout = self.get_layout()
+        for key in kwargs:
+            if key not in layout.names:
+                raise KeyError(key)
+        self._values = kwargs
 
-        # Replace fields
-        for key, new_values in self.replace_fields.items():
-            pos = self._fields.index(field_map[key])
-            self._fields.pop(pos)
-            for field in reversed(new_values):
-                field = field.copy()
-                field.set_record(self)
-                self._fields.insert(pos, field)
-                field_map[field.name] = field
+    @classmethod
+    def get_layout(cls):
+        """Get the compiled layout of this record class
 
-        # Validate the size
-        size = sum(field.size for field in self._fields)
-        assert size == self.size, (self, size)
-
-        for key, value in kwargs.items():
-            field = field_map[key]
-            field.set_value(value)
+        :returns: a :class:`RecordLayout`
+        """
+        # Look only on this class, the subclasses have their own layouts
+        layout = cls.__dict__.get('_layout')
+        if layout is None:
+            layout = RecordLayout(cls)
+            cls._layout = layout
+        return layout
 
     def get_value(self, name):
         """Gets a value for a given field name
@@ -176,7 +194,25 @@ class Record(object):
         self.cnab = cnab
 
     def as_string(self):
-        value = ''.join(f.as_string() for f in self._fields)
+        values = self._values
+        parts = []
+        for field, formatted, keyword, on_record in self.get_layout().table:
+            if formatted is not None:
+                parts.append(formatted)
+                continue
+
+            value = values.get(field.name) if keyword else None
+            if value is None:
+                if on_record:
+                    value = getattr(self, field.name)
+                else:
+                    value = self.cnab.get_value(field.name)
+                if value is None:
+                    value = field.default_value
+            assert value is not None, field.name
+            parts.append(field.format(value))
+
+        value = ''.join(parts)
         assert len(value) == self.size, (len(value), self.size)
         return value
 
@@ -206,12 +242,23 @@ class Cnab(object):
         for opt in bank.options:
             self.default_values[opt.option] = opt.value
 
+        # The values already looked up while writing, see write()
+        self._values_cache = None
+
     def get_value(self, field):
         """Gets a value for a given field name
 
         If this spec does not this named field, an AttributeError will be
         raised.
         """
+        cache = self._values_cache
+        if cache is not None:
+            if field not in cache:
+                cache[field] = self._get_value(field)
+            return cache[field]
+        return self._get_value(field)
+
+    def _get_value(self, field):
         if hasattr(self, field):
             return getattr(self, field)
         if field in self.default_values:
@@ -227,9 +274,27 @@ class Cnab(object):
         self.records.append(record)
         return record
 
+    def write(self, fp):
+        """Writes this cnab to a file, one record at a time
+
+        The values that are not specific to each record (e.g. the company
+        and the bank account data) are only looked up once, so they must
+        not be changed while this is being written.
+
+        :param fp: a file opened for writing text
+        """
+        self._values_cache = {}
+        try:
+            for record in self.records:
+                # Cnab requires an extra \r\n at the last line
+                fp.write(record.as_string() + '\r\n')
+        finally:
+            self._values_cache = None
+
     def as_string(self):
-        # Cnab requires an extra \r\n at the last line
-        return '\r\n'.join(r.as_string() for r in self.records) + '\r\n'
+        fp = io.StringIO()
+        self.write(fp)
+        return fp.getvalue()
 
     def __repr__(self):  # pragma no cover
         return '<{} records={}>'.format(self.__class__.__name__, len(self.records))
@@ -28,23 +28,54 @@ of Tributary Planning)
 According to Law 12,741 of 12/08/2012 - Taxes in Coupon.
 """
 from collections import namedtuple
+import glob
+import logging
+import os
+import pickle
+import re
 
 import pkg_resources
 
 import csv
 from decimal import Decimal
 
-from stoqlib.database.runtime import get_current_branch, new_store
+from stoqlib.database.runtime import get_current_branch
 from stoqlib.lib.defaults import quantize
+from stoqlib.lib.osutils import get_application_dir
 from stoqlib.lib.parameters import sysparam
 
+log = logging.getLogger(__name__)
+
 taxes_data = {}
 TaxInfo = namedtuple('TaxInfo', 'nacionalfederal, importadosfederal, estadual,'
                      'fonte, chave')
 
+# Bump this when the contents of the index change, so old ones are rebuilt
+_INDEX_VERSION = 1
 
-def load_taxes_csv(state):
-    """ Load the fields of IBPT table.
+
+def _get_taxes_csv_filename(state):
+    return pkg_resources.resource_filename(
+        'stoq', 'csv/ibpt_tables/TabelaIBPTax%s.csv' % state)
+
+
+def _get_csv_signature(filename):
+    # The index needs to be rebuilt when the table is updated
+    stat = os.stat(filename)
+    return (_INDEX_VERSION, stat.st_size, stat.st_mtime_ns)
+
+
+def get_taxes_index_filename(state):
+    """Get the filename of the prebuilt index of a state's IBPT table
+
+    :param state: the state, e.g. ``'SP'``
+    """
+    return os.path.join(get_application_dir(), 'ibpt',
+                        'TabelaIBPTax%s.pickle' % state)
+
+
+def parse_taxes_csv(filename):
+    """ Parse the fields of IBPT table.
 
     - Fields:
         - ncm: Nomenclatura Comum do Sul.
@@ -60,30 +91,105 @@ def load_taxes_csv(state):
         - chave: Chave que associa a Tabela IBPT baixada com a empresa.
         - versao: Versão das alíquotas usadas para cálculo.
         - Fonte: Fonte
+
+    :param filename: the csv file of the table
+    :returns: a dict mapping the ncm to a dict mapping the ex to the
+      fields of its :class:`TaxInfo`, as a plain tuple (which is a lot
+      faster to unpickle)
+    """
+    # Most of the values are repeated (e.g. the source and the key are the
+    # same for the whole table), share them so the index is more compact
+    values = {}
+    state_taxes_data = {}
+    with open(filename, "r", encoding='latin1') as fp:
+        for (ncm, ex, tipo, descricao, nacionalfederal, importadosfederal,
+             estadual, municipal, vigenciainicio, vigenciafim, chave,
+             versao, fonte) in csv.reader(fp, delimiter=';'):
+            # Ignore service codes (NBS - Nomenclatura Brasileira de Serviços)
+            if tipo == '1':
+                continue
+            tax_dict = state_taxes_data.setdefault(ncm, {})
+            tax_dict[ex] = tuple(values.setdefault(v, v) for v in (
+                nacionalfederal, importadosfederal, estadual, fonte, chave))
+    return state_taxes_data
+
+
+def build_taxes_index(state):
+    """Build the index of a state's IBPT table
+
+    The index is a pickle of the parsed table, which is a lot faster to
+    load than parsing the csv. It is saved on :func:`get_taxes_index_filename`
+
+    :param state: the state, e.g. ``'SP'``
+    :returns: the parsed table, see :func:`parse_taxes_csv`
     """
+    csv_filename = _get_taxes_csv_filename(state)
+    signature = _get_csv_signature(csv_filename)
+    state_taxes_data = parse_taxes_csv(csv_filename)
 
+    filename = get_taxes_index_filename(state)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    # Write to a temporary file first, so other processes never
+    # read a partially written index
+    tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+    with open(tmp_filename, 'wb') as fp:
+        pickle.dump((signature, state_taxes_data), fp,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_filename, filename)
+    return state_taxes_data
+
+
+def build_taxes_indexes():
+    """Build the index of the IBPT tables of all the states
+
+    This should be done when installing or updating, so the first sale of
+    the day doesn't need to wait for the table to be parsed
+    """
+    pattern = _get_taxes_csv_filename('*')
+    for filename in sorted(glob.glob(pattern)):
+        state = re.match('TabelaIBPTax(.*).csv', os.path.basename(filename)).group(1)
+        build_taxes_index(state)
+
+
+def _read_taxes_index(state):
+    try:
+        with open(get_taxes_index_filename(state), 'rb') as fp:
+            signature, state_taxes_data = pickle.load(fp)
+    except (OSError, EOFError, pickle.UnpicklingError) as e:
+        log.info('Could not read the IBPT index for %s: %s', state, e)
+        return None
+
+    if signature != _get_csv_signature(_get_taxes_csv_filename(state)):
+        return None
+    return state_taxes_data
+
+
+def load_taxes_csv(state):
+    """Load the IBPT table of a state into :obj:`taxes_data`
+
+    The table is read from its prebuilt index, which is built if it doesn't
+    exist yet or is out of date. See :func:`build_taxes_index`
+
+    :param state: the state, e.g. ``'SP'``
+    """
     if state in taxes_data:
         return
 
-    filename = pkg_resources.resource_filename('stoq', 'csv/ibpt_tables/TabelaIBPTax%s.csv' % state)
-    csv_file = (csv.reader(open(filename, "r", encoding='latin1'), delimiter=';'))
-
-    state_taxes_data = {}
-    for (ncm, ex, tipo, descricao, nacionalfederal, importadosfederal,
-         estadual, municipal, vigenciainicio, vigenciafim, chave,
-         versao, fonte) in csv_file:
-        # Ignore service codes (NBS - Nomenclatura Brasileira de Serviços)
-        if tipo == '1':
-            continue
-        tax_dict = state_taxes_data.setdefault(ncm, {})
-        tax_dict[ex] = TaxInfo(nacionalfederal, importadosfederal, estadual,
-                               fonte, chave)
+    state_taxes_data = _read_taxes_index(state)
+    if state_taxes_data is None:
+        state_taxes_data = build_taxes_index(state)
     taxes_data[state] = state_taxes_data
 
 
 class IBPTGenerator:
-    def __init__(self, items, include_services=False, branch=None):
-        store = new_store()
+    def __init__(self, items, include_services=False, branch=None, store=None):
+        """
+        :param items: the items to calculate the taxes for
+        :param include_services: if the services should be included
+        :param branch: the branch of the items. Defaults to the current one
+        :param store: the store used to fetch the current branch, if
+          *branch* is not given
+        """
         branch = branch or get_current_branch(store)
         address = branch.person.get_main_address()
         self.state = address.city_location.state
@@ -118,9 +224,9 @@ class IBPTGenerator:
         if n_options == 0:
             tax_values = TaxInfo('0', '0', '0', '', '0')
         elif n_options == 1:
-            tax_values = options['']
+            tax_values = TaxInfo._make(options[''])
         else:
-            tax_values = options.get(ex_tipi) or options['']
+            tax_values = TaxInfo._make(options.get(ex_tipi) or options[''])
         return tax_values
 
     def _calculate_federal_tax(self, item, tax_values):
@@ -180,6 +286,7 @@ class IBPTGenerator:
                                 source=source, key=key)
 
 
-def generate_ibpt_message(items, include_services=False, branch=None):
-    generator = IBPTGenerator(items, include_services, branch)
+def generate_ibpt_message(items, include_services=False, branch=None,
+                          store=None):
+    generator = IBPTGenerator(items, include_services, branch, store)
     return generator.get_ibpt_message()
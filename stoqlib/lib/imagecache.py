@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+"""A local cache for the contents of the images stored on the database"""
+
+import glob
+import hashlib
+import logging
+import os
+import time
+
+from stoqlib.lib.osutils import get_application_dir
+
+log = logging.getLogger(__name__)
+
+_cache = None
+
+
+class ImageCache(object):
+    """A cache of image contents on the disk, keyed by their md5sum
+
+    Since the contents are addressed by their hash, a cached file never
+    needs to be invalidated: modifying an image changes its hash.
+
+    :param directory: the directory where the contents will be stored
+    """
+
+    #: Seconds after which an image that was not used is removed from the cache
+    max_age = 30 * 24 * 60 * 60
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _get_filename(self, md5sum):
+        # Split the files in subdirectories, so none of them gets too big
+        return os.path.join(self.directory, md5sum[:2], md5sum)
+
+    #
+    #  Public API
+    #
+
+    def get(self, md5sum):
+        """Get the content of an image from the cache
+
+        :param md5sum: the md5sum of the content
+        :returns: the content or ``None`` if it is not on the cache
+        """
+        filename = self._get_filename(md5sum)
+        try:
+            with open(filename, 'rb') as f:
+                content = f.read()
+            # The mtime is used to know when it was last used, see prune
+            os.utime(filename)
+        except OSError:
+            return None
+        return content
+
+    def put(self, md5sum, content):
+        """Put the content of an image on the cache
+
+        Errors writing to the cache are only logged, since the
+        content can always be fetched from the database again.
+
+        :param md5sum: the md5sum of the content
+        :param content: the content, as bytes
+        """
+        if hashlib.md5(content).hexdigest() != md5sum:
+            log.warning("The hash %s does not match the image content", md5sum)
+            return
+
+        filename = self._get_filename(md5sum)
+        # Write to a temporary file first, so other processes never
+        # read a partially written image
+        tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(tmp_filename, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_filename, filename)
+        except OSError as e:
+            log.warning("Could not write %s to the images cache: %s", md5sum, e)
+
+    def prune(self):
+        """Remove the images that were not used in :attr:`.max_age` seconds"""
+        limit = time.time() - self.max_age
+        for filename in glob.iglob(os.path.join(self.directory, '*', '*')):
+            try:
+                if os.path.getmtime(filename) < limit:
+                    os.remove(filename)
+            except OSError:
+                pass
+
+
+def get_image_cache():
+    """Get the images cache
+
+    The cache is on the application dir, and it is shared by all the
+    databases this user connects to.
+
+    :returns: an :class:`ImageCache`
+    """
+    global _cache
+    if _cache is None:
+        _cache = ImageCache(os.path.join(get_application_dir(), 'images'))
+        _cache.prune()
+    return _cache
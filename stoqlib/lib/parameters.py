@@ -27,8 +27,10 @@ import collections
 from decimal import Decimal
 from uuid import uuid4
 import logging
+import weakref
 
 from kiwi.datatypes import ValidationError
+from storm.info import get_obj_info
 from stoqdrivers.enum import TaxType
 
 from stoqlib.database.runtime import get_default_store
@@ -1093,11 +1095,74 @@ _details = [
 ]
 
 
+ObjectCacheInfo = collections.namedtuple(
+    'ObjectCacheInfo', 'hits, misses, maxsize, currsize')
+
+
+class _ObjectCache(object):
+    """A bounded LRU cache of parameter objects, one for each store
+
+    Objects are referenced weakly so that the cache will never keep
+    a store (or the objects it loaded) alive. An entry is only used if
+    it still points to the parameter's current id and the object is
+    still valid in its store, otherwise the caller should fetch it again.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # store -> OrderedDict(param_name -> (object id, weakref to object))
+        self._stores = weakref.WeakKeyDictionary()
+
+    def get(self, store, param_name, obj_id):
+        entries = self._stores.get(store, {})
+        cached_id, ref = entries.get(param_name, (None, None))
+        obj = ref() if ref is not None and cached_id == obj_id else None
+        if obj is not None:
+            obj_info = get_obj_info(obj)
+            # Removed (and flushed) objects don't have primary_vars anymore
+            # and invalidated ones need to be checked against the database
+            if (obj_info.get('store') is store and
+                    'primary_vars' in obj_info and
+                    not obj_info.get('invalidated')):
+                entries.move_to_end(param_name)
+                self.hits += 1
+                return obj
+
+        self.misses += 1
+        return None
+
+    def put(self, store, param_name, obj_id, obj):
+        entries = self._stores.get(store)
+        if entries is None:
+            entries = self._stores[store] = collections.OrderedDict()
+        entries[param_name] = (obj_id, weakref.ref(obj))
+        entries.move_to_end(param_name)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def invalidate(self, param_name=None):
+        for entries in list(self._stores.values()):
+            if param_name is None:
+                entries.clear()
+            else:
+                entries.pop(param_name, None)
+
+    def get_info(self):
+        return ObjectCacheInfo(
+            hits=self.hits, misses=self.misses, maxsize=self.maxsize,
+            currsize=sum(len(entries) for entries in self._stores.values()))
+
+
 class ParameterAccess(object):
     """
     API for accessing and updating system parameters
     """
 
+    #: The maximum number of objects cached for each store
+    OBJECT_CACHE_SIZE = 16
+
     def __init__(self):
         # Mapping of details, name -> ParameterDetail
         self._details = collections.OrderedDict()
@@ -1105,16 +1170,45 @@ class ParameterAccess(object):
             self.register_param(detail)
 
         self._values_cache = None
+        self._object_cache = _ObjectCache(self.OBJECT_CACHE_SIZE)
+        # Names of the parameters changed by other stations, filled by
+        # the listener thread and consumed by the next access to _values
+        self._changed_params = collections.deque()
+        self._listener = None
 
     # Lazy Mapping of database raw database values, name -> database value
     @property
     def _values(self):
+        if self._changed_params:
+            self._reload_changed_params()
         if self._values_cache is None:
             self._values_cache = dict(
                 (p.field_name, p.field_value)
                 for p in get_default_store().find(ParameterData))
         return self._values_cache
 
+    def _reload_changed_params(self):
+        names = set()
+        while self._changed_params:
+            names.add(self._changed_params.popleft())
+
+        if None in names:
+            self.clear_cache()
+            return
+        if self._values_cache is None:
+            return
+
+        for name in names:
+            self._object_cache.invalidate(name)
+            self._values_cache.pop(name, None)
+        # Use values() instead of the objects, since the ones already alive
+        # in the default store would not be refreshed
+        results = get_default_store().find(
+            ParameterData, ParameterData.field_name.is_in(list(names)))
+        for name, value in results.values(ParameterData.field_name,
+                                          ParameterData.field_value):
+            self._values_cache[name] = value
+
     def _create_default_values(self, store):
         """Create default values for parameters that take objects"""
         self._set_default_value(store, 'USER_HASH')
@@ -1267,6 +1361,59 @@ class ParameterAccess(object):
     def clear_cache(self):
         """Clears the internal cache so it can be rebuilt on next access"""
         self._values_cache = None
+        self._object_cache.invalidate()
+
+    def fill_cache(self, values):
+        """Fills the internal cache with values fetched somewhere else
+
+        This avoids querying the parameters again on the next access,
+        e.g. when they were fetched together with other data on startup.
+
+        :param values: a dict mapping the parameters' names to their raw
+          database values
+        """
+        self.clear_cache()
+        self._values_cache = dict(values)
+
+    def notify_changed(self, param_name):
+        """Tell that a parameter was changed by another station
+
+        Only the cached value of *param_name* will be reloaded from
+        the database, on the next time any parameter is accessed.
+        This is safe to be called from any thread.
+
+        :param param_name: the parameter name or ``None`` if any
+          parameter may have changed
+        """
+        self._changed_params.append(param_name)
+
+    def start_listening(self):
+        """Start listening for changes made by other stations
+
+        A trigger on `parameter_data` notifies the names of the parameters
+        changed after each commit, so they can be reloaded without
+        reading the whole table again.
+        """
+        from stoqlib.database.notification import NotificationListener
+        if self._listener is None:
+            self._listener = NotificationListener('parameter_data',
+                                                  self.notify_changed)
+        self._listener.start()
+
+    def stop_listening(self):
+        """Stop listening for changes made by other stations"""
+        if self._listener is not None:
+            self._listener.stop()
+
+    def get_object_cache_info(self):
+        """Get statistics about the parameter object cache
+
+        :returns: a :class:`ObjectCacheInfo` with the number of
+          ``hits`` and ``misses`` of :meth:`.get_object` so far, the
+          ``maxsize`` of the cache for each store and its ``currsize``
+          counting all stores
+        """
+        return self._object_cache.get_info()
 
     def ensure_system_parameters(self, store, update=False):
         """
@@ -1305,8 +1452,13 @@ class ParameterAccess(object):
             except ValueError:
                 return expected_type(detail.initial)
         elif isinstance(expected_type, str):
-            field_type = detail.get_parameter_type()
-            return store.get(field_type, str(value))
+            obj = self._object_cache.get(store, param_name, value)
+            if obj is None:
+                field_type = detail.get_parameter_type()
+                obj = store.get(field_type, str(value))
+                if obj is not None:
+                    self._object_cache.put(store, param_name, value, obj)
+            return obj
 
         return value
 
@@ -1420,6 +1572,7 @@ class ParameterAccess(object):
         param.field_value = value
         param.is_editable = detail.is_editable
         self._values[param_name] = value
+        self._object_cache.invalidate(param_name)
 
     def get_object(self, store, param_name):
         """
@@ -1490,6 +1643,7 @@ class ParameterAccess(object):
             threadit(lambda: p.check_running() and p.call('restart'))
 
         self._values[param_name] = value
+        self._object_cache.invalidate(param_name)
 
     def get_details(self):
         return list(self._details.values())
@@ -22,7 +22,6 @@
 ## Author(s): Stoq Team <stoq-devel@async.com.br>
 ##
 
-import atexit
 import glob
 import hashlib
 import io
@@ -30,20 +29,22 @@ import logging
 import os
 import shutil
 import sys
-import tempfile
+import time
 from zipfile import ZipFile, BadZipfile, is_zipfile
 
 from kiwi.desktopparser import DesktopParser
 from stoqlib.lib.component import get_utility, provide_utility
+from storm.expr import Coalesce
 from zope.interface import implementer
 
 from stoqlib.database.exceptions import SQLError
+from stoqlib.database.expr import Md5
 from stoqlib.database.runtime import get_default_store, new_store
 from stoqlib.domain.plugin import InstalledPlugin, PluginEgg
 from stoqlib.lib.interfaces import IPlugin, IPluginManager
 from stoqlib.lib.kiwilibrary import library
 from stoqlib.lib.message import error
-from stoqlib.lib.osutils import get_system_locale
+from stoqlib.lib.osutils import get_application_dir, get_system_locale
 from stoqlib.lib.settings import get_settings
 from stoqlib.lib.translation import stoqlib_gettext as _
 
@@ -112,8 +113,12 @@ class PluginManager(object):
     @important: Never instantialize this class. Always use
     """
 
+    #: Seconds after which an egg that was not used is removed from the cache
+    eggs_cache_max_age = 30 * 24 * 60 * 60
+
     def __init__(self):
         self._eggs_cache = None
+        self._egg_filenames = []
         self._reload()
 
     def get_installed_plugins_names(self, store=None):
@@ -128,7 +133,7 @@ class PluginManager(object):
     def egg_plugins_names(self):
         """A list of names of all plugins installed as eggs"""
         default_store = get_default_store()
-        return [p.plugin_name for p in default_store.find(PluginEgg)]
+        return list(default_store.find(PluginEgg.plugin_name))
 
     @property
     def available_plugins_names(self):
@@ -167,23 +172,64 @@ class PluginManager(object):
         self._create_eggs_cache()
         self._read_plugin_descriptions()
 
+    def _get_egg_cache_filename(self, plugin_name, md5sum):
+        # The eggs are stored by their hash, so a plugin can be updated
+        # without replacing a file that may be in use by another process
+        return os.path.join(self._eggs_cache, md5sum,
+                            '{}.egg'.format(plugin_name))
+
+    def _write_egg(self, filename, content):
+        if hashlib.md5(content).hexdigest() != os.path.basename(os.path.dirname(filename)):
+            log.warning("The hash of the egg %s does not match its content", filename)
+
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        # Write to a temporary file first, so other processes never
+        # load a partially written egg
+        tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+        with open(tmp_filename, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_filename, filename)
+
+    def _prune_eggs_cache(self):
+        # The cache is shared by all the databases this user connects to,
+        # so only remove the eggs that were not used in a long time.
+        # The directory's mtime is updated every time its egg is used
+        limit = time.time() - self.eggs_cache_max_age
+        for dirname in glob.iglob(os.path.join(self._eggs_cache, '*')):
+            try:
+                if os.path.getmtime(dirname) < limit:
+                    log.info("Removing unused egg cache %s", dirname)
+                    shutil.rmtree(dirname, ignore_errors=True)
+            except OSError:
+                pass
+
     def _create_eggs_cache(self):
-        self._eggs_cache = tempfile.mkdtemp(prefix='stoq', suffix='eggs')
-        log.info("Eggs cache created in %s", self._eggs_cache)
+        self._eggs_cache = os.path.join(get_application_dir(), 'eggs')
+        self._egg_filenames = []
+        log.info("Using the eggs cache in %s", self._eggs_cache)
 
-        # Now extract all eggs from the database and put it where stoq know
-        # how to load them
+        # Fetch only the hashes first, the eggs' contents are only fetched
+        # when they are not on the cache yet, which should be rare
         default_store = get_default_store()
-        for plugin_egg in default_store.find(PluginEgg):
-            plugin_name = plugin_egg.plugin_name
-            log.info("Creating egg cache for plugin %r" % (plugin_name, ))
-
-            egg_filename = '{}.egg'.format(plugin_name)
-            with open(os.path.join(self._eggs_cache, egg_filename), 'wb') as f:
-                f.write(plugin_egg.egg_content)
-
-        atexit.register(
-            lambda: shutil.rmtree(self._eggs_cache, ignore_errors=True))
+        md5sum = Coalesce(PluginEgg.egg_md5sum, Md5(PluginEgg.egg_content))
+        missing = {}
+        for plugin_name, egg_md5sum in default_store.find(
+                (PluginEgg.plugin_name, md5sum)):
+            filename = self._get_egg_cache_filename(plugin_name, egg_md5sum)
+            if os.path.exists(filename):
+                os.utime(os.path.dirname(filename))
+            else:
+                missing[plugin_name] = filename
+            self._egg_filenames.append(filename)
+
+        if missing:
+            for plugin_name, egg_content in default_store.find(
+                    (PluginEgg.plugin_name, PluginEgg.egg_content),
+                    PluginEgg.plugin_name.is_in(list(missing))):
+                log.info("Creating egg cache for plugin %r" % (plugin_name, ))
+                self._write_egg(missing[plugin_name], egg_content)
+
+        self._prune_eggs_cache()
 
     def _get_external_plugins_paths(self):
         # This is the dir containing stoq/kiwi/stoqdrivers/etc
@@ -200,8 +246,9 @@ class PluginManager(object):
         # Development plugins on the same checkout
         paths = [os.path.join(library.get_root(), 'plugins')]
 
-        # Plugins from PluginEgg
-        paths.append(self._eggs_cache)
+        # Plugins from PluginEgg. Those are not on a single directory,
+        # see _create_eggs_cache
+        paths.extend(self._egg_filenames)
 
         if library.get_resource_exists('stoq', 'plugins'):
             paths.append(library.get_resource_filename('stoq', 'plugins'))
@@ -209,6 +256,9 @@ class PluginManager(object):
         paths.extend(list(self._get_external_plugins_paths()))
 
         for path in paths:
+            if path.endswith('.egg'):
+                self.register_plugin_description(path, is_egg=True)
+                continue
             for filename in glob.iglob(os.path.join(path, '*', '*.plugin')):
                 self.register_plugin_description(filename)
             for filename in glob.iglob(os.path.join(path, '*.egg')):
@@ -245,9 +295,8 @@ class PluginManager(object):
         from stoqlib.lib.webservice import WebService
 
         default_store = get_default_store()
-        existing_egg = default_store.find(PluginEgg,
-                                          plugin_name=plugin_name).one()
-        md5sum = existing_egg and existing_egg.egg_md5sum
+        md5sum = default_store.find(PluginEgg.egg_md5sum,
+                                    PluginEgg.plugin_name == plugin_name).one()
         webapi = WebService()
         r = webapi.download_plugin(plugin_name, md5sum=md5sum, channel=channel)
 
@@ -434,14 +483,18 @@ class PluginManager(object):
                       'Por favor reinicie todas as instancias do Stoq que '
                       'estiver executando (%s)' % (e, ))
 
-    def activate_installed_plugins(self):
+    def activate_installed_plugins(self, installed_plugins=None):
         """Activate all installed plugins
 
         A helper method to activate all installed plugins in just one
         call, without having to get and activate one by one.
+
+        :param installed_plugins: the names of the installed plugins, if
+          they were already fetched
         """
         available_plugins = self.available_plugins_names
-        installed_plugins = self.installed_plugins_names
+        if installed_plugins is None:
+            installed_plugins = self.installed_plugins_names
 
         replace_dict = {}
         for plugin_name in available_plugins:
@@ -23,10 +23,63 @@
 ##
 """ Templating """
 
+import functools
+import hashlib
+import logging
+import os
+
 import pkg_resources
 from mako.lookup import TemplateLookup
 from mako.template import Template
 
+from stoqlib.lib.osutils import get_application_dir
+
+log = logging.getLogger(__name__)
+
+_TEMPLATE_OPTIONS = dict(output_encoding='utf8', input_encoding='utf8',
+                         default_filters=['h'])
+_lookup = None
+
+
+def _get_module_directory(directories):
+    # Mako only checks if the compiled module is newer than the template,
+    # so different installations (which have different template directories)
+    # cannot share the same modules
+    key = hashlib.md5(directories.encode()).hexdigest()
+    module_directory = os.path.join(get_application_dir(), 'templates', key)
+    try:
+        os.makedirs(module_directory, exist_ok=True)
+    except OSError as e:
+        log.warning("Could not create the templates cache on %s: %s",
+                    module_directory, e)
+        return None
+    return module_directory
+
+
+def get_template_lookup():
+    """Get the lookup used to find the templates
+
+    The lookup is shared by the whole process, so each template is only
+    compiled once. The compiled templates are also saved on the disk, so
+    they don't need to be compiled again when stoq is restarted.
+    A template is compiled again when its file is modified.
+
+    :returns: a mako TemplateLookup
+    """
+    global _lookup
+    if _lookup is None:
+        directories = pkg_resources.resource_filename('stoq', 'template')
+        _lookup = TemplateLookup(directories=directories,
+                                 module_directory=_get_module_directory(directories),
+                                 filesystem_checks=True,
+                                 **_TEMPLATE_OPTIONS)
+    return _lookup
+
+
+@functools.lru_cache(maxsize=32)
+def _get_string_template(template):
+    return Template(template, **_TEMPLATE_OPTIONS)
+
 
 def render_template(filename, **ns):
     """Renders a template giving a filename and a keyword dictionary
@@ -34,11 +87,7 @@ def render_template(filename, **ns):
     @kwargs: keyword arguments to send to the template
     @return: the rendered template
     """
-    directories = pkg_resources.resource_filename('stoq', 'template')
-    lookup = TemplateLookup(directories=directories,
-                            output_encoding='utf8', input_encoding='utf8',
-                            default_filters=['h'])
-    tmpl = lookup.get_template(filename)
+    tmpl = get_template_lookup().get_template(filename)
 
     return tmpl.render(**ns).decode()
 
@@ -49,6 +98,4 @@ def render_template_string(template, **ns):
     :param kwargs: keyword arguments to send to the template
     :return: the rendered template
     """
-    return Template(template,
-                    output_encoding='utf8', input_encoding='utf8',
-                    default_filters=['h']).render(**ns)
+    return _get_string_template(template).render(**ns)
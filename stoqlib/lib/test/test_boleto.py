@@ -26,6 +26,7 @@ import collections
 import datetime
 from decimal import Decimal
 from unittest import mock
+import multiprocessing
 import os
 import tempfile
 
@@ -37,10 +38,12 @@ from stoqlib.lib.boleto import (
     BankCaixa, BankItau, BankReal, BoletoException, BankInfo, BILL_OPTION_CUSTOM)
 from stoqlib.domain.account import BankAccount, BillOption
 from stoqlib.domain.payment.method import PaymentMethod
+from stoqlib.domain.payment.payment import Payment
 from stoqlib.domain.test.domaintest import DomainTest
 from stoqlib.lib.diffutils import diff_pdf_htmls
 from stoqlib.lib.pdf import pdftohtml
-from stoqlib.reporting.boleto import BillReport
+from stoqlib.reporting.boleto import (BillReport, BoletoPDF, _get_worker_args,
+                                      _init_worker, _render_batch)
 from stoqlib.lib.unittestutils import get_tests_datadir
 
 
@@ -120,6 +123,15 @@ class TestBillReport(DomainTest):
         diff = diff_pdf_htmls(expected, generated)
         self.assertFalse(diff, '%s\n%s' % ("Files differ, output:", diff))
 
+    def _get_pdf_texts(self, filename):
+        import gi
+        gi.require_version('Poppler', '0.18')
+        from gi.repository import Gio, Poppler
+        uri = Gio.File.new_for_path(filename).get_uri()
+        document = Poppler.Document.new_from_file(uri, password="")
+        return [document.get_page(i).get_text()
+                for i in range(document.get_n_pages())]
+
     def test_banco_do_brasil(self):
         sale = self._create_bill_sale()[0]
         self._configure_boleto(u"001",
@@ -189,6 +201,84 @@ class TestBillReport(DomainTest):
         payments = payments[::-1]
         self._diff(sale, 'boleto-001-carne', payments=payments)
 
+    def test_save_chunks(self):
+        payments = self._create_bill_sale(installments=5)[1]
+        self._configure_boleto(u"001",
+                               convenio=u"12345678",
+                               agency=u"1172",
+                               account=u"00403005",
+                               especie_documento=u"DM")
+
+        report = BillReport(self._filename, payments)
+        self.assertFalse(report.use_chunks())
+        report.save()
+        expected = self._get_pdf_texts(self._filename)
+
+        report = BillReport(self._filename, payments)
+        report.chunk_size = 2
+        self.assertTrue(report.use_chunks())
+        # Render the batches on this process, where the payments are visible
+        with mock.patch('stoqlib.reporting.boleto.multiprocessing') as mp, \
+                mock.patch('stoqlib.reporting.boleto.new_store') as new_store, \
+                mock.patch.object(self.store, 'rollback'):
+            mp.get_context.return_value.Pool = _InProcessPool
+            new_store.return_value = self.store
+            self.assertEqual(list(report.save_chunks()),
+                             [(2, 5), (4, 5), (5, 5)])
+        # Forking the GUI, which has other threads running, is not safe
+        mp.get_context.assert_called_once_with('spawn')
+
+        # 2 bills on each page
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(self._get_pdf_texts(self._filename), expected)
+
+    def test_render_batch(self):
+        bill = PaymentMethod.get_by_name(self.store, u'bill')
+        payment = self.store.find(Payment, method=bill,
+                                  payment_type=Payment.TYPE_IN,
+                                  status=Payment.STATUS_PENDING).order_by(
+                                      Payment.identifier).first()
+        # The worker only sees what is committed, so the bank account
+        # is committed and then removed
+        bank_account = BankAccount(account=bill.destination_account,
+                                   bank_account=u"00403005",
+                                   bank_branch=u"1172",
+                                   bank_number=1,
+                                   store=self.store)
+        option = BillOption(store=self.store, bank_account=bank_account,
+                            option=u'convenio', value=u'12345678')
+        self.store.commit()
+        try:
+            # A spawned process has none of the modules of this one, like
+            # the domain tables the payment references
+            mp_context = multiprocessing.get_context('spawn')
+            with mp_context.Pool(1, initializer=_init_worker,
+                                 initargs=_get_worker_args()) as pool:
+                batch = ([payment.id], BoletoPDF.FORMAT_BOLETO, self._filename)
+                self.assertEqual(pool.apply(_render_batch, (batch, )), 1)
+        finally:
+            self.store.remove(option)
+            self.store.remove(bank_account)
+            self.store.commit()
+
+        self.assertEqual(len(self._get_pdf_texts(self._filename)), 1)
+
+
+class _InProcessPool(object):
+    def __init__(self, processes, initializer=None, initargs=()):
+        # The initializer would replace the config of this process,
+        # see test_render_batch for a real worker
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def imap(self, func, iterable):
+        return map(func, iterable)
+
 
 class TestBank(BankInfo):
     description = 'Test Bank'
@@ -25,6 +25,7 @@
 import datetime
 from decimal import Decimal
 from unittest import mock
+import io
 import os
 
 from stoqlib.lib.boleto import (BankInfo, custom_property, BILL_OPTION_CUSTOM,
@@ -207,6 +208,33 @@ class TestRecord(DomainTest):
         b = Bar(bar=1, bin='teste')
         self.assertEqual(b.as_string(), '001te')
 
+    def test_get_layout(self):
+        class Foo(Record):
+            size = 5
+            fields = [Field('foo', int, 5)]
+
+        class Bar(Foo):
+            size = 5
+            replace_fields = dict(
+                foo=[Field('bar', int, 3), Field('bin', str, 2)]
+            )
+
+        # The layout is compiled only once for each class
+        self.assertIs(Foo.get_layout(), Foo.get_layout())
+        self.assertIsNot(Bar.get_layout(), Foo.get_layout())
+        self.assertEqual(Foo.get_layout().names, {'foo'})
+        self.assertEqual(Bar.get_layout().names, {'bar', 'bin'})
+
+        with self.assertRaises(KeyError):
+            Bar(foo=1)
+
+        class Baz(Record):
+            size = 4
+            fields = [Field('baz', int, 5)]
+
+        with self.assertRaises(AssertionError):
+            Baz()
+
     def test_get_value(self):
         class Foo(Record):
             some_property = 4
@@ -260,6 +288,21 @@ class TestCnab(DomainTest):
         cnab.add_record(FooRecord, foo=3)
         self.assertEqual(cnab.as_string(), '00003\r\n')
 
+    def test_write(self):
+        cnab = FebrabanCnab(self.branch, self.bank, self.info)
+        cnab.add_record(FooRecord, foo=3)
+        cnab.add_record(FooRecord)
+        cnab.foo = 7
+
+        fp = io.StringIO()
+        cnab.write(fp)
+        self.assertEqual(fp.getvalue(), '00003\r\n00007\r\n')
+
+        # The values are only cached while writing
+        cnab.foo = 8
+        self.assertEqual(cnab.get_value('foo'), 8)
+        self.assertEqual(cnab.as_string(), '00003\r\n00008\r\n')
+
 
 class CnabTestMixin(object):
     cnab_class = BBCnab
@@ -321,6 +364,13 @@ class CnabTestMixin(object):
             cnab = info.get_cnab(payments)
         self._compare_files(cnab, 'cnab-%03d' % self.bank_number)
 
+        with self.sysparam(BILL_PENALTY=Decimal(11),
+                           BILL_INTEREST=Decimal('0.4'),
+                           BILL_DISCOUNT=Decimal('123.45')):
+            fp = io.StringIO()
+            info.write_cnab(payments, fp)
+        self.assertEqual(fp.getvalue(), cnab)
+
 
 class TestBBCnab(CnabTestMixin, DomainTest):
     bank_number = 1
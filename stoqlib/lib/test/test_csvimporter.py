@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from stoqlib.domain.test.domaintest import DomainTest
+from stoqlib.importers.csvimporter import CSVImporter
+
+
+CSV_DATA = """% name,value
+foo,1
+bar,2
+baz,3
+"""
+
+
+class _NameImporter(CSVImporter):
+    fields = ['name', 'value']
+
+    def __init__(self):
+        super(_NameImporter, self).__init__()
+        self.processed = []
+        self.skipped = []
+
+    def process_one(self, data, fields, store):
+        self.processed.append(data.name)
+
+    def skip_one(self, data):
+        self.skipped.append(data.name)
+
+
+class CSVImporterTest(DomainTest):
+
+    def setUp(self):
+        super(CSVImporterTest, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'names.csv')
+        with open(self.filename, 'w') as fp:
+            fp.write(CSV_DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        super(CSVImporterTest, self).tearDown()
+
+    def test_process(self):
+        importer = _NameImporter()
+        importer.feed_file(self.filename)
+        importer.set_dry(True)
+        self.assertEqual(importer.get_n_items(), 4)
+        # The rows are only read while processing
+        self.assertIsNone(importer.rows)
+
+        importer.process(self.store)
+        self.assertEqual(importer.processed, ['foo', 'bar', 'baz'])
+        self.assertEqual(importer.skipped, [])
+
+    def test_process_not_seekable(self):
+        fp = StringIO(CSV_DATA)
+        fp.seekable = lambda: False
+        importer = _NameImporter()
+        importer.feed(fp)
+        importer.set_dry(True)
+        self.assertEqual(importer.get_n_items(), 4)
+
+        importer.process(self.store)
+        self.assertEqual(importer.processed, ['foo', 'bar', 'baz'])
+
+    def test_process_resume(self):
+        importer = _NameImporter()
+        importer.feed_file(self.filename)
+        importer.set_dry(True)
+        importer.set_resume(True)
+        with open(importer.get_checkpoint_filename(), 'w') as fp:
+            fp.write('2\n')
+
+        importer.process(self.store)
+        self.assertEqual(importer.skipped, ['foo'])
+        self.assertEqual(importer.processed, ['bar', 'baz'])
+
+    def test_checkpoint(self):
+        importer = _NameImporter()
+        self.assertIsNone(importer.get_checkpoint_filename())
+        importer.feed_file(self.filename)
+        self.assertEqual(importer.get_checkpoint_filename(),
+                         self.filename + '.checkpoint')
+
+        self.assertEqual(importer._read_checkpoint(), 0)
+        importer._write_checkpoint(100)
+        self.assertEqual(importer._read_checkpoint(), 100)
+        importer._remove_checkpoint()
+        self.assertFalse(os.path.exists(importer.get_checkpoint_filename()))
+
+    def test_process_workers_not_supported(self):
+        importer = _NameImporter()
+        importer.feed_file(self.filename)
+        importer.set_dry(True)
+        importer.set_workers(4)
+        self.assertFalse(importer.supports_parallel)
+
+        # Imported on this process, since the importer does not support it
+        importer.process(self.store)
+        self.assertEqual(importer.processed, ['foo', 'bar', 'baz'])
+
+    def test_iter_rows(self):
+        importer = _NameImporter()
+        importer.feed_file(self.filename)
+        self.assertEqual([row.name for row in importer.iter_rows()],
+                         ['foo', 'bar', 'baz'])
+        # It can be iterated again
+        self.assertEqual(len(list(importer.iter_rows())), 3)
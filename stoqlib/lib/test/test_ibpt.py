@@ -23,11 +23,18 @@
 ##
 
 from decimal import Decimal
+import os
+import shutil
+import tempfile
+from unittest import mock
 
 from stoqlib.database.runtime import get_current_branch
 from stoqlib.domain.taxes import ProductTaxTemplate, ProductIcmsTemplate
 from stoqlib.domain.test.domaintest import DomainTest
-from stoqlib.lib.ibpt import IBPTGenerator, generate_ibpt_message
+from stoqlib.lib import ibpt
+from stoqlib.lib.ibpt import (IBPTGenerator, generate_ibpt_message,
+                              build_taxes_index, get_taxes_index_filename,
+                              load_taxes_csv, taxes_data)
 
 
 class TestCalculateTaxForItem(DomainTest):
@@ -162,3 +169,57 @@ class TestCalculateTaxForItem(DomainTest):
         expected_federal_tax = total_item * (Decimal("21.45") / 100)
         federal = generator._calculate_federal_tax(sale_item, tax_values)
         self.assertEqual(federal, expected_federal_tax)
+
+
+class TestTaxesIndex(DomainTest):
+    def setUp(self):
+        super(TestTaxesIndex, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        patchers = [
+            mock.patch('stoqlib.lib.ibpt.get_application_dir',
+                       return_value=self.tempdir),
+            # Do not mess with the tables loaded by the other tests
+            mock.patch.dict(taxes_data, clear=True),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        super(TestTaxesIndex, self).tearDown()
+
+    def test_load_taxes_csv(self):
+        self.assertFalse(os.path.exists(get_taxes_index_filename('SP')))
+        # The index is built the first time it is needed
+        load_taxes_csv('SP')
+        self.assertTrue(os.path.exists(get_taxes_index_filename('SP')))
+        self.assertEqual(taxes_data['SP']['01012100'][''][:3],
+                         ('4.20', '6.20', '18.00'))
+
+        # And used after that, without parsing the csv again
+        taxes_data.clear()
+        with mock.patch.object(ibpt, 'parse_taxes_csv') as parse_taxes_csv:
+            load_taxes_csv('SP')
+        self.assertEqual(parse_taxes_csv.call_count, 0)
+        self.assertEqual(taxes_data['SP']['01012100'][''][:3],
+                         ('4.20', '6.20', '18.00'))
+
+    def test_load_taxes_csv_outdated(self):
+        build_taxes_index('SP')
+        # The table was updated after the index was built
+        with mock.patch.object(ibpt, '_get_csv_signature',
+                               return_value=(0, 0, 0)):
+            with mock.patch.object(ibpt, 'parse_taxes_csv',
+                                   return_value={}) as parse_taxes_csv:
+                load_taxes_csv('SP')
+        self.assertEqual(parse_taxes_csv.call_count, 1)
+        self.assertEqual(taxes_data['SP'], {})
+
+    def test_load_taxes_csv_corrupted(self):
+        filename = get_taxes_index_filename('SP')
+        os.makedirs(os.path.dirname(filename))
+        with open(filename, 'wb') as fp:
+            fp.write(b'corrupted')
+        load_taxes_csv('SP')
+        self.assertIn('01012100', taxes_data['SP'])
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from stoqlib.lib.imagecache import ImageCache, get_image_cache
+
+
+class TestImageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = ImageCache(self.tempdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_get_put(self):
+        md5sum = hashlib.md5(b'image').hexdigest()
+        self.assertIsNone(self.cache.get(md5sum))
+
+        self.cache.put(md5sum, b'image')
+        self.assertEqual(self.cache.get(md5sum), b'image')
+        self.assertTrue(os.path.exists(
+            os.path.join(self.tempdir, md5sum[:2], md5sum)))
+
+    def test_put_wrong_hash(self):
+        md5sum = hashlib.md5(b'image').hexdigest()
+        self.cache.put(md5sum, b'other image')
+        self.assertIsNone(self.cache.get(md5sum))
+
+    def test_prune(self):
+        old = hashlib.md5(b'old').hexdigest()
+        new = hashlib.md5(b'new').hexdigest()
+        self.cache.put(old, b'old')
+        self.cache.put(new, b'new')
+        mtime = time.time() - self.cache.max_age - 10
+        os.utime(os.path.join(self.tempdir, old[:2], old), (mtime, mtime))
+
+        self.cache.prune()
+        self.assertIsNone(self.cache.get(old))
+        self.assertEqual(self.cache.get(new), b'new')
+
+    def test_get_image_cache(self):
+        with mock.patch('stoqlib.lib.imagecache.get_application_dir',
+                        return_value=self.tempdir), \
+                mock.patch('stoqlib.lib.imagecache._cache', None):
+            cache = get_image_cache()
+            self.assertIs(get_image_cache(), cache)
+            self.assertEqual(cache.directory, os.path.join(self.tempdir, 'images'))
@@ -25,6 +25,7 @@
 
 from decimal import Decimal
 
+from stoqlib.database.runtime import new_store
 from stoqlib.lib.parameters import sysparam
 from stoqlib.domain.address import CityLocation
 from stoqlib.domain.person import (Branch, Client, Company, Employee,
@@ -88,6 +89,82 @@ class TestParameter(DomainTest):
             self.store, 'DELIVERY_SERVICE')
         assert isinstance(service, Service)
 
+    def test_get_object_cache(self):
+        service = self.create_service()
+        other_service = self.create_service()
+        with self.sysparam(DELIVERY_SERVICE=service):
+            info = self.sparam.get_object_cache_info()
+            self.assertEqual(
+                self.sparam.get_object(self.store, 'DELIVERY_SERVICE'),
+                service)
+            self.assertEqual(self.sparam.get_object_cache_info().misses,
+                             info.misses + 1)
+            self.assertEqual(
+                self.sparam.get_object(self.store, 'DELIVERY_SERVICE'),
+                service)
+            self.assertEqual(self.sparam.get_object_cache_info().hits,
+                             info.hits + 1)
+
+            # Setting the parameter again must not return the old object
+            self.sparam.set_object(self.store, 'DELIVERY_SERVICE',
+                                   other_service)
+            self.assertEqual(
+                self.sparam.get_object(self.store, 'DELIVERY_SERVICE'),
+                other_service)
+
+            # Neither should a value changed somewhere else
+            self.sparam.set_value_generic('DELIVERY_SERVICE', str(service.id))
+            self.assertEqual(
+                self.sparam.get_object(self.store, 'DELIVERY_SERVICE'),
+                service)
+
+    def test_get_object_cache_per_store(self):
+        store = new_store()
+        try:
+            supplier = self.sparam.get_object(store, 'SUGGESTED_SUPPLIER')
+            self.assertIs(
+                self.sparam.get_object(store, 'SUGGESTED_SUPPLIER'), supplier)
+            self.assertIsNot(
+                self.sparam.get_object(self.store, 'SUGGESTED_SUPPLIER'),
+                supplier)
+        finally:
+            store.close()
+
+    def test_get_object_cache_invalidated(self):
+        supplier = self.sparam.get_object(self.store, 'SUGGESTED_SUPPLIER')
+        self.store.invalidate(supplier)
+
+        info = self.sparam.get_object_cache_info()
+        self.assertIs(
+            self.sparam.get_object(self.store, 'SUGGESTED_SUPPLIER'), supplier)
+        # An invalidated object has to be checked against the database again
+        self.assertEqual(self.sparam.get_object_cache_info().misses,
+                         info.misses + 1)
+
+    def test_get_object_cache_size(self):
+        self.sparam.clear_cache()
+        params = [d.key for d in self.sparam.get_details()
+                  if isinstance(d.type, str) and '.' in d.type]
+        for param in params:
+            self.sparam.get_object(self.store, param)
+
+        info = self.sparam.get_object_cache_info()
+        self.assertLessEqual(info.currsize, info.maxsize)
+
+    def test_notify_changed(self):
+        value = self.sparam.get_string('LABEL_COLUMNS')
+        self.sparam.set_value_generic('LABEL_COLUMNS', 'foo,bar')
+        other_value = self.sparam.get_bool('POS_FULL_SCREEN')
+        self.sparam.set_value_generic('POS_FULL_SCREEN', '1')
+
+        # Only the changed parameter is reloaded from the database
+        self.sparam.notify_changed('LABEL_COLUMNS')
+        self.assertEqual(self.sparam.get_string('LABEL_COLUMNS'), value)
+        self.assertTrue(self.sparam.get_bool('POS_FULL_SCREEN'))
+
+        self.sparam.notify_changed(None)
+        self.assertEqual(self.sparam.get_bool('POS_FULL_SCREEN'), other_value)
+
     # System constants based on stoq.lib.parameters
 
     def test_pos_full_screen(self):
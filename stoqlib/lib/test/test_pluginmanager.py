@@ -28,6 +28,9 @@
 import contextlib
 import io
 import os
+import shutil
+import tempfile
+import time
 import zipfile
 
 from unittest import mock
@@ -138,11 +141,15 @@ class TestPluginManager(DomainTest):
     #  Tests
     #
 
+    @mock.patch('stoqlib.lib.pluginmanager.get_application_dir')
     @mock.patch('stoqlib.lib.pluginmanager.get_default_store')
-    def test_create_eggs_cache(self, get_default_store):
+    def test_create_eggs_cache(self, get_default_store, get_application_dir):
         original_eggs_cache = self._manager._eggs_cache
+        original_egg_filenames = self._manager._egg_filenames
+        tempdir = tempfile.mkdtemp()
         try:
             get_default_store.return_value = self.store
+            get_application_dir.return_value = tempdir
 
             PluginEgg(store=self.store, plugin_name=u'foobar',
                       egg_content=b'lorem',
@@ -156,20 +163,61 @@ class TestPluginManager(DomainTest):
 
             self._manager._create_eggs_cache()
             plugins_dir = self._manager._eggs_cache
+            self.assertEqual(plugins_dir, os.path.join(tempdir, 'eggs'))
 
-            with open(os.path.join(plugins_dir, 'foobar.egg')) as f:
+            foobar_egg = os.path.join(plugins_dir, 'e194544df936c31ebf9b4c2d4a6ef213',
+                                      'foobar.egg')
+            with open(foobar_egg) as f:
                 self.assertEqual(f.read(), 'lorem')
 
-            with open(os.path.join(plugins_dir, 'foo.egg')) as f:
+            with open(os.path.join(plugins_dir, '2b3bd636ec90eb39c3c171dd831b8c30',
+                                   'foo.egg')) as f:
                 self.assertEqual(f.read(), 'ipsum')
 
-            with open(os.path.join(plugins_dir, 'bar.egg')) as f:
+            with open(os.path.join(plugins_dir, '5f084b7281515082703bd903708c977a',
+                                   'bar.egg')) as f:
                 self.assertEqual(f.read(), 'lorem ipsum')
 
+            self.assertEqual(set(os.path.basename(f) for f in self._manager._egg_filenames),
+                             {'foobar.egg', 'foo.egg', 'bar.egg'})
             self.assertEqual(set(self._manager.egg_plugins_names),
                              {'foobar', 'foo', 'bar'})
+
+            # The eggs that are already on the cache are not written again
+            with open(foobar_egg, 'w') as f:
+                f.write('cached')
+            self._manager._create_eggs_cache()
+            with open(foobar_egg) as f:
+                self.assertEqual(f.read(), 'cached')
+        finally:
+            self._manager._eggs_cache = original_eggs_cache
+            self._manager._egg_filenames = original_egg_filenames
+            shutil.rmtree(tempdir, ignore_errors=True)
+
+    @mock.patch('stoqlib.lib.pluginmanager.get_application_dir')
+    @mock.patch('stoqlib.lib.pluginmanager.get_default_store')
+    def test_create_eggs_cache_prune(self, get_default_store, get_application_dir):
+        original_eggs_cache = self._manager._eggs_cache
+        original_egg_filenames = self._manager._egg_filenames
+        tempdir = tempfile.mkdtemp()
+        try:
+            get_default_store.return_value = self.store
+            get_application_dir.return_value = tempdir
+
+            old_dir = os.path.join(tempdir, 'eggs', 'old')
+            recent_dir = os.path.join(tempdir, 'eggs', 'recent')
+            os.makedirs(old_dir)
+            os.makedirs(recent_dir)
+            old_time = time.time() - self._manager.eggs_cache_max_age - 1
+            os.utime(old_dir, (old_time, old_time))
+
+            self._manager._create_eggs_cache()
+            self.assertFalse(os.path.exists(old_dir))
+            self.assertTrue(os.path.exists(recent_dir))
         finally:
             self._manager._eggs_cache = original_eggs_cache
+            self._manager._egg_filenames = original_egg_filenames
+            shutil.rmtree(tempdir, ignore_errors=True)
 
     @mock.patch('stoqlib.lib.webservice.WebService.download_plugin')
     @mock.patch('stoqlib.lib.pluginmanager.new_store')
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from stoqlib.lib import template
+from stoqlib.lib.template import get_template_lookup, render_template_string
+
+
+class TestTemplate(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.template_dir = os.path.join(self.tempdir, 'template')
+        os.makedirs(self.template_dir)
+        self._write_template('${name | n}')
+
+        patches = [
+            mock.patch('pkg_resources.resource_filename',
+                       return_value=self.template_dir),
+            mock.patch('stoqlib.lib.template.get_application_dir',
+                       return_value=self.tempdir),
+            mock.patch('stoqlib.lib.template._lookup', None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _write_template(self, content, mtime=None):
+        filename = os.path.join(self.template_dir, 'test.html')
+        with open(filename, 'w') as fp:
+            fp.write(content)
+        if mtime is not None:
+            os.utime(filename, (mtime, mtime))
+
+    def test_render_template(self):
+        lookup = get_template_lookup()
+        self.assertIs(get_template_lookup(), lookup)
+        self.assertEqual(template.render_template('test.html', name='foo'), 'foo')
+
+        # The compiled template is saved on the disk
+        self.assertTrue(lookup.module_directory.startswith(self.tempdir))
+        self.assertTrue(os.path.exists(
+            os.path.join(lookup.module_directory, 'test.html.py')))
+
+        # Modifying the template invalidates the cache
+        stat = os.stat(os.path.join(self.template_dir, 'test.html'))
+        self._write_template('${name | n}!', mtime=stat.st_mtime + 10)
+        self.assertEqual(template.render_template('test.html', name='foo'), 'foo!')
+
+    def test_render_template_string(self):
+        self.assertEqual(render_template_string('<${name}>', name='<foo>'),
+                         b'<&lt;foo&gt;>')
+        info = template._get_string_template.cache_info()
+        self.assertEqual(render_template_string('<${name}>', name='bar'),
+                         b'<bar>')
+        self.assertEqual(template._get_string_template.cache_info().hits,
+                         info.hits + 1)
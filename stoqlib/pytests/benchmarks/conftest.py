@@ -0,0 +1,47 @@
+import contextlib
+import os
+import time
+
+import pytest
+
+
+def pytest_collection_modifyitems(config, items):
+    # Benchmarks are slow and their results are only meaningful when looked
+    # at by a person, so they only run when explicitly asked for
+    if os.environ.get('STOQ_RUN_BENCHMARKS'):
+        return
+
+    skip = pytest.mark.skip(reason="set STOQ_RUN_BENCHMARKS=1 to run")
+    benchmarks_dir = os.path.dirname(__file__)
+    for item in items:
+        if str(item.fspath).startswith(benchmarks_dir):
+            item.add_marker(skip)
+
+
+class _Timer:
+
+    def __init__(self):
+        self.results = []
+
+    @contextlib.contextmanager
+    def __call__(self, name):
+        t = time.perf_counter()
+        yield
+        self.results.append((name, time.perf_counter() - t))
+
+    def get(self, name):
+        return dict(self.results)[name]
+
+
+@pytest.fixture
+def timer(request):
+    """Measure how long blocks of code take
+
+    Use it as ``with timer('name'): ...``. All the measures are printed at
+    the end of the test (use ``pytest -s`` to see them).
+    """
+    timer = _Timer()
+    yield timer
+    print()
+    for name, elapsed in timer.results:
+        print('%s: %s %.3fs' % (request.node.name, name, elapsed))
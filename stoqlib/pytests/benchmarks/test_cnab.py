@@ -0,0 +1,82 @@
+import io
+
+import pytest
+
+from stoqlib.lib.boleto import get_all_banks
+
+_BANKS = [bank for bank in get_all_banks() if getattr(bank, 'cnab_class', None)]
+
+_BILL_OPTIONS = {
+    u'carteira': u'109',
+    u'convenio': u'1234567',
+    u'identificacao_produto': u'1',
+    u'codigo_beneficiario': u'123456',
+    u'codigo_convenio': u'123456',
+    u'codigo_transmissao': u'123456',
+    u'instrucao_1': u'80',
+    u'instrucao_2': u'8',
+    u'prazo': u'2',
+}
+
+
+def _as_string(record):
+    # The way the records used to be formatted, copying and replacing
+    # the fields of each one of them
+    fields = []
+    field_map = {}
+    for field in record.fields:
+        field = field.copy()
+        field_map[field.name] = field
+        fields.append(field)
+    for key, new_values in record.replace_fields.items():
+        pos = fields.index(field_map[key])
+        fields.pop(pos)
+        for field in reversed(new_values):
+            field = field.copy()
+            fields.insert(pos, field)
+            field_map[field.name] = field
+    assert sum(field.size for field in fields) == record.size
+
+    parts = []
+    for field in fields:
+        value = None
+        if field.name not in ('cnab', '_'):
+            if field_map[field.name] is field:
+                value = record._values.get(field.name)
+            if value is None:
+                value = record.get_value(field.name)
+            if value is None:
+                value = field.default_value
+        parts.append(field.format(value))
+    return ''.join(parts)
+
+
+@pytest.mark.parametrize('bank_info', _BANKS, ids=lambda b: b.__name__)
+@pytest.mark.parametrize('n_payments', [1000, 10000])
+def test_cnab_generation(example_creator, store, timer, bank_info, n_payments):
+    bank = example_creator.create_bank_account(bank_branch=u'1102',
+                                               bank_account=u'12345',
+                                               bank_number=bank_info.bank_number)
+    for option, value in _BILL_OPTIONS.items():
+        bank.add_bill_option(option, value)
+    method = example_creator.get_payment_method(u'bill')
+    method.destination_account.bank = bank
+
+    client = example_creator.create_client()
+    example_creator.create_address(person=client.person)
+    group = example_creator.create_payment_group(payer=client.person)
+    payments = [example_creator.create_payment(method=method, group=group)
+                for i in range(n_payments)]
+    store.flush()
+
+    with timer('setup'):
+        cnab = bank_info.create_cnab(payments)
+    with timer('per record fields'):
+        expected = ''.join(_as_string(r) + '\r\n' for r in cnab.records)
+    with timer('compiled layout'):
+        fp = io.StringIO()
+        cnab.write(fp)
+    assert fp.getvalue() == expected
+    print('%s %d payments: %.1fx speedup' % (
+        bank_info.__name__, n_payments,
+        timer.get('per record fields') / timer.get('compiled layout')))
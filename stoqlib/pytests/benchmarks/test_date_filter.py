@@ -0,0 +1,40 @@
+import datetime
+
+import pytest
+from storm.expr import And, State
+
+from stoqlib.database.expr import Date, DayInterval
+from stoqlib.domain.payment.payment import Payment
+
+
+def _explain(store, query):
+    connection = store._connection
+    state = State()
+    statement = connection.compile(store.find(Payment, query)._get_select(), state)
+    result = connection.execute('EXPLAIN ' + statement, state.parameters)
+    return '\n'.join(row[0] for row in result)
+
+
+@pytest.mark.parametrize('n_payments', [1000, 10000])
+def test_date_interval_uses_index(example_creator, store, timer, n_payments):
+    start = datetime.datetime(2010, 1, 1)
+    for i in range(n_payments):
+        example_creator.create_payment(date=start + datetime.timedelta(hours=i))
+    store.execute('ANALYZE payment')
+
+    day = start + datetime.timedelta(days=10)
+    old_query = And(Date(Payment.due_date) >= Date(day),
+                    Date(Payment.due_date) <= Date(day))
+    new_query = DayInterval(Payment.due_date, day, day)
+
+    with timer('Date()'):
+        expected = store.find(Payment, old_query).count()
+    with timer('DayInterval()'):
+        count = store.find(Payment, new_query).count()
+    assert count == expected
+
+    plan = _explain(store, new_query)
+    print(plan)
+    # This will fail if the filter is not using payment_due_date_idx anymore
+    assert 'payment_due_date_idx' in plan
+    assert 'payment_due_date_idx' not in _explain(store, old_query)
@@ -0,0 +1,39 @@
+import csv
+
+import pkg_resources
+import pytest
+
+from stoqlib.importers.productimporter import ProductImporter
+
+
+@pytest.fixture
+def products_csv(tmpdir):
+    # The example file is too small to be meaningful, so replicate its rows
+    # changing the barcodes and descriptions
+    with open(pkg_resources.resource_filename('stoq', 'csv/products.csv')) as fp:
+        rows = [row for row in csv.reader(fp) if row and not row[0].startswith('%')]
+
+    filename = str(tmpdir.join('products.csv'))
+    with open(filename, 'w') as fp:
+        writer = csv.writer(fp)
+        for i in range(2000):
+            row = list(rows[i % len(rows)])
+            row[1] = '%013d' % (i, )
+            row[3] = '%s %d' % (row[3], i)
+            writer.writerow(row)
+    return filename
+
+
+def test_product_importer_workers(products_csv, timer):
+    for workers in [1, 2, 4]:
+        importer = ProductImporter()
+        importer.feed_file(products_csv)
+        # Dry mode so the imported products don't end up on the test database
+        importer.set_dry(True)
+        importer.set_workers(workers)
+        with timer(workers):
+            importer.process()
+
+    for workers in [2, 4]:
+        print('%d workers: %.1fx speedup' % (
+            workers, timer.get(1) / timer.get(workers)))
@@ -0,0 +1,45 @@
+import pytest
+
+from stoqlib.domain.inventory import Inventory
+from stoqlib.lib.dateutils import localnow
+
+
+def _create_inventory(store, branch, station, responsible):
+    # The way inventories used to be opened, creating each item object
+    inventory = Inventory(store=store, branch=branch, station=station,
+                          open_date=localnow(), responsible_id=responsible.id)
+    for data in Inventory.get_sellables_for_inventory(store, branch):
+        sellable, product, storable, batch, stock_item = data
+        quantity = stock_item and stock_item.quantity or 0
+        if storable.is_batch:
+            if batch and stock_item:
+                inventory.add_product(product, quantity, batch=batch)
+        else:
+            inventory.add_product(product, quantity)
+    store.flush()
+    return inventory
+
+
+@pytest.mark.parametrize('n_storables', [1000, 10000])
+def test_create_inventory(example_creator, store, timer, n_storables):
+    branch = example_creator.current_branch
+    station = example_creator.current_station
+    user = example_creator.current_user
+    for i in range(n_storables):
+        example_creator.create_storable(branch=branch, stock=i % 10 + 1,
+                                        is_batch=(i % 5 == 0))
+    store.flush()
+    store.execute('ANALYZE product_stock_item')
+
+    with timer('per item'):
+        expected = _create_inventory(store, branch, station, user)
+    store.invalidate()
+    with timer('insert select'):
+        inventory = Inventory.create_inventory(store, branch, station, user)
+
+    def get_items(inventory):
+        return sorted((i.product_id, i.batch_id, i.recorded_quantity)
+                      for i in inventory.get_items())
+    assert get_items(inventory) == get_items(expected)
+    print('%d storables: %.1fx speedup' % (
+        n_storables, timer.get('per item') / timer.get('insert select')))
@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.mark.parametrize('n_items', [10, 100, 500])
+def test_sale_confirm(example_creator, current_user, timer, n_items):
+    sale = example_creator.create_sale()
+    for i in range(n_items):
+        example_creator.add_product(sale, price=10)
+    sale.order(current_user)
+    example_creator.add_payments(sale)
+
+    name = '%d items' % (n_items, )
+    with timer(name):
+        sale.confirm(current_user)
+    print('%s: %.2fms per item' % (name, timer.get(name) * 1000 / n_items))
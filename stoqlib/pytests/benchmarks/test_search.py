@@ -0,0 +1,40 @@
+import pytest
+from storm.expr import Like
+
+from stoqlib.database.expr import StoqNormalizeString
+from stoqlib.domain.sellable import Sellable
+
+_WORDS = [u'parafuso', u'porca', u'arruela', u'prego', u'broca', u'serra',
+          u'martelo', u'alicate', u'chave', u'fenda', u'philips', u'inox',
+          u'aço', u'latão', u'ferro', u'madeira', u'plástico', u'borracha']
+
+
+def _search(store, text, use_index):
+    # The same query QueryExecuter builds for StringQueryState.CONTAINS_ALL
+    query = Like(StoqNormalizeString(Sellable.description),
+                 StoqNormalizeString(u'%%%s%%' % (text, )))
+    if not use_index:
+        store.execute('SET enable_bitmapscan TO off')
+        store.execute('SET enable_indexscan TO off')
+    try:
+        return store.find(Sellable, query).count()
+    finally:
+        store.execute('RESET enable_bitmapscan')
+        store.execute('RESET enable_indexscan')
+
+
+@pytest.mark.parametrize('n_sellables', [1000, 10000])
+def test_search_description(example_creator, store, timer, n_sellables):
+    for i in range(n_sellables):
+        description = u' '.join(_WORDS[(i * j) % len(_WORDS)] for j in range(1, 4))
+        example_creator.create_sellable(description=u'%s %d' % (description, i))
+    store.execute('ANALYZE sellable')
+
+    for text in [u'parafuso', u'latao', u'inox 12']:
+        with timer('%s seqscan' % (text, )):
+            expected = _search(store, text, use_index=False)
+        with timer('%s index' % (text, )):
+            count = _search(store, text, use_index=True)
+        assert count == expected
+        print('%r: %.1fx speedup' % (
+            text, timer.get('%s seqscan' % (text, )) / timer.get('%s index' % (text, ))))
@@ -0,0 +1,57 @@
+import pytest
+from kiwi.currency import currency
+
+from stoqlib.domain.payment.method import PaymentMethod
+from stoqlib.domain.till import TillEntry
+
+
+def _get_day_summary_data(till):
+    # The way the summary used to be calculated, traversing each entry
+    money_method = PaymentMethod.get_by_name(till.store, u'money')
+    day_history = {(money_method, None, None): currency(0)}
+    for entry in till.get_entries():
+        provider = card_type = None
+        payment = entry.payment
+        method = payment.method if payment else money_method
+        if payment and payment.card_data:
+            provider = payment.card_data.provider
+            card_type = payment.card_data.card_type
+
+        key = (method, provider, card_type)
+        day_history.setdefault(key, currency(0))
+        day_history[key] += entry.value
+    return day_history
+
+
+@pytest.mark.parametrize('n_entries', [1000, 10000])
+def test_till_day_summary(example_creator, store, timer, n_entries):
+    till = example_creator.create_till()
+    till.open_till(example_creator.current_user)
+    station = example_creator.current_station
+    providers = [u'VISA', u'MASTER', u'AMEX']
+    for i in range(n_entries):
+        if i % 4 == 0:
+            till.add_credit_entry(currency(10), u'credit')
+        elif i % 4 == 1:
+            till.add_debit_entry(currency(5), u'debit')
+        else:
+            payment = example_creator.create_card_payment(
+                provider_id=providers[i % len(providers)], payment_value=i)
+            TillEntry(description=u'payment', value=payment.value, till=till,
+                      station=station, branch=till.branch, payment=payment,
+                      store=store)
+    store.flush()
+    store.execute('ANALYZE till_entry')
+
+    store.invalidate()
+    with timer('per entry'):
+        expected = _get_day_summary_data(till)
+        expected_totals = (till.get_cash_amount(), till.get_balance())
+    store.invalidate()
+    with timer('grouped'):
+        summary = till.get_day_summary_data()
+        balance = till.get_balance_summary()
+    assert summary == expected
+    assert (balance.cash_amount, balance.balance) == expected_totals
+    print('%d entries: %.1fx speedup' % (
+        n_entries, timer.get('per entry') / timer.get('grouped')))
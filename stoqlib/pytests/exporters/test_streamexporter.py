@@ -0,0 +1,137 @@
+import csv
+import datetime
+import os
+import zipfile
+from decimal import Decimal
+from unittest import mock
+from xml.dom import minidom
+
+import pytest
+
+from stoqlib.exporters.csvexporter import CSVExporter
+from stoqlib.exporters.streamexporter import get_stream_exporter
+from stoqlib.exporters.xlsxexporter import XLSXExporter
+from stoqlib.lib.objutils import Settable
+
+
+def _read_csv(filename):
+    with open(filename, encoding='utf-8-sig', newline='') as fp:
+        return list(csv.reader(fp))
+
+
+def _read_sheet(filename):
+    with zipfile.ZipFile(filename) as package:
+        # All the parts should be valid xml
+        for name in package.namelist():
+            minidom.parseString(package.read(name))
+        sheet = minidom.parseString(package.read('xl/worksheets/sheet1.xml'))
+
+    rows = []
+    for row in sheet.getElementsByTagName('row'):
+        cells = []
+        for cell in row.getElementsByTagName('c'):
+            text = cell.getElementsByTagName('t') or cell.getElementsByTagName('v')
+            cells.append((cell.getAttribute('r'), text[0].firstChild.data))
+        rows.append(cells)
+    return rows
+
+
+@pytest.mark.parametrize('filename,exporter_class', (
+    ('foo.csv', CSVExporter),
+    ('foo.XLSX', XLSXExporter),
+))
+def test_get_stream_exporter(filename, exporter_class):
+    exporter = get_stream_exporter(filename)
+    assert isinstance(exporter, exporter_class)
+    exporter.close()
+
+
+def test_get_stream_exporter_invalid():
+    with pytest.raises(ValueError):
+        get_stream_exporter('foo.xls')
+
+
+def test_csv_exporter(tmpdir):
+    filename = str(tmpdir.join('foo.csv'))
+    exporter = CSVExporter()
+    exporter.set_column_headers(('name', 'age', 'birth'))
+    exporter.set_column_types((str, int, datetime.date))
+    exporter.add_cells([('Tomás', 69, datetime.date(1950, 1, 7)),
+                        (b'foo', None, None)],
+                       filter_description='Filters')
+    exporter.save_as(filename)
+
+    assert exporter.n_rows == 2
+    assert _read_csv(filename) == [
+        ['Filters'],
+        ['name', 'age', 'birth'],
+        ['Tomás', '69', '1950-01-07'],
+        ['foo', '', ''],
+    ]
+
+
+def test_xlsx_exporter(tmpdir):
+    filename = str(tmpdir.join('foo.xlsx'))
+    exporter = XLSXExporter('Sales')
+    exporter.set_column_headers(('name', 'total', 'date'))
+    exporter.set_column_types((str, Decimal, datetime.date))
+    exporter.add_cells([('<Tomás> & co', Decimal('6.9'), datetime.date(2020, 1, 7)),
+                        ('foo\x01', None, datetime.datetime(2020, 1, 7, 12))])
+    exporter.save_as(filename)
+
+    assert _read_sheet(filename) == [
+        [('A1', 'name'), ('B1', 'total'), ('C1', 'date')],
+        [('A2', '<Tomás> & co'), ('B2', '6.9'), ('C2', '43837.0')],
+        [('A3', 'foo'), ('C3', '43837.5')],
+    ]
+
+
+def test_xlsx_exporter_many_columns(tmpdir):
+    filename = str(tmpdir.join('foo.xlsx'))
+    exporter = XLSXExporter()
+    exporter.add_cells([list(range(30))])
+    exporter.save_as(filename)
+
+    cells = _read_sheet(filename)[0]
+    assert [ref for ref, value in cells[24:28]] == ['Y1', 'Z1', 'AA1', 'AB1']
+
+
+def test_stream_exporter_add_row_invalid():
+    exporter = XLSXExporter()
+    exporter.set_column_types((str, int))
+    with pytest.raises(ValueError):
+        exporter.add_cells([('Tomás', 69, 'foobar')])
+    exporter.close()
+
+
+def test_stream_exporter_add_from_resultset(tmpdir):
+    filename = str(tmpdir.join('foo.csv'))
+    resultset = mock.Mock()
+    resultset.stream.return_value = iter([Settable(name='foo', age=1),
+                                          Settable(name='bar', age=2)])
+
+    exporter = CSVExporter()
+    exporter.fetch_size = 10
+    exporter.add_from_resultset(resultset, ['age'], headers=['Age'])
+    exporter.save_as(filename)
+
+    resultset.stream.assert_called_once_with(10)
+    assert _read_csv(filename) == [['Age'], ['1'], ['2']]
+
+
+@pytest.mark.parametrize("prefix,filename", (
+    ("", "Stoq-"),
+    ("eita", "Stoq-eita-"),
+))
+def test_stream_exporter_save(prefix, filename):
+    exporter = CSVExporter()
+    exporter.add_cells([('Tomás', 69)] * 3)
+
+    f = exporter.save(prefix=prefix)
+    try:
+        assert filename in os.path.basename(f.name)
+        assert f.name.endswith('.csv')
+        assert not os.path.exists(exporter._filename)
+    finally:
+        f.close()
+        os.remove(f.name)
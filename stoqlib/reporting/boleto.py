@@ -23,7 +23,13 @@
 # This is mostly lifted from
 # http://code.google.com/p/pyboleto licensed under MIT
 
+import logging
+import math
+import multiprocessing
+import os
+import shutil
 import sys
+import tempfile
 import traceback
 
 from reportlab.graphics.barcode.common import I2of5
@@ -31,13 +37,76 @@ from reportlab.lib import colors, pagesizes, utils
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
 
+from stoqlib.database.runtime import new_store
+from stoqlib.database.settings import db_settings
 from stoqlib.exceptions import ReportError
 from stoqlib.lib.crashreport import collect_traceback
 from stoqlib.lib.boleto import BoletoException, get_bank_info_by_number
+from stoqlib.lib.configparser import StoqConfig, get_config, register_config
 from stoqlib.lib.message import warning
 from stoqlib.lib.translation import stoqlib_gettext
 
 _ = stoqlib_gettext
+log = logging.getLogger(__name__)
+
+
+def _get_bank_info(payment):
+    account = payment.method.destination_account
+    bank_info_class = get_bank_info_by_number(account.bank.bank_number)
+    return bank_info_class(payment)
+
+
+def _get_worker_args():
+    # The state _init_worker needs to setup a worker process
+    config = get_config()
+    settings = dict(rdbms=db_settings.rdbms,
+                    address=db_settings.address,
+                    port=db_settings.port,
+                    dbname=db_settings.dbname,
+                    username=db_settings.username,
+                    password=db_settings.password)
+    return (config and config.filename, settings)
+
+
+def _init_worker(config_filename, settings):
+    # The worker processes are spawned, so they start without any of the
+    # parent's state, see BillReport.save_chunks
+    from stoqlib.database.tables import get_table_types
+
+    config = StoqConfig()
+    if config_filename:
+        config.load(config_filename)
+    register_config(config)
+    # The settings may have been overridden by command line options, so
+    # they are not read from the config
+    for name, value in settings.items():
+        setattr(db_settings, name, value)
+    # Storm resolves the references between the tables by their names,
+    # so all of them must be imported before the payments are used
+    get_table_types()
+
+
+def _render_batch(batch):
+    # Runs on the worker processes, see BillReport.save_chunks
+    from stoqlib.domain.payment.payment import Payment
+
+    payment_ids, format, filename = batch
+    store = new_store()
+    try:
+        payments = dict((p.id, p) for p in
+                        store.find(Payment, Payment.id.is_in(payment_ids)))
+        if len(payments) != len(payment_ids):
+            # The payments are only visible here after they are committed
+            raise ReportError("Some of the payments were not found")
+
+        bill = BoletoPDF(filename, format)
+        for payment_id in payment_ids:
+            bill.add_data(_get_bank_info(payments[payment_id]))
+        bill.render()
+        bill.save()
+    finally:
+        store.rollback(close=True)
+    return len(payment_ids)
 
 
 class BoletoPDF(object):
@@ -804,6 +873,14 @@ class BoletoPDF(object):
 class BillReport(object):
     title = _('Bill')
 
+    #: How many bills each process renders at a time when saving in chunks.
+    #: This must be even, so the carnet pages are not split
+    chunk_size = 500
+
+    #: How many processes are used when saving in chunks, ``None`` to
+    #: use one for each cpu
+    workers = None
+
     def __init__(self, filename, payments):
         self._payments = payments
         self._filename = filename
@@ -858,19 +935,87 @@ class BillReport(object):
             self.print_as_landscape = True
         return BoletoPDF(self._filename, format)
 
+    def _get_bill_payments(self):
+        return [p for p in self._payments if p.method.method_name == 'bill']
+
+    def _merge_pdf(self, context, filename):
+        import gi
+        gi.require_version('Poppler', '0.18')
+        from gi.repository import Gio, Poppler
+
+        uri = Gio.File.new_for_path(filename).get_uri()
+        document = Poppler.Document.new_from_file(uri, password="")
+        surface = context.get_target()
+        for i in range(document.get_n_pages()):
+            page = document.get_page(i)
+            surface.set_size(*page.get_size())
+            page.render_for_printing(context)
+            context.show_page()
+
     def add_payments(self):
         if self._bill.boletos:
             return
 
-        for p in self._payments:
-            if p.method.method_name != 'bill':
-                continue
-            account = p.method.destination_account
-            _render_class = get_bank_info_by_number(account.bank.bank_number)
-            data = _render_class(p)
-            self._bill.add_data(data)
+        for p in self._get_bill_payments():
+            self._bill.add_data(_get_bank_info(p))
+
+    def save_chunks(self):
+        """Save the bills rendering them in parallel
+
+        The bills are split in chunks of :attr:`.chunk_size`, which are
+        rendered by a pool of :attr:`.workers` processes and then merged
+        into the report, in order. The payments must be committed, since
+        the worker processes fetch them from the database.
+
+        The workers are spawned instead of forked, since forking a process
+        that has other threads running (like the GUI) is not safe.
+
+        :returns: a generator of ``(bills_saved, total_bills)``, to follow
+          the progress. The report is only saved after it is exhausted.
+        """
+        import cairo
+
+        payment_ids = [p.id for p in self._get_bill_payments()]
+        total = len(payment_ids)
+        n_chunks = int(math.ceil(total / self.chunk_size))
+        workers = min(self.workers or os.cpu_count() or 1, n_chunks) or 1
+
+        tmpdir = tempfile.mkdtemp(prefix='stoqlib-boleto-')
+        batches = [(payment_ids[i:i + self.chunk_size], self._bill.format,
+                    os.path.join(tmpdir, '%d.pdf' % (i, )))
+                   for i in range(0, total, self.chunk_size)]
+        surface = cairo.PDFSurface(self._filename, 1, 1)
+        context = cairo.Context(surface)
+        saved = 0
+        try:
+            log.info("Saving %d bills in %d processes", total, workers)
+            mp_context = multiprocessing.get_context('spawn')
+            with mp_context.Pool(workers, initializer=_init_worker,
+                                 initargs=_get_worker_args()) as pool:
+                # imap returns the batches in order, so they can be
+                # merged while the next ones are rendered
+                for batch, n_bills in zip(batches, pool.imap(_render_batch, batches)):
+                    self._merge_pdf(context, batch[2])
+                    os.unlink(batch[2])
+                    saved += n_bills
+                    yield saved, total
+        finally:
+            surface.finish()
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def use_chunks(self):
+        """If the bills should be saved in chunks
+
+        :returns: ``True`` if there are more than :attr:`.chunk_size` bills
+        """
+        return len(self._get_bill_payments()) > self.chunk_size
 
     def save(self):
+        if self.use_chunks():
+            for saved, total in self.save_chunks():
+                pass
+            return
+
         self.add_payments()
         self._bill.render()
         self._bill.save()
@@ -20,6 +20,7 @@
 ## Author(s): Stoq Team <stoq-devel@async.com.br>
 ##
 
+import logging
 import os
 import platform
 
@@ -34,6 +35,10 @@ from stoqlib.lib.formatters import (get_formatted_price, get_formatted_cost,
                                     get_formatted_percentage)
 from stoqlib.reporting.utils import get_logo_data
 _ = stoqlib_gettext
+log = logging.getLogger(__name__)
+
+# weasyprint renders the pages using 96 dpi, while the pdf uses 72 dpi
+_PDF_SCALE = 0.75
 
 
 class HTMLReport(object):
@@ -78,7 +83,7 @@ class HTMLReport(object):
         html.write(self.get_html())
         html.flush()
 
-    def render(self, stylesheet=None):
+    def _render_html(self, html, stylesheet=None):
         import weasyprint
 
         template_dir = pkg_resources.resource_filename('stoq', 'template')
@@ -86,11 +91,13 @@ class HTMLReport(object):
             # FIXME: Figure out why this is breaking
             # On windows, weasyprint is eating the last directory of the path
             template_dir = os.path.join(template_dir, 'foobar')
-        html = weasyprint.HTML(string=self.get_html(),
-                               base_url=template_dir)
+        html = weasyprint.HTML(string=html, base_url=template_dir)
 
         return html.render(stylesheets=[weasyprint.CSS(string=stylesheet)])
 
+    def render(self, stylesheet=None):
+        return self._render_html(self.get_html(), stylesheet=stylesheet)
+
     def save(self):
         document = self.render(stylesheet='')
         document.write_pdf(self.filename)
@@ -139,6 +146,10 @@ class TableReport(HTMLReport):
     #:
     template_filename = "objectlist.html"
 
+    #: Reports with more rows than this are rendered in chunks of this
+    #: many rows when saved, see :meth:`.save_chunks`
+    chunk_size = 1000
+
     def __init__(self, filename, data, title=None, blocked_records=0,
                  status_name=None, filter_strings=None, status=None):
         self.title = title or self.title
@@ -151,6 +162,14 @@ class TableReport(HTMLReport):
         self.data = data
         self.columns = self.get_columns()
 
+        #: If the report is being rendered in chunks
+        self.chunked = False
+        #: If the chunk being rendered is the first/last one. Only the first
+        #: chunk has the header and only the last one has the summary
+        self.first_chunk = True
+        self.last_chunk = True
+        self._chunk = None
+
         self._setup_details()
         HTMLReport.__init__(self, filename)
 
@@ -158,7 +177,7 @@ class TableReport(HTMLReport):
         """ This method build the report title based on the arguments sent
         by SearchBar to its class constructor.
         """
-        rows = len(self.data)
+        rows = self.n_rows = self.get_n_rows()
         total_rows = rows + self.blocked_records
         item = stoqlib_ngettext(self.main_object_name[0],
                                 self.main_object_name[1], total_rows)
@@ -177,12 +196,141 @@ class TableReport(HTMLReport):
                 notes.append(filter_string)
         self.notes = notes
 
+    def _iter_objects(self):
+        if hasattr(self.data, 'stream'):
+            # Fetch the objects in batches instead of all at once
+            return self.data.stream()
+        return iter(self.data)
+
+    def _iter_chunks(self):
+        # One chunk is kept ahead, so we know which one is the last
+        previous = None
+        chunk = []
+        for obj in self._iter_objects():
+            chunk.append(obj)
+            if len(chunk) < self.chunk_size:
+                continue
+            if previous is not None:
+                yield previous, False
+            previous, chunk = chunk, []
+
+        if previous is not None and chunk:
+            yield previous, False
+            yield chunk, True
+        elif previous is not None:
+            yield previous, True
+        else:
+            yield chunk, True
+
+    def _paint_page_number(self, context, page_number, width, height):
+        # The page counters on the templates restart on each chunk, so the
+        # page numbers are painted here instead
+        text = '%s %d' % (_("Page"), page_number)
+        context.save()
+        context.select_font_face('sans-serif')
+        context.set_font_size(8)
+        extents = context.text_extents(text)
+        context.move_to(width - extents[4] - 36, height - 18)
+        context.show_text(text)
+        context.restore()
+
+    def get_n_rows(self):
+        """Get the number of rows in the report
+
+        :returns: the number of rows, without fetching them if
+          the data is a result set
+        """
+        try:
+            return len(self.data)
+        except TypeError:
+            return self.data.count()
+
     def get_data(self):
-        self.reset()
-        for obj in self.data:
+        if self._chunk is not None:
+            objs = self._chunk
+        else:
+            self.reset()
+            objs = self._iter_objects()
+
+        for obj in objs:
             self.accumulate(obj)
             yield self.get_row(obj)
 
+    def render_chunks(self, stylesheet=None):
+        """Render the report in chunks of :attr:`.chunk_size` rows
+
+        Only one chunk of the data is kept in memory at a time.
+
+        :param stylesheet: an extra stylesheet for the chunks
+        :returns: a generator of ``(document, n_rows)``, with the rendered
+          weasyprint document of each chunk and the number of rows in it
+        """
+        self.chunked = True
+        self.reset()
+        try:
+            for i, (chunk, is_last) in enumerate(self._iter_chunks()):
+                self._chunk = chunk
+                self.first_chunk = i == 0
+                self.last_chunk = is_last
+                yield self._render_html(self.get_html(), stylesheet), len(chunk)
+        finally:
+            self.chunked = False
+            self.first_chunk = self.last_chunk = True
+            self._chunk = None
+
+    def save_chunks(self):
+        """Save the report rendering it in chunks
+
+        This will render :attr:`.chunk_size` rows at a time and write their
+        pages to the pdf, so the memory used does not depend on the number
+        of rows in the report.
+
+        :returns: a generator of ``(rows_saved, total_rows)``, to follow the
+          progress. The report is only saved after it is exhausted.
+        """
+        import cairocffi
+
+        surface = context = None
+        page_number = rows = 0
+        try:
+            for document, n_rows in self.render_chunks(stylesheet=''):
+                for page in document.pages:
+                    width = page.width * _PDF_SCALE
+                    height = page.height * _PDF_SCALE
+                    if surface is None:
+                        surface = cairocffi.PDFSurface(self.filename, width, height)
+                        context = cairocffi.Context(surface)
+                    else:
+                        surface.set_size(width, height)
+                    page.paint(context, scale=_PDF_SCALE)
+                    page_number += 1
+                    self._paint_page_number(context, page_number, width, height)
+                    surface.show_page()
+
+                rows += n_rows
+                log.info("Saved %d of %d rows of the report %s",
+                         rows, self.n_rows, self.title)
+                yield rows, self.n_rows
+        finally:
+            if surface is not None:
+                surface.finish()
+
+    def use_chunks(self):
+        """If the report should be saved in chunks
+
+        :returns: ``True`` if the report has more than :attr:`.chunk_size`
+          rows
+        """
+        return self.n_rows > self.chunk_size
+
+    def save(self):
+        if not self.use_chunks():
+            super(TableReport, self).save()
+            return
+
+        for rows, total_rows in self.save_chunks():
+            pass
+
     def accumulate(self, row):
         """This method is called once for each row in the report.
 
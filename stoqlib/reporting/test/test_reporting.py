@@ -24,6 +24,7 @@
 """ This module test reporties """
 
 import datetime
+import tempfile
 from decimal import Decimal
 
 from unittest import mock
@@ -49,6 +50,27 @@ from stoqlib.reporting.sale import SaleOrderReport, SalesPersonReport
 from stoqlib.reporting.salereturn import SaleReturnReport, PendingReturnReceipt
 from stoqlib.reporting.test.reporttest import ReportTest
 from stoqlib.reporting.product import ProductPriceReport
+from stoqlib.reporting.report import TableReport
+
+
+class _NumbersReport(TableReport):
+    title = 'Numbers'
+    chunk_size = 2
+
+    def get_columns(self):
+        return [dict(title='Number', align='right')]
+
+    def get_row(self, obj):
+        return [str(obj)]
+
+    def reset(self):
+        self.total = 0
+
+    def accumulate(self, row):
+        self.total += row
+
+    def get_summary_row(self):
+        return ['Total: %d' % (self.total, )]
 
 
 class TestReport(ReportTest):
@@ -299,3 +321,36 @@ class TestReport(ReportTest):
         client = self.create_client()
         client.credit_limit = 100
         self._diff_expected(ClientCreditReport, 'client-credit-report', client)
+
+    def test_table_report_render_chunks(self):
+        report = _NumbersReport('report.pdf', list(range(1, 6)))
+        self.assertTrue(report.use_chunks())
+
+        chunks = []
+        with mock.patch.object(report, '_render_html') as render_html:
+            render_html.side_effect = lambda html, stylesheet: html
+            for html, n_rows in report.render_chunks():
+                chunks.append((html, n_rows))
+
+        self.assertEqual([n_rows for html, n_rows in chunks], [2, 2, 1])
+        self.assertEqual([html.count('<tr>') for html, n_rows in chunks],
+                         [4, 4, 3])
+        # The header is only on the first chunk and the summary,
+        # which accumulates all the rows, only on the last one
+        self.assertEqual(['<header>' in html for html, n_rows in chunks],
+                         [True, False, False])
+        self.assertEqual(['Total: 15' in html for html, n_rows in chunks],
+                         [False, False, True])
+        self.assertFalse(report.chunked)
+
+    def test_table_report_save_chunks(self):
+        try:
+            import weasyprint
+            weasyprint  # pyflakes
+        except ImportError:
+            raise SkipTest("weasyprint is required to save the report")
+
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as f:
+            report = _NumbersReport(f.name, list(range(1, 6)))
+            self.assertEqual(list(report.save_chunks()), [(2, 5), (4, 5), (5, 5)])
+            self.assertTrue(f.read().startswith(b'%PDF'))